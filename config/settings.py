@@ -15,19 +15,101 @@ xray = {
     "client_secret": "YOUR_XRAY_CLIENT_SECRET",
     "use_bulk_import": True,  # Use bulk import for multiple test cases
     "defaultTestType": "Manual",  # Default test type (Manual, Automated, etc.)
-    "debug_mode": False  # Enable for more detailed logging
+    "debug_mode": False,  # Enable for more detailed logging
+    "tokenRefreshMargin": 300,  # Renew the cached API token this many seconds before it expires
+    "tokenLifetime": 3600,  # Assumed token validity in seconds when its expiry cannot be decoded
+    "streamImportChunkSize": 10,  # In streaming mode, bulk import test cases by chunks of this size
+    "bulkImportChunkSize": 50,  # Test cases per bulk import job (a job may hold the test cases of several stories)
+    "bulkImportWorkers": 4,  # Bulk import jobs running concurrently
+    "bulkImportLinger": 0.5,  # Seconds an incomplete chunk waits for test cases of other stories before it is sent
+    "upsert": False,  # Update the tests already linked to the story instead of creating new ones (run.py --upsert)
+    "upsertThreshold": 0.5,  # Estimated Jaccard similarity from which a generated test case updates an existing test
+    "upsertShingleSize": 1  # Words per shingle when matching generated test cases with existing tests
+}
+
+# Local mirror of the tests of the Xray test project (run.py --sync-xray)
+xray_mirror = {
+    "dbFile": "cache/xray_mirror.db",  # SQLite database, relative to generator["outputBaseDir"]
+    "pageSize": 100,  # Tests requested per Xray GraphQL page (at most 100)
+    "syncOverlapMinutes": 60,  # An incremental synchronization also fetches the tests updated this long before the last synchronization started
+    "storyLinkType": "Test",  # Jira link type between a test and the user story it covers
+    "maxAgeSeconds": 300  # In upsert mode, synchronize the mirror first if it is older than this
+}
+
+# HTTP client configuration (shared by the Jira, Xray and Claude clients)
+http = {
+    "connectTimeout": 10,  # Seconds to establish a connection
+    "readTimeout": 300,  # Seconds to wait for a response (Claude generations can be slow)
+    "poolMaxSize": 10,  # Keep-alive connections kept per host
+    "maxRetries": 3,  # Retries on 429, 5xx and connection errors
+    "backoffFactor": 0.5,  # Base delay in seconds of the exponential backoff
+    "backoffMax": 30  # Maximum delay in seconds between two retries
+}
+
+# Asyncio pipeline configuration (run.py --async)
+async_pipeline = {
+    "maxStoriesInFlight": 100,  # User stories processed concurrently on the event loop
+    "hostConcurrency": {  # Maximum concurrent requests per host
+        "api.anthropic.com": 8,
+        "xray.cloud.getxray.app": 10,
+        "default": 10
+    }
 }
 
 # Generator configuration
 generator = {
     "outputBaseDir": "output",  # Base directory for generated test cases
-    "knowledgeBaseDir": "knowledge_base"  # Directory containing knowledge base files
+    "knowledgeBaseDir": "knowledge_base",  # Directory containing knowledge base files
+    "batchWorkers": 4,  # Number of user stories processed concurrently in batch mode
+    "incremental": False,  # Only regenerate the acceptance scenarios added or modified since the last run (run.py --incremental)
+    "stateDir": "state",  # Scenario manifests of the stories, relative to outputBaseDir
+    "shardScenarios": False,  # One concurrent Claude request per acceptance scenario (run.py --shard)
+    "shardWorkers": 4  # Maximum concurrent Claude requests per story in sharded mode
+}
+
+# Cache configuration
+cache = {
+    "enabled": True,  # Reuse Claude generations for identical requests (disabled by run.py --no-cache)
+    "claudeCacheDir": "cache/claude",  # Cache directory, relative to generator["outputBaseDir"]
+    "maxSizeMB": 200,  # Least recently used generations are evicted beyond this size
+    "evictionTargetPercent": 90,  # Eviction brings the cache down to this percentage of maxSizeMB, so it does not run at every store
+    "compress": False  # Store generations gzip-compressed
+}
+
+# Jira issue cache configuration
+issue_cache = {
+    "enabled": True,  # Only download a story again when its fields.updated changed
+    "cacheDir": "cache/jira",  # Cache directory, relative to generator["outputBaseDir"]
+    "freshSeconds": 60,  # Reuse a cached story without asking Jira if it was checked this recently
+    "maxMemoryEntries": 1000  # Stories kept in memory; the least recently used ones are read from disk again
+}
+
+# Near-duplicate detection of generated test cases
+dedup = {
+    "enabled": True,  # Drop test cases almost identical to another test case of the same story before import
+    "threshold": 0.8,  # Estimated Jaccard similarity of summary and steps from which two test cases are duplicates
+    "numPermutations": 128,  # Length of the MinHash signatures
+    "shingleSize": 3  # Words per shingle
 }
 
 # Claude API configuration
 claude = {
     "apiKey": "sk-ant-api03-YOUR-API-KEY",
+    "apiBaseUrl": "https://api.anthropic.com",  # Point to a local stand-in server for testing
     "apiModel": "claude-3-opus-20240229",  # Use the appropriate Claude model
+    "maxTokens": 8000,  # Maximum tokens generated per response
+    "inputTokenBudget": 30000,  # Estimated input tokens allowed per prompt (instructions, story and knowledge base context)
+    "minKnowledgeBaseTokens": 200,  # The knowledge base context is dropped if less tokens than this remain in the budget
+    "truncateStory": True,  # Shorten the description of stories too large for inputTokenBudget on their own
+    "contextWindow": 200000,  # Context window of the model: max_tokens is reduced if the prompt leaves less room
+    "temperature": 0.2,
+    "stream": False,  # Stream the response and process each test case as soon as it is complete
+    "maxContinuations": 3,  # Continuation requests sent when a response is cut off by max_tokens
+    "promptCaching": False,  # Send the static instructions of promptTemplate as a cached prompt block
+    "promptCacheMinTokens": 1024,  # Shortest prefix the model caches: shorter instructions are sent without cache marker
+    "batchPollInterval": 60,  # Seconds between two status checks of a Message Batch (run.py --backlog)
+    "maxRequestsPerBatch": 10000,  # Stories per Message Batches submission
+    "scenarioInstruction": "Only write test cases for the acceptance scenario below; the other scenarios of this story are covered separately.",  # Added before the scenario of each shard (--shard, --incremental)
     "promptTemplate": """You are a quality assurance expert specialized in analyzing user stories and generating comprehensive test cases. Focus on both functional tests (verifying behavior) and edge cases (validating handling of unexpected inputs or situations).
 
 User Story Title: {USER_STORY_SUMMARY}
@@ -77,5 +159,17 @@ Return ONLY the valid JSON array of test cases, with no additional explanation.
 # Knowledge Base configuration
 knowledge_base = {
     "use_knowledge_base": True,  # Enable or disable knowledge base enhancement
-    "similarity_threshold": 0.65  # Threshold for considering content relevant (0.0 to 1.0)
+    "similarity_threshold": 0.2,  # Minimum normalized BM25 score for considering a file relevant (0.0 to 1.0)
+    "bm25K1": 1.2,  # BM25 term frequency saturation
+    "bm25B": 0.75,  # BM25 file length normalization (0.0 to 1.0)
+    "keywordBoost": 2.0,  # Extra weight of the terms of a file's own keywords field
+    "maxSampleTests": 8,  # Most relevant sample tests of the whole knowledge base added to the prompt
+    "sampleTestThreshold": 0.1,  # Minimum normalized BM25 score of a sample test (0.0 to 1.0)
+    "contextTokenBudget": 1500,  # Approximate size limit of the knowledge base context, in tokens
+    "indexFile": ".kb_index",  # Term index of the knowledge base, stored in knowledgeBaseDir
+    "indexRefreshInterval": 2,  # Seconds between two checks of the knowledge base files for changes
+    "packFile": ".kb_pack",  # Compiled knowledge base written by scripts/sync_knowledge_base.py, stored in knowledgeBaseDir
+    "usePack": True,  # Rank from the compiled pack when it is up to date with the knowledge base files
+    "validationStateFile": ".kb_validation",  # Validation results of the sync script, stored in knowledgeBaseDir
+    "validationWorkers": None  # Processes validating the changed files in the sync script (None = CPU count)
 }
\ No newline at end of file
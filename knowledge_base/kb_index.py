@@ -0,0 +1,219 @@
+# Persistent inverted index of the knowledge base
+import os
+import re
+import json
+import hashlib
+import logging
+import sys
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+STOPWORDS = {'a', 'an', 'the', 'and', 'or', 'but', 'if', 'then', 'else', 'when',
+             'at', 'from', 'by', 'for', 'with', 'about', 'against', 'between',
+             'into', 'through', 'during', 'before', 'after', 'above', 'below',
+             'to', 'of', 'in', 'on', 'is', 'are', 'was', 'were', 'be', 'been',
+             'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did',
+             'doing', 'can', 'could', 'should', 'would', 'ought', 'i', 'you',
+             'he', 'she', 'it', 'we', 'they', 'their', 'this', 'that', 'these',
+             'those', 'am', 'is', 'are', 'was', 'will', 'as', 'so', 'such'}
+
+def tokenize(text):
+    """
+    Split a text into index terms (lowercase words of more than 2 characters, without stopwords)
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Terms, in order of appearance
+    """
+    words = re.sub(r'[^\w\s]', ' ', text.lower()).split()
+    return [word for word in words if word not in STOPWORDS and len(word) > 2]
+
+def collect_text(value):
+    """Concatenate every string found in a JSON value"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return ' '.join(collect_text(v) for v in value.values())
+    if isinstance(value, list):
+        return ' '.join(collect_text(v) for v in value)
+    return ''
+
+def count_terms(text):
+    """Count the occurrences of each term of a text"""
+    counts = {}
+    for term in tokenize(text):
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+def get_index_path(knowledge_base_dir):
+    """Path of the index file stored next to the knowledge base files"""
+    return os.path.join(knowledge_base_dir, settings.knowledge_base.get("indexFile", ".kb_index"))
+
+def scan_files(knowledge_base_dir):
+    """
+    List the knowledge base files with their modification time and size
+
+    Args:
+        knowledge_base_dir (str): Knowledge base directory
+
+    Returns:
+        dict: (mtime_ns, size) of each JSON file, by name
+    """
+    files = {}
+    with os.scandir(knowledge_base_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def build_test_entry(test, position):
+    """
+    Index one sample test of a knowledge base file
+
+    Args:
+        test (dict): Sample test, as stored in the knowledge base file
+        position (int): Position of the test in the file
+
+    Returns:
+        dict: Summary, (action, result) steps and term counts of the test
+    """
+    steps = [step for step in test.get("steps", []) if isinstance(step, dict)]
+    return {
+        "summary": test.get("summary", f"Test case {position+1}"),
+        "steps": [[str(step.get("action", "")), str(step.get("result", ""))] for step in steps],
+        "terms": count_terms(collect_text(test))
+    }
+
+def build_file_entry(file_path, mtime_ns, size, previous=None):
+    """
+    Index one knowledge base file
+
+    Args:
+        file_path (str): Path of the JSON file
+        mtime_ns (int): Modification time of the file
+        size (int): Size of the file
+        previous (dict, optional): Previous index entry of the file, reused
+            without parsing the file if its content hash did not change
+
+    Returns:
+        dict: Index entry of the file: content hash, domain, guidelines, sample
+            tests, term counts of the whole file and of its keywords field
+            (None if the file cannot be read)
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        file_hash = hashlib.sha256(data).hexdigest()
+        # Fichier touché sans changement de contenu: seule la date change
+        if previous and previous.get("hash") == file_hash:
+            return dict(previous, mtime=mtime_ns, size=size)
+        content = json.loads(data.decode('utf-8'))
+    except Exception as e:
+        logger.error(f"Error reading knowledge base file {file_path}: {str(e)}")
+        return None
+
+    if not isinstance(content, dict):
+        content = {}
+    # Garder ce qu'il faut pour construire le contexte sans relire le fichier
+    return {
+        "mtime": mtime_ns,
+        "size": size,
+        "hash": file_hash,
+        "domain": content.get("domain", "General"),
+        "guidelines": content.get("guidelines", ""),
+        "tests": [build_test_entry(test, i) for i, test in enumerate(content.get("sample_tests", []))
+                  if isinstance(test, dict)],
+        "terms": count_terms(collect_text(content)),
+        "keywords": count_terms(' '.join(k for k in content.get("keywords", []) if isinstance(k, str)))
+    }
+
+def load_kb_index(knowledge_base_dir):
+    """
+    Load the index stored next to the knowledge base
+
+    Args:
+        knowledge_base_dir (str): Knowledge base directory
+
+    Returns:
+        dict: The index (empty if missing, unreadable or of another version)
+    """
+    try:
+        with open(get_index_path(knowledge_base_dir), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index
+        logger.info("Knowledge base index format changed, rebuilding it")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable knowledge base index: {e}")
+    return {"version": INDEX_VERSION, "revision": 0, "files": {}}
+
+def save_kb_index(knowledge_base_dir, index):
+    """Save the index next to the knowledge base"""
+    path = get_index_path(knowledge_base_dir)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_path, path)
+
+def refresh_kb_index(knowledge_base_dir, index):
+    """
+    Build the index of the knowledge base files added, modified or removed
+
+    The current index is not modified: entries of unchanged files are shared
+    with the new index, so readers of the current index are never disturbed.
+    A file that can no longer be read (being written, or invalid) keeps its
+    previous entry and is read again on the next refresh.
+
+    Args:
+        knowledge_base_dir (str): Knowledge base directory
+        index (dict): Current index
+
+    Returns:
+        tuple: (new index, True if the content of the knowledge base changed).
+            The current index is returned as is if no file was touched.
+    """
+    current = scan_files(knowledge_base_dir)
+    previous = index["files"]
+    files = {}
+    touched = len(previous) != len(current) or any(name not in current for name in previous)
+    changed = touched
+
+    for name, (mtime_ns, size) in current.items():
+        entry = previous.get(name)
+        if entry and entry["mtime"] == mtime_ns and entry["size"] == size:
+            files[name] = entry
+            continue
+        new_entry = build_file_entry(os.path.join(knowledge_base_dir, name), mtime_ns, size, entry)
+        if new_entry is None and entry is not None:
+            # Fichier en cours d'écriture (ou devenu invalide): garder son entrée, il sera relu au prochain contrôle
+            files[name] = entry
+            continue
+        touched = True
+        if new_entry is not None:
+            files[name] = new_entry
+        if new_entry is None or entry is None or new_entry["hash"] != entry.get("hash"):
+            changed = True
+
+    if not touched:
+        return index, False
+
+    new_index = dict(index, files=files)
+    if changed:
+        new_index["revision"] = index.get("revision", 0) + 1
+        logger.info(f"Knowledge base index updated: {len(files)} files")
+    return new_index, changed
@@ -0,0 +1,343 @@
+# Compiled, memory-mappable pack of the knowledge base
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+import threading
+import sys
+from datetime import datetime
+
+import numpy as np
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from knowledge_base.kb_index import scan_files
+
+logger = logging.getLogger(__name__)
+
+PACK_MAGIC = b"TCGKBPAK"
+PACK_VERSION = 1
+# Magic, version, taille de l'en-tête JSON
+PACK_PREAMBLE = struct.Struct("<8sIQ")
+PACK_ALIGNMENT = 64
+
+# Pack ouvert par répertoire: (pack, date de la dernière vérification, pack à jour)
+_packs = {}
+_packs_lock = threading.Lock()
+
+def get_pack_path(knowledge_base_dir):
+    """Path of the compiled pack stored next to the knowledge base files"""
+    return os.path.join(knowledge_base_dir, settings.knowledge_base.get("packFile", ".kb_pack"))
+
+def pack_parameters():
+    """Ranking settings baked into the weights of a pack"""
+    return {
+        "k1": settings.knowledge_base.get("bm25K1", 1.2),
+        "b": settings.knowledge_base.get("bm25B", 0.75),
+        "keywordBoost": settings.knowledge_base.get("keywordBoost", 2.0)
+    }
+
+def _data_start(header_size):
+    return -(-(PACK_PREAMBLE.size + header_size) // PACK_ALIGNMENT) * PACK_ALIGNMENT
+
+def _text_arrays(texts):
+    # Textes concaténés en UTF-8, avec leurs positions de début (et la fin du dernier)
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def _model_arrays(bm25, terms):
+    # Tranches, idf et postings d'un modèle BM25, alignés sur le vocabulaire du pack
+    starts = np.zeros(len(terms), dtype=np.int64)
+    ends = np.zeros(len(terms), dtype=np.int64)
+    idf = np.zeros(len(terms), dtype=np.float64)
+    for number, term in enumerate(terms):
+        if term in bm25["slices"]:
+            starts[number], ends[number] = bm25["slices"][term]
+            idf[number] = bm25["idf"][term]
+    return starts, ends, idf, bm25["documentNumbers"].astype(np.int32), bm25["weights"].astype(np.float64)
+
+def write_knowledge_base_pack(path, sources, domains, tests, test_files, file_model, test_model, excluded=None):
+    """
+    Write a compiled knowledge base pack
+
+    Layout: magic, format version and JSON header size, the JSON header (mtime
+    and size of each source file, files left out, ranking settings, array descriptors), then 64-byte aligned
+    arrays: the sorted vocabulary, the BM25 postings of the files and of the
+    sample tests, and the per-domain and per-test texts with their offsets.
+
+    Args:
+        path (str): Path of the pack
+        sources (dict): (mtime_ns, size) of the knowledge base files, by name
+        domains (list): Domain metadata ({"name", "domain", "guidelines"}) of each file
+        tests (list): Prompt text of each sample test
+        test_files (list): Number of the file of each sample test
+        file_model (dict): BM25 model of the files
+        test_model (dict): BM25 model of the sample tests (vocabulary included in the files one)
+        excluded (list, optional): Source files left out of the pack
+    """
+    terms = sorted(file_model["slices"])
+    arrays = {}
+    arrays["term_offsets"], arrays["term_blob"] = _text_arrays(terms)
+    arrays["domain_offsets"], arrays["domain_blob"] = _text_arrays([json.dumps(domain) for domain in domains])
+    arrays["test_offsets"], arrays["test_blob"] = _text_arrays(tests)
+    arrays["test_files"] = np.array(test_files, dtype=np.int32)
+    for kind, bm25 in (("file", file_model), ("test", test_model)):
+        (arrays[f"{kind}_starts"], arrays[f"{kind}_ends"], arrays[f"{kind}_idf"],
+         arrays[f"{kind}_documents"], arrays[f"{kind}_weights"]) = _model_arrays(bm25, terms)
+
+    header = {
+        "version": PACK_VERSION,
+        "createdAt": datetime.now().isoformat(),
+        "sources": {name: [mtime, size] for name, (mtime, size) in sorted(sources.items())},
+        "excluded": sorted(excluded or []),
+        "parameters": pack_parameters(),
+        "counts": {"terms": len(terms), "files": len(domains), "tests": len(tests)},
+        "arrays": {}
+    }
+
+    # Positions relatives au début des tableaux, qui suit l'en-tête aligné
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "offset": offset, "count": int(array.size)}
+        offset += -(-array.nbytes // PACK_ALIGNMENT) * PACK_ALIGNMENT
+    header_data = json.dumps(header).encode('utf-8')
+    data_start = _data_start(len(header_data))
+
+    temp_path = path + '.tmp'
+    # Un fichier encore mappé ne peut pas être remplacé sous Windows
+    close_knowledge_base_packs(path)
+    with open(temp_path, 'wb') as f:
+        f.write(PACK_PREAMBLE.pack(PACK_MAGIC, PACK_VERSION, len(header_data)))
+        f.write(header_data)
+        for name, array in arrays.items():
+            f.write(b"\0" * (data_start + header["arrays"][name]["offset"] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(temp_path, path)
+    logger.info(f"Knowledge base pack written: {path} ({len(terms)} terms, {len(domains)} domains, {len(tests)} sample tests)")
+
+class _PackTermView:
+    """Read-only mapping of the vocabulary of a pack to the tranches or idf of one model"""
+
+    def __init__(self, pack, kind, field):
+        self._pack = pack
+        self._kind = kind
+        self._field = field
+
+    def _number(self, term):
+        number = self._pack.term_number(term)
+        if number < 0 or self._pack.arrays[f"{self._kind}_ends"][number] == self._pack.arrays[f"{self._kind}_starts"][number]:
+            return -1
+        return number
+
+    def __contains__(self, term):
+        return self._number(term) >= 0
+
+    def __getitem__(self, term):
+        number = self._number(term)
+        if number < 0:
+            raise KeyError(term)
+        if self._field == "idf":
+            return float(self._pack.arrays[f"{self._kind}_idf"][number])
+        return int(self._pack.arrays[f"{self._kind}_starts"][number]), int(self._pack.arrays[f"{self._kind}_ends"][number])
+
+class KnowledgeBasePack:
+    """
+    Compiled knowledge base, memory-mapped
+
+    Opening a pack only reads its JSON header: the arrays are NumPy views of
+    the mapped file, and terms are found by binary search in the sorted
+    vocabulary, so nothing is loaded in proportion to the size of the pack.
+    """
+
+    def __init__(self, path):
+        """
+        Open a pack
+
+        Args:
+            path (str): Path of the pack
+
+        Raises:
+            Exception: If the file is not a complete pack of the current format version
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        self.mtime = os.fstat(self._file.fileno()).st_mtime_ns
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, header_size = PACK_PREAMBLE.unpack_from(self._map, 0)
+            if magic != PACK_MAGIC or version != PACK_VERSION:
+                raise Exception(f"Unsupported knowledge base pack format (version {version})")
+            self.header = json.loads(self._map[PACK_PREAMBLE.size:PACK_PREAMBLE.size + header_size].decode('utf-8'))
+            self._data_start = _data_start(header_size)
+            # Un pack tronqué n'a pas la place des tableaux annoncés par son en-tête
+            self.arrays = {
+                name: np.frombuffer(self._map, dtype=np.dtype(descriptor["dtype"]), count=descriptor["count"],
+                                    offset=self._data_start + descriptor["offset"])
+                for name, descriptor in self.header["arrays"].items()
+            }
+        except Exception:
+            self._file.close()
+            raise
+        self._terms = {}
+
+    def _text(self, kind, number):
+        offsets = self.arrays[f"{kind}_offsets"]
+        blob = self._data_start + self.header["arrays"][f"{kind}_blob"]["offset"]
+        return self._map[blob + int(offsets[number]):blob + int(offsets[number + 1])].decode('utf-8')
+
+    def term_number(self, term):
+        """
+        Find a term in the vocabulary of the pack
+
+        Args:
+            term (str): Index term
+
+        Returns:
+            int: Number of the term, or -1 if it is not in the knowledge base
+        """
+        number = self._terms.get(term)
+        if number is not None:
+            return number
+
+        key = term.encode('utf-8')
+        offsets = self.arrays["term_offsets"]
+        blob = self._data_start + self.header["arrays"]["term_blob"]["offset"]
+        low, high = 0, self.header["counts"]["terms"]
+        while low < high:
+            middle = (low + high) // 2
+            if self._map[blob + int(offsets[middle]):blob + int(offsets[middle + 1])] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = low < self.header["counts"]["terms"] and self._map[blob + int(offsets[low]):blob + int(offsets[low + 1])] == key
+        number = low if found else -1
+
+        # Cache borné: les mots des stories reviennent d'une story à l'autre
+        if len(self._terms) > 100000:
+            self._terms.clear()
+        self._terms[term] = number
+        return number
+
+    def model(self, kind):
+        """
+        Get the BM25 model of the files ("file") or of the sample tests ("test")
+
+        Returns:
+            dict: Model usable like the ones built by prompt_enhancer.build_ranking_model
+        """
+        return {
+            "slices": _PackTermView(self, kind, "slices"),
+            "idf": _PackTermView(self, kind, "idf"),
+            "documentNumbers": self.arrays[f"{kind}_documents"],
+            "weights": self.arrays[f"{kind}_weights"],
+            "count": self.header["counts"]["files" if kind == "file" else "tests"],
+            "k1": self.header["parameters"]["k1"]
+        }
+
+    def domain(self, number):
+        """Metadata ({"name", "domain", "guidelines"}) of a knowledge base file of the pack"""
+        return json.loads(self._text("domain", number))
+
+    def test_text(self, number):
+        """Prompt text of a sample test of the pack"""
+        return self._text("test", number)
+
+    def test_file(self, number):
+        """Number of the file of a sample test of the pack"""
+        return int(self.arrays["test_files"][number])
+
+    def is_current(self, knowledge_base_dir):
+        """
+        Check that the pack was compiled from the current knowledge base files and settings
+
+        Args:
+            knowledge_base_dir (str): Knowledge base directory
+
+        Returns:
+            bool: False if a file was added, removed, renamed or modified since (any
+                change of mtime, older ones included, or of size), or the ranking settings changed
+        """
+        if self.header["parameters"] != pack_parameters():
+            return False
+        sources = {name: [mtime, size] for name, (mtime, size) in scan_files(knowledge_base_dir).items()}
+        return sources == self.header["sources"]
+
+    def close(self):
+        """Unmap the pack and close its file (the pack must no longer be used)"""
+        self.arrays = {}
+        try:
+            self._map.close()
+        except BufferError:
+            # Un lecteur utilise encore un tableau du pack: le mapping sera libéré avec lui
+            logger.debug(f"Knowledge base pack {self.path} still in use, left mapped")
+        self._file.close()
+
+def get_knowledge_base_pack(knowledge_base_dir):
+    """
+    Get the compiled pack of a knowledge base, if it is up to date
+
+    The pack is opened on first use and checked again at most every
+    knowledge_base["indexRefreshInterval"] seconds.
+
+    Args:
+        knowledge_base_dir (str): Knowledge base directory
+
+    Returns:
+        KnowledgeBasePack or None: The pack, or None if there is no pack or it is outdated
+    """
+    interval = settings.knowledge_base.get("indexRefreshInterval", 2)
+    cached = _packs.get(knowledge_base_dir)
+    if cached is not None and time.monotonic() - cached[1] < interval:
+        return cached[0] if cached[2] else None
+
+    with _packs_lock:
+        cached = _packs.get(knowledge_base_dir)
+        if cached is not None and time.monotonic() - cached[1] < interval:
+            return cached[0] if cached[2] else None
+
+        pack = cached[0] if cached else None
+        path = get_pack_path(knowledge_base_dir)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        # Rouvrir le pack s'il a été recompilé depuis, en libérant l'ancien
+        if pack is None or pack.mtime != mtime:
+            if pack is not None:
+                pack.close()
+            pack = None
+            if mtime is not None:
+                try:
+                    pack = KnowledgeBasePack(path)
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable knowledge base pack {path}: {e}")
+
+        current = pack is not None and pack.is_current(knowledge_base_dir)
+        if pack is not None and not current and (cached is None or cached[2] or cached[0] is not pack):
+            logger.info("Knowledge base pack is outdated, using the knowledge base files (run the sync script to recompile it)")
+        _packs[knowledge_base_dir] = (pack, time.monotonic(), current)
+        return pack if current else None
+
+def close_knowledge_base_packs(path):
+    """
+    Close the opened packs of a file, before it is replaced
+
+    Args:
+        path (str): Path of the pack
+    """
+    with _packs_lock:
+        for knowledge_base_dir, (pack, _, _) in list(_packs.items()):
+            if pack is not None and os.path.abspath(pack.path) == os.path.abspath(path):
+                pack.close()
+                del _packs[knowledge_base_dir]
@@ -0,0 +1,124 @@
+# Process-wide in-memory store of the knowledge base
+import os
+import time
+import logging
+import threading
+import sys
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from knowledge_base.kb_index import load_kb_index, save_kb_index, refresh_kb_index
+
+logger = logging.getLogger(__name__)
+
+# Un store par répertoire de base de connaissances
+_stores = {}
+_stores_lock = threading.Lock()
+
+class KnowledgeBaseStore:
+    """
+    In-memory view of a knowledge base directory, shared by all threads
+
+    The index of the files (parsed domains, sample tests and term counts) is
+    loaded once. Files are checked at most every
+    knowledge_base["indexRefreshInterval"] seconds and only those whose mtime
+    or size changed are read again; a file is only parsed again if its content
+    hash changed. Each refresh publishes a new index instead of modifying the
+    current one, so readers never need a lock.
+    """
+
+    def __init__(self, knowledge_base_dir):
+        """
+        Initialize the store
+
+        Args:
+            knowledge_base_dir (str): Knowledge base directory
+        """
+        self.knowledge_base_dir = knowledge_base_dir
+        self._lock = threading.Lock()
+        self._index = None
+        self._last_check = 0.0
+        # Données dérivées de l'index (modèle de classement...), par nom
+        self._derived = {}
+
+    def get_index(self):
+        """
+        Get the current index of the knowledge base, refreshed when files changed
+
+        Returns:
+            dict: The index (must not be modified)
+        """
+        index = self._index
+        if index is not None and time.monotonic() - self._last_check < settings.knowledge_base.get("indexRefreshInterval", 2):
+            return index
+
+        with self._lock:
+            # Un autre thread a pu rafraîchir l'index pendant l'attente du verrou
+            if self._index is not None and time.monotonic() - self._last_check < settings.knowledge_base.get("indexRefreshInterval", 2):
+                return self._index
+            self._refresh()
+            return self._index
+
+    def _refresh(self):
+        # Appelé avec le verrou: vérifier les fichiers et publier un nouvel index s'ils ont changé
+        index = self._index if self._index is not None else load_kb_index(self.knowledge_base_dir)
+        new_index, changed = refresh_kb_index(self.knowledge_base_dir, index)
+
+        if new_index is not index or self._index is None:
+            if new_index is not index:
+                try:
+                    save_kb_index(self.knowledge_base_dir, new_index)
+                except OSError as e:
+                    logger.warning(f"Could not save the knowledge base index: {e}")
+            if changed:
+                self._derived = {}
+            self._index = new_index
+        self._last_check = time.monotonic()
+
+    def get_derived(self, index, name, build):
+        """
+        Get data derived from the index, built once per index revision
+
+        Args:
+            index (dict): Index returned by get_index
+            name (str): Name of the derived data
+            build (callable): Function building the data from the index
+
+        Returns:
+            The derived data of this index
+        """
+        revision = index.get("revision")
+        cached = self._derived.get(name)
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+
+        with self._lock:
+            cached = self._derived.get(name)
+            if cached is not None and cached[0] == revision:
+                return cached[1]
+            data = build(index)
+            # Ne pas remplacer les données de l'index courant par celles d'un index dépassé
+            if index is self._index:
+                self._derived[name] = (revision, data)
+            return data
+
+def get_knowledge_base_store(knowledge_base_dir):
+    """
+    Get the process-wide store of a knowledge base directory
+
+    Args:
+        knowledge_base_dir (str): Knowledge base directory
+
+    Returns:
+        KnowledgeBaseStore: The store, created on first use
+    """
+    store = _stores.get(knowledge_base_dir)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(knowledge_base_dir, KnowledgeBaseStore(knowledge_base_dir))
+    return store
@@ -2,11 +2,11 @@
 import os
 import logging
 import re
-import glob
-import json
 import sys
 from pathlib import Path
 
+import numpy as np
+
 # Ajouter le chemin du projet au PYTHONPATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
@@ -14,30 +14,53 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 from config import settings
+from knowledge_base.kb_index import STOPWORDS, scan_files, build_file_entry
+from knowledge_base.kb_store import get_knowledge_base_store
+from knowledge_base.kb_pack import get_knowledge_base_pack, get_pack_path, write_knowledge_base_pack
 
 logger = logging.getLogger(__name__)
 
-def enhance_prompt_with_knowledge_base(prompt, user_story):
+def enhance_prompt_with_knowledge_base(prompt, user_story, token_budget=None):
     """
     Enhance a prompt with relevant content from knowledge base
     
     Args:
         prompt (str): The base prompt
         user_story (dict): User story data
+        token_budget (int, optional): Tokens the context may use. Defaults to knowledge_base["contextTokenBudget"].
     
     Returns:
         str: Enhanced prompt
     """
+    context = build_knowledge_base_context(user_story, token_budget)
+    if not context:
+        return prompt
+    return prompt + "\n\n" + context
+
+def build_knowledge_base_context(user_story, token_budget=None):
+    """
+    Build the knowledge base context relevant to a user story
+    
+    Args:
+        user_story (dict): User story data
+        token_budget (int, optional): Tokens the context may use. Defaults to knowledge_base["contextTokenBudget"].
+    
+    Returns:
+        str: Knowledge base context to add to the prompt, or an empty string if none is relevant
+    """
     if not settings.knowledge_base.get("use_knowledge_base", False):
         logger.info("Knowledge base enhancement disabled in settings")
-        return prompt
+        return ""
+    if token_budget is not None and token_budget <= 0:
+        logger.info("No token budget left for the knowledge base context")
+        return ""
     
     logger.info("Enhancing prompt with knowledge base content...")
     
     knowledge_base_dir = os.path.join(parent_dir, settings.generator["knowledgeBaseDir"])
     if not os.path.exists(knowledge_base_dir):
         logger.warning(f"Knowledge base directory {knowledge_base_dir} not found")
-        return prompt
+        return ""
     
     # Extract keywords from user story
     title = user_story['fields']['summary'].lower()
@@ -47,107 +70,325 @@ def enhance_prompt_with_knowledge_base(prompt, user_story):
     keywords = extract_keywords(title + " " + description)
     logger.info(f"Extracted keywords: {', '.join(keywords)}")
     
-    # Find relevant files
-    relevant_files = []
-    for filename in glob.glob(os.path.join(knowledge_base_dir, "*.json")):
+    # Rank the files and the sample tests with BM25, from the compiled pack if it is up to date
+    threshold = settings.knowledge_base.get("similarity_threshold", 0.2)
+    max_tests = settings.knowledge_base.get("maxSampleTests", 8)
+    test_threshold = settings.knowledge_base.get("sampleTestThreshold", 0.1)
+    pack = get_knowledge_base_pack(knowledge_base_dir) if settings.knowledge_base.get("usePack", True) else None
+    
+    if pack is not None:
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                file_content = json.load(f)
-                
-                relevance_score = calculate_relevance(file_content, keywords)
-                if relevance_score >= settings.knowledge_base.get("similarity_threshold", 0.65):
-                    logger.info(f"Found relevant file: {os.path.basename(filename)} (score: {relevance_score:.2f})")
-                    relevant_files.append((filename, relevance_score, file_content))
-        except Exception as e:
-            logger.error(f"Error reading knowledge base file {filename}: {str(e)}")
-    
-    # Sort by relevance score
-    relevant_files.sort(key=lambda x: x[1], reverse=True)
+            ranked_files = [(pack.domain(number), score)
+                            for number, score in _score_documents(pack.model("file"), keywords, limit=3)]
+            relevant_tests = [(pack.domain(pack.test_file(number)), pack.test_text(number))
+                              for number, _ in _score_documents(pack.model("test"), keywords, max_tests, test_threshold)]
+        except (KeyError, ValueError) as e:
+            # Pack fermé pendant la lecture parce qu'il vient d'être recompilé
+            logger.info(f"Knowledge base pack closed while in use ({e}), using the knowledge base files")
+            pack = None
+    if pack is None:
+        store = get_knowledge_base_store(knowledge_base_dir)
+        index = store.get_index()
+        model = store.get_derived(index, "ranking", build_ranking_model)
+        ranked_files = [(describe_domain(index, filename), score)
+                        for filename, score in rank_knowledge_base_files(model, keywords, limit=3)]
+        relevant_tests = [(describe_domain(index, filename), format_sample_test(index["files"][filename]["tests"][position]))
+                          for (filename, position), _ in rank_sample_tests(model, keywords, max_tests, test_threshold)]
     
+    relevant_domains = []
     # Limit to top 3 files
-    relevant_files = relevant_files[:3]
+    for domain, relevance_score in ranked_files:
+        if relevance_score < threshold:
+            break
+        logger.info(f"Found relevant file: {domain['name']} (score: {relevance_score:.2f})")
+        relevant_domains.append(domain)
     
-    if not relevant_files:
+    if not relevant_domains and not relevant_tests:
         logger.info("No relevant knowledge base files found")
-        return prompt
+        return ""
     
-    # Enhance prompt with relevant content
-    enhanced_prompt = prompt + "\n\n" + "KNOWLEDGE BASE CONTEXT:\n"
-    
-    for filename, score, content in relevant_files:
-        # Get only required fields for the context
-        domain = content.get("domain", "General")
-        tests = content.get("sample_tests", [])
-        guidelines = content.get("guidelines", "")
-        
-        enhanced_prompt += f"\n## Domain: {domain}\n"
-        if guidelines:
-            enhanced_prompt += f"Guidelines: {guidelines}\n"
-        
-        # Add sample tests if available
-        if tests:
-            enhanced_prompt += "Sample test cases:\n"
-            for i, test in enumerate(tests[:3]):  # Limit to 3 samples
-                summary = test.get("summary", f"Test case {i+1}")
-                enhanced_prompt += f"- {summary}\n"
-        
-        enhanced_prompt += "\n"
-    
-    enhanced_prompt += "\nPlease incorporate the relevant knowledge from above when generating test cases for this user story."
-    
-    return enhanced_prompt
+    return format_knowledge_base_context(relevant_domains, relevant_tests, token_budget)
 
-def extract_keywords(text):
+def describe_domain(index, filename):
+    """Domain metadata of a knowledge base file of the index, as stored in the compiled pack"""
+    entry = index["files"][filename]
+    return {"name": filename, "domain": entry["domain"], "guidelines": entry["guidelines"]}
+
+def estimate_tokens(text):
+    """Rough token count of a text (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def format_sample_test(test):
     """
-    Extract important keywords from text
+    Format a sample test of the index for the prompt
     
     Args:
-        text (str): Text to extract keywords from
+        test (dict): Sample test entry of the index
     
     Returns:
-        list: List of keywords
+        str: Summary of the test followed by its steps
     """
-    # Remove common words and special characters
-    text = re.sub(r'[^\w\s]', ' ', text.lower())
-    words = text.split()
+    text = f"- {test['summary']}\n"
+    for number, (action, result) in enumerate(test["steps"], start=1):
+        text += f"  {number}. {action}" + (f" -> {result}" if result else "") + "\n"
+    return text
+
+def format_knowledge_base_context(relevant_domains, relevant_tests, token_budget=None):
+    """
+    Build the knowledge base context within the token budget
+    
+    The guidelines of the relevant files come first, then the sample tests in
+    decreasing relevance while they fit in the token budget.
+    Sample tests are grouped under the domain of their file.
+    
+    Args:
+        relevant_domains (list): Domain metadata of the relevant files, by decreasing score
+        relevant_tests (list): (domain metadata, sample test text) pairs, by decreasing score
+        token_budget (int, optional): Tokens the context may use. Defaults to knowledge_base["contextTokenBudget"].
+    
+    Returns:
+        str: Knowledge base context to add to the prompt, or an empty string if no section fits in the budget
+    """
+    header = "KNOWLEDGE BASE CONTEXT:\n"
+    footer = "\nPlease incorporate the relevant knowledge from above when generating test cases for this user story."
+    if token_budget is None:
+        token_budget = settings.knowledge_base.get("contextTokenBudget", 1500)
+    remaining = token_budget - estimate_tokens(header + footer)
+    
+    # Domaines dans l'ordre: fichiers pertinents, puis fichiers des tests retenus
+    sections = {}
+    for domain in relevant_domains:
+        text = f"\n## Domain: {domain['domain']}\n"
+        if domain["guidelines"]:
+            text += f"Guidelines: {domain['guidelines']}\n"
+        cost = estimate_tokens(text)
+        if cost > remaining:
+            continue
+        remaining -= cost
+        sections[domain["name"]] = [text]
+    
+    selected = 0
+    for domain, test_text in relevant_tests:
+        name = domain["name"]
+        cost = estimate_tokens(test_text)
+        if name not in sections:
+            cost += estimate_tokens(f"\n## Domain: {domain['domain']}\n")
+        if len(sections.get(name, [])) <= 1:
+            cost += estimate_tokens("Sample test cases:\n")
+        if cost > remaining:
+            continue
+        remaining -= cost
+        if name not in sections:
+            sections[name] = [f"\n## Domain: {domain['domain']}\n"]
+        if len(sections[name]) == 1:
+            sections[name].append("Sample test cases:\n")
+        sections[name].append(test_text)
+        selected += 1
+    
+    if not sections:
+        logger.info(f"No knowledge base section fits in the token budget ({token_budget} tokens)")
+        return ""
+    
+    logger.info(f"Knowledge base context: {len(sections)} domains, {selected} sample tests")
+    return header + "".join("".join(parts) for parts in sections.values()) + "\n" + footer
+
+def _build_bm25(documents, boost):
+    """
+    Precompute the BM25 term weights of a set of documents
+    
+    The weights are stored per term as contiguous slices of two NumPy arrays
+    (document numbers and weights), so scoring a story only gathers the
+    slices of its keywords.
+    
+    Args:
+        documents (list): (term counts, boosted term counts) pairs
+        boost (float): Extra weight of the boosted terms
+    
+    Returns:
+        dict: Term slices, document numbers, weights, term idf and document count
+    """
+    k1 = settings.knowledge_base.get("bm25K1", 1.2)
+    b = settings.knowledge_base.get("bm25B", 0.75)
+    
+    postings = {}
+    for number, (terms, boosted) in enumerate(documents):
+        for term, count in terms.items():
+            postings.setdefault(term, []).append((number, count + boost * boosted.get(term, 0)))
+    
+    lengths = np.array([sum(terms.values()) for terms, _ in documents], dtype=np.float64)
+    average_length = lengths.mean() if len(documents) and lengths.mean() > 0 else 1.0
+    
+    slices = {}
+    document_numbers = []
+    term_frequencies = []
+    for term, entries in postings.items():
+        start = len(document_numbers)
+        for number, frequency in entries:
+            document_numbers.append(number)
+            term_frequencies.append(frequency)
+        slices[term] = (start, len(document_numbers))
     
-    # Simple stopwords list (can be enhanced)
-    stopwords = {'a', 'an', 'the', 'and', 'or', 'but', 'if', 'then', 'else', 'when', 
-                'at', 'from', 'by', 'for', 'with', 'about', 'against', 'between',
-                'into', 'through', 'during', 'before', 'after', 'above', 'below',
-                'to', 'of', 'in', 'on', 'is', 'are', 'was', 'were', 'be', 'been',
-                'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did',
-                'doing', 'can', 'could', 'should', 'would', 'ought', 'i', 'you',
-                'he', 'she', 'it', 'we', 'they', 'their', 'this', 'that', 'these',
-                'those', 'am', 'is', 'are', 'was', 'will', 'as', 'so', 'such'}
+    document_numbers = np.array(document_numbers, dtype=np.int32)
+    term_frequencies = np.array(term_frequencies, dtype=np.float64)
+    sizes = [end - start for start, end in slices.values()]
+    document_frequencies = np.array(sizes, dtype=np.float64)
+    idf = np.log1p((len(documents) - document_frequencies + 0.5) / (document_frequencies + 0.5))
     
-    # Filter words
-    keywords = [word for word in words if word not in stopwords and len(word) > 2]
+    # Poids BM25 de chaque couple (terme, document), idf inclus
+    norms = k1 * (1 - b + b * lengths[document_numbers] / average_length)
+    weights = np.repeat(idf, sizes) * term_frequencies * (k1 + 1) / (term_frequencies + norms)
     
-    # Return unique keywords
-    return list(set(keywords))
+    return {
+        "slices": slices,
+        "documentNumbers": document_numbers,
+        "weights": weights,
+        "idf": dict(zip(slices, idf.tolist())),
+        "count": len(documents),
+        "k1": k1
+    }
 
-def calculate_relevance(file_content, keywords):
+def build_ranking_model(index):
     """
-    Calculate relevance score between file content and keywords
+    Precompute the BM25 models of the knowledge base files and sample tests
+    
+    Terms of a file's own keywords field count knowledge_base["keywordBoost"]
+    more times than the rest of its text, in the file and in its sample tests.
     
     Args:
-        file_content (dict): File content
-        keywords (list): Keywords list
+        index (dict): Knowledge base index returned by KnowledgeBaseStore.get_index
+    
+    Returns:
+        dict: Ranking model (file names, test references and their BM25 models)
+    """
+    boost = settings.knowledge_base.get("keywordBoost", 2.0)
+    files = sorted(index["files"])
+    tests = [(name, position) for name in files for position in range(len(index["files"][name]["tests"]))]
+    
+    return {
+        "files": files,
+        "fileModel": _build_bm25([(index["files"][name]["terms"], index["files"][name]["keywords"]) for name in files], boost),
+        "tests": tests,
+        "testModel": _build_bm25(
+            [(index["files"][name]["tests"][position]["terms"], index["files"][name]["keywords"]) for name, position in tests],
+            boost
+        )
+    }
+
+def _score_documents(bm25, keywords, limit=None, min_score=0.0):
+    """
+    Score every document of a BM25 model against keywords in one vectorized pass
+    
+    The BM25 score of a document is divided by the best score any document could
+    reach for these keywords, so scores range from 0.0 to 1.0 whatever the size
+    of the knowledge base or the number of keywords.
     
     Returns:
-        float: Relevance score (0.0 to 1.0)
+        list: (document number, score) pairs of the matching documents, by decreasing score
     """
-    # Simple keyword matching (can be enhanced with more sophisticated NLP)
-    content_text = json.dumps(file_content).lower()
+    known = [keyword for keyword in set(keywords) if keyword in bm25["slices"]]
+    if not known:
+        return []
+    
+    positions = np.concatenate([np.arange(*bm25["slices"][keyword]) for keyword in known])
+    scores = np.zeros(bm25["count"])
+    np.add.at(scores, bm25["documentNumbers"][positions], bm25["weights"][positions])
     
-    matches = 0
-    for keyword in keywords:
-        if keyword in content_text:
-            matches += 1
+    best_possible = sum(bm25["idf"][keyword] for keyword in known) * (bm25["k1"] + 1)
+    if best_possible <= 0:
+        return []
+    scores /= best_possible
+    
+    matching = np.flatnonzero(scores > min_score) if min_score > 0 else np.flatnonzero(scores)
+    if limit is not None and len(matching) > limit:
+        matching = matching[np.argpartition(-scores[matching], limit - 1)[:limit]]
+    order = matching[np.argsort(-scores[matching], kind="stable")]
+    return list(zip(order.tolist(), scores[order].tolist()))
+
+def rank_knowledge_base_files(model, keywords, limit=None, min_score=0.0):
+    """
+    Score every knowledge base file against keywords
+    
+    Args:
+        model (dict): Ranking model built by build_ranking_model
+        keywords (list): Keywords extracted from the user story
+        limit (int, optional): Maximum number of files returned
+        min_score (float, optional): Files scoring this or less are left out
+    
+    Returns:
+        list: (file name, score) pairs of the matching files, by decreasing score (0.0 to 1.0)
+    """
+    return [(model["files"][number], score)
+            for number, score in _score_documents(model["fileModel"], keywords, limit, min_score)]
+
+def rank_sample_tests(model, keywords, limit=None, min_score=0.0):
+    """
+    Score every sample test of the knowledge base against keywords
+    
+    Args:
+        model (dict): Ranking model built by build_ranking_model
+        keywords (list): Keywords extracted from the user story
+        limit (int, optional): Maximum number of sample tests returned
+        min_score (float, optional): Sample tests scoring this or less are left out
+    
+    Returns:
+        list: ((file name, test position), score) pairs, by decreasing score (0.0 to 1.0)
+    """
+    return [(model["tests"][number], score)
+            for number, score in _score_documents(model["testModel"], keywords, limit, min_score)]
+
+def compile_knowledge_base_pack(knowledge_base_dir, exclude=None):
+    """
+    Compile the knowledge base files into the pack read by the prompt enhancement
+    
+    Args:
+        knowledge_base_dir (str): Knowledge base directory
+        exclude (list, optional): Files left out of the pack (still recorded as its sources, so that
+            the pack becomes outdated when they change)
+    
+    Returns:
+        str: Path of the pack
+    """
+    sources = scan_files(knowledge_base_dir)
+    excluded = sorted(set(exclude or []) & set(sources))
+    index = {"files": {}}
+    for name, (mtime_ns, size) in sorted(sources.items()):
+        if name in excluded:
+            continue
+        entry = build_file_entry(os.path.join(knowledge_base_dir, name), mtime_ns, size)
+        if entry is not None:
+            index["files"][name] = entry
+    
+    model = build_ranking_model(index)
+    numbers = {name: number for number, name in enumerate(model["files"])}
+    path = get_pack_path(knowledge_base_dir)
+    write_knowledge_base_pack(
+        path,
+        sources,
+        [describe_domain(index, name) for name in model["files"]],
+        [format_sample_test(index["files"][name]["tests"][position]) for name, position in model["tests"]],
+        [numbers[name] for name, _ in model["tests"]],
+        model["fileModel"],
+        model["testModel"],
+        excluded
+    )
+    return path
+
+def extract_keywords(text):
+    """
+    Extract important keywords from text
+    
+    Args:
+        text (str): Text to extract keywords from
+    
+    Returns:
+        list: Sorted list of unique keywords
+    """
+    # Remove common words and special characters
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    words = text.split()
     
-    # Calculate score (normalize by number of keywords)
-    if not keywords:
-        return 0.0
+    # Filter words (same normalization as the knowledge base index)
+    keywords = [word for word in words if word not in STOPWORDS and len(word) > 2]
     
-    return matches / len(keywords)
+    # Return unique keywords, in a stable order
+    return sorted(set(keywords))
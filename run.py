@@ -11,6 +11,10 @@ import argparse
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
+# Les modules de src/ s'importent entre eux sans préfixe de package
+src_dir = os.path.join(current_dir, "src")
+if src_dir not in sys.path:
+    sys.path.insert(1, src_dir)
 
 # Configurer le logging
 log_dir = os.path.join(current_dir, "output", "logs")
@@ -35,10 +39,68 @@ def main():
     parser = argparse.ArgumentParser(description='Test Case Generator')
     parser.add_argument('jira_id', nargs='?', help='ID de l\'User Story Jira (ex: PT-28)')
     parser.add_argument('--gui', action='store_true', help='Lancer l\'interface graphique')
+    parser.add_argument('--jql', help='Mode batch: traiter toutes les User Stories correspondant à cette requête JQL')
+    parser.add_argument('--keys-file', help='Mode batch: fichier contenant une clé d\'User Story par ligne')
+    parser.add_argument('--workers', type=int, help='Mode batch: nombre de User Stories traitées en parallèle')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Mode batch: utiliser le pipeline asyncio (nombreuses stories en parallèle)')
+    parser.add_argument('--backlog', action='store_true', help='Mode batch hors ligne via l\'API Message Batches (reprend un backlog en cours)')
+    parser.add_argument('--changed-only', action='store_true', help='Mode batch: ignorer les User Stories inchangées depuis la dernière génération')
+    parser.add_argument('--incremental', action='store_true', help='Ne régénérer que les scénarios d\'acceptation ajoutés ou modifiés')
+    parser.add_argument('--shard', action='store_true', help='Générer chaque scénario d\'acceptation par une requête Claude séparée, en parallèle')
+    parser.add_argument('--sync-xray', action='store_true', help='Synchroniser le miroir local des tests du projet Xray')
+    parser.add_argument('--full-sync', action='store_true', help='Avec --sync-xray: reconstruire entièrement le miroir (tests supprimés compris)')
+    parser.add_argument('--upsert', action='store_true', help='Mettre à jour les tests déjà liés à l\'User Story au lieu d\'en créer de nouveaux')
+    parser.add_argument('--stream', action='store_true', help='Traiter chaque test case dès que Claude a fini de l\'écrire (réponse en streaming)')
+    parser.add_argument('--no-cache', action='store_true', help='Ne pas réutiliser les générations Claude en cache')
     args = parser.parse_args()
+    if args.use_async and not (args.jql or args.keys_file):
+        parser.error("--async ne s'applique qu'au mode batch: utiliser --jql ou --keys-file")
+    
+    from config import settings
+    if args.no_cache:
+        settings.cache["enabled"] = False
+    if args.incremental:
+        settings.generator["incremental"] = True
+    if args.shard:
+        settings.generator["shardScenarios"] = True
+    if args.upsert:
+        settings.xray["upsert"] = True
+    if args.stream:
+        settings.claude["stream"] = True
     
     try:
-        if args.gui or not args.jira_id:
+        if args.sync_xray:
+            from xray_mirror import sync_xray_mirror
+            result = sync_xray_mirror(full=args.full_sync)
+            if not result['success']:
+                print(f"Échec de la synchronisation du miroir Xray: {result['error']}")
+                return 1
+            print(f"Miroir Xray synchronisé: {result['fetched']} tests récupérés, {result['total']} tests dans le miroir")
+        elif args.jql or args.keys_file or args.backlog:
+            # Mode batch: plusieurs User Stories traitées en parallèle
+            from batch import generate_test_cases_for_stories, generate_test_cases_for_jql, load_story_keys_from_file, print_batch_summary
+            if args.backlog:
+                from message_batches import run_backlog
+                keys = load_story_keys_from_file(args.keys_file) if args.keys_file else None
+                logger.info("Traitement du backlog via l'API Message Batches")
+                summary = run_backlog(keys, jql=args.jql, max_workers=args.workers)
+            elif args.use_async:
+                import asyncio
+                from async_pipeline import generate_test_cases_for_stories_async
+                keys = load_story_keys_from_file(args.keys_file) if not args.jql else None
+                logger.info("Traitement batch asynchrone des User Stories")
+                summary = asyncio.run(generate_test_cases_for_stories_async(keys, jql=args.jql, max_in_flight=args.workers, changed_only=args.changed_only))
+            elif args.jql:
+                logger.info(f"Traitement batch des User Stories de la requête JQL: {args.jql}")
+                summary = generate_test_cases_for_jql(args.jql, max_workers=args.workers, changed_only=args.changed_only)
+            else:
+                logger.info(f"Traitement batch des User Stories du fichier: {args.keys_file}")
+                keys = load_story_keys_from_file(args.keys_file)
+                summary = generate_test_cases_for_stories(keys, max_workers=args.workers, changed_only=args.changed_only)
+            
+            print_batch_summary(summary)
+            return 1 if summary['failed'] else 0
+        elif args.gui or not args.jira_id:
             # Lancer l'interface graphique si demandé ou si aucun ID Jira n'est fourni
             logger.info("Lancement de l'interface graphique...")
             from interface.app_jira import main as launch_gui
@@ -46,7 +108,7 @@ def main():
         else:
             # Exécuter avec l'ID Jira fourni
             logger.info(f"Traitement de l'User Story Jira: {args.jira_id}")
-            from src.generator import generate_test_cases_from_user_story
+            from generator import generate_test_cases_from_user_story
             results = generate_test_cases_from_user_story(args.jira_id)
             
             # Afficher un résumé des résultats
@@ -57,10 +119,27 @@ def main():
             
             print('\n======== CAS DE TEST ========')
             for i, tc in enumerate(results['testCases']):
-                if tc['success']:
+                if tc.get('unchanged'):
+                    print(f"{i + 1}. {tc['testCase']} -> {tc['key']} (inchangé)")
+                elif tc.get('updated'):
+                    print(f"{i + 1}. {tc['testCase']} -> {tc['key']} (mis à jour)")
+                elif tc['success']:
                     print(f"{i + 1}. {tc['testCase']} -> {tc['key']}")
                 else:
                     print(f"{i + 1}. {tc['testCase']} -> Échec de l'import: {tc.get('error', 'Erreur inconnue')}")
+            
+            if results.get('untouchedTests'):
+                print('\n======== TESTS EXISTANTS NON MODIFIÉS ========')
+                print(', '.join(results['untouchedTests']))
+            
+            if results.get('staleTests'):
+                print('\n======== TESTS DE SCÉNARIOS RETIRÉS OU MODIFIÉS (À NETTOYER) ========')
+                print(', '.join(results['staleTests']))
+            
+            if results.get('duplicates'):
+                print('\n======== QUASI-DOUBLONS ÉCARTÉS ========')
+                for duplicate in results['duplicates']:
+                    print(f"- {duplicate['dropped']} (similaire à {duplicate['similarity']:.0%} à: {duplicate['kept']})")
     except Exception as e:
         logger.error(f"Erreur lors de l'exécution: {str(e)}")
         print(f"Une erreur s'est produite: {str(e)}")
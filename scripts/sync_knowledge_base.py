@@ -3,8 +3,11 @@
 import os
 import sys
 import json
+import time
+import hashlib
 import logging
-import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 # Add the project root to the Python path
@@ -16,22 +19,102 @@ if parent_dir not in sys.path:
 # Import project modules
 try:
     from config import settings
+    from knowledge_base.kb_index import scan_files
+    from knowledge_base.kb_pack import get_pack_path, get_knowledge_base_pack
+    from knowledge_base.prompt_enhancer import compile_knowledge_base_pack
 except ImportError as e:
     print(f"Error importing project modules: {str(e)}")
     print("Make sure you're running this script from the project root directory.")
     sys.exit(1)
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(parent_dir, "output", "logs", f"sync_kb_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def setup_logging():
+    """Set up logging (only in the main process, not in the validation processes)"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join(parent_dir, "output", "logs", f"sync_kb_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")),
+            logging.StreamHandler()
+        ]
+    )
+
+# Schéma des fichiers de la base de connaissances (les champs supplémentaires sont permis)
+_non_empty_string = {"type": "string", "pattern": "\\S"}
+KNOWLEDGE_BASE_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "type": "object",
+    "required": ["domain", "description", "keywords", "sample_tests"],
+    "properties": {
+        "keywords": {"type": "array", "minItems": 1, "items": _non_empty_string},
+        "sample_tests": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "required": ["summary", "description", "steps"],
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "minItems": 1,
+                        "items": {"type": "object", "required": ["action", "data", "result"]}
+                    }
+                }
+            }
+        }
+    }
+}
+
+# Validateur compilé une fois par processus
+_validator = None
+
+def get_validator():
+    """
+    Get the compiled validator of the knowledge base schema
+    
+    Returns:
+        jsonschema.Draft7Validator: The validator, compiled on first use in this process
+    """
+    global _validator
+    if _validator is None:
+        from jsonschema import Draft7Validator
+        Draft7Validator.check_schema(KNOWLEDGE_BASE_SCHEMA)
+        _validator = Draft7Validator(KNOWLEDGE_BASE_SCHEMA)
+    return _validator
+
+def schema_hash():
+    """Hash of the schema, so that changing it validates every file again"""
+    return hashlib.sha256(json.dumps(KNOWLEDGE_BASE_SCHEMA, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def format_validation_error(error):
+    """
+    Describe a schema validation error
+    
+    Args:
+        error (jsonschema.ValidationError): The error
+    
+    Returns:
+        str: Warning, prefixed with the test case and step it concerns
+    """
+    path = list(error.absolute_path)
+    prefix = ""
+    if len(path) >= 2 and path[0] == "sample_tests":
+        prefix = f"Test case {path[1]}"
+        if len(path) >= 4 and path[2] == "steps":
+            prefix += f", Step {path[3]}"
+        prefix += ": "
+    
+    field = path[-1] if path else None
+    if error.validator == "required":
+        missing = error.message.split("'")[1] if "'" in error.message else error.message
+        return f"{prefix}Missing required field: {missing}"
+    if error.validator in ("minItems", "type") and field in ("sample_tests", "keywords", "steps"):
+        return f"{prefix}{field} must be a non-empty array"
+    if path and path[0] == "keywords" and len(path) == 2:
+        return f"Invalid keyword: {error.instance}"
+    return f"{prefix}{error.message}"
+
 def validate_knowledge_base_file(file_path):
     """
     Validate a knowledge base file
@@ -47,31 +130,8 @@ def validate_knowledge_base_file(file_path):
         with open(file_path, 'r', encoding='utf-8') as f:
             content = json.load(f)
         
-        # Check required fields
-        required_fields = ['domain', 'description', 'keywords', 'sample_tests']
-        for field in required_fields:
-            if field not in content:
-                warnings.append(f"Missing required field: {field}")
-        
-        # Check sample tests
-        if 'sample_tests' in content:
-            tests = content['sample_tests']
-            if not isinstance(tests, list) or len(tests) == 0:
-                warnings.append("sample_tests must be a non-empty array")
-            else:
-                for i, test in enumerate(tests):
-                    test_warnings = validate_test_case(test, i)
-                    warnings.extend(test_warnings)
-        
-        # Check keywords
-        if 'keywords' in content:
-            keywords = content['keywords']
-            if not isinstance(keywords, list) or len(keywords) == 0:
-                warnings.append("keywords must be a non-empty array")
-            else:
-                for keyword in keywords:
-                    if not isinstance(keyword, str) or len(keyword.strip()) == 0:
-                        warnings.append(f"Invalid keyword: {keyword}")
+        for error in sorted(get_validator().iter_errors(content), key=lambda e: list(map(str, e.absolute_path))):
+            warnings.append(format_validation_error(error))
         
         return len(warnings) == 0, warnings
     except json.JSONDecodeError as e:
@@ -81,63 +141,116 @@ def validate_knowledge_base_file(file_path):
         warnings.append(f"Error validating file: {str(e)}")
         return False, warnings
 
-def validate_test_case(test_case, index):
+def _validate_file(file_path):
+    # Exécuté dans les processus du pool
+    valid, warnings = validate_knowledge_base_file(file_path)
+    return os.path.basename(file_path), valid, warnings
+
+def get_validation_state_path(kb_dir):
+    """Path of the validation results of the previous run, stored next to the knowledge base files"""
+    return os.path.join(kb_dir, settings.knowledge_base.get("validationStateFile", ".kb_validation"))
+
+def load_validation_state(kb_dir):
     """
-    Validate a test case
+    Load the validation results of the previous run
     
     Args:
-        test_case (dict): The test case to validate
-        index (int): Index of the test case in the file
+        kb_dir (str): Knowledge base directory
     
     Returns:
-        list: Warnings found during validation
+        dict: Results by file name (empty if missing or validated with another schema)
     """
-    warnings = []
-    
-    # Check required fields
-    required_fields = ['summary', 'description', 'steps']
-    for field in required_fields:
-        if field not in test_case:
-            warnings.append(f"Test case {index}: Missing required field: {field}")
-    
-    # Check steps
-    if 'steps' in test_case:
-        steps = test_case['steps']
-        if not isinstance(steps, list) or len(steps) == 0:
-            warnings.append(f"Test case {index}: steps must be a non-empty array")
-        else:
-            for j, step in enumerate(steps):
-                step_warnings = validate_step(step, index, j)
-                warnings.extend(step_warnings)
-    
-    return warnings
+    try:
+        with open(get_validation_state_path(kb_dir), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("schema") == schema_hash():
+            return state.get("files", {})
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable validation state: {e}")
+    return {}
+
+def save_validation_state(kb_dir, files):
+    """Save the validation results of this run"""
+    path = get_validation_state_path(kb_dir)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"schema": schema_hash(), "files": files}, f)
+    os.replace(temp_path, path)
 
-def validate_step(step, test_index, step_index):
+def file_hash(file_path):
+    """SHA-256 of the content of a file"""
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def validate_knowledge_base(kb_dir, force=False, max_workers=None):
     """
-    Validate a test step
+    Validate the knowledge base files added or modified since the previous run
+    
+    Files whose content hash did not change keep their previous result. The
+    others are validated in parallel in a process pool, each process compiling
+    the schema validator once.
     
     Args:
-        step (dict): The step to validate
-        test_index (int): Index of the parent test case
-        step_index (int): Index of the step
+        kb_dir (str): Knowledge base directory
+        force (bool, optional): Validate every file again
+        max_workers (int, optional): Validation processes. Defaults to settings.knowledge_base["validationWorkers"] (CPU count if None).
     
     Returns:
-        list: Warnings found during validation
+        dict: Results by file name ({"hash", "mtime", "size", "valid", "warnings", "cached"})
     """
-    warnings = []
+    previous = {} if force else load_validation_state(kb_dir)
+    sources = scan_files(kb_dir)
+    results = {}
+    to_validate = []
+    
+    for name, (mtime_ns, size) in sorted(sources.items()):
+        entry = previous.get(name)
+        # Même date et même taille: inutile de relire le fichier
+        if entry and entry["mtime"] == mtime_ns and entry["size"] == size:
+            results[name] = dict(entry, cached=True)
+            continue
+        content_hash = file_hash(os.path.join(kb_dir, name))
+        if entry and entry["hash"] == content_hash:
+            results[name] = dict(entry, mtime=mtime_ns, size=size, cached=True)
+            continue
+        results[name] = {"hash": content_hash, "mtime": mtime_ns, "size": size}
+        to_validate.append(os.path.join(kb_dir, name))
+    
+    logger.info(f"Validating {len(to_validate)} changed files ({len(results) - len(to_validate)} unchanged)")
     
-    # Check required fields
-    required_fields = ['action', 'data', 'result']
-    for field in required_fields:
-        if field not in step:
-            warnings.append(f"Test case {test_index}, Step {step_index}: Missing required field: {field}")
+    if max_workers is None:
+        max_workers = settings.knowledge_base.get("validationWorkers") or os.cpu_count() or 1
+    if len(to_validate) > 1 and max_workers > 1:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(to_validate))) as executor:
+            validated = list(executor.map(_validate_file, to_validate, chunksize=max(1, len(to_validate) // (max_workers * 4))))
+    else:
+        validated = [_validate_file(file_path) for file_path in to_validate]
     
-    return warnings
+    for name, valid, warnings in validated:
+        results[name].update(valid=valid, warnings=warnings, cached=False)
+    
+    save_validation_state(kb_dir, {name: {k: v for k, v in entry.items() if k != "cached"} for name, entry in results.items()})
+    return results
+
+def parse_args():
+    """Parse the command line arguments"""
+    parser = argparse.ArgumentParser(description="Validate the knowledge base and compile its pack")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON on the standard output")
+    parser.add_argument("--force", action="store_true", help="Validate every file, even unchanged ones")
+    parser.add_argument("--workers", type=int, help="Number of validation processes")
+    return parser.parse_args()
 
 def main():
     """
-    Main function to synchronize and validate knowledge base
+    Main function to validate the knowledge base and compile its pack
+    
+    Returns:
+        int: Exit code (1 if a knowledge base file is invalid)
     """
+    args = parse_args()
+    start_time = time.monotonic()
     logger.info("Starting knowledge base synchronization")
     
     # Get knowledge base directory
@@ -145,47 +258,72 @@ def main():
     if not os.path.exists(kb_dir):
         logger.error(f"Knowledge base directory not found: {kb_dir}")
         print(f"Error: Knowledge base directory not found: {kb_dir}")
-        sys.exit(1)
+        return 1
     
     logger.info(f"Validating knowledge base files in: {kb_dir}")
-    
-    # Find and validate all JSON files
-    files = glob.glob(os.path.join(kb_dir, "*.json"))
-    logger.info(f"Found {len(files)} knowledge base files")
+    results = validate_knowledge_base(kb_dir, force=args.force, max_workers=args.workers)
+    logger.info(f"Found {len(results)} knowledge base files")
     
     valid_count = 0
     warning_count = 0
     
-    for file_path in files:
-        file_name = os.path.basename(file_path)
-        logger.info(f"Validating: {file_name}")
-        
-        valid, warnings = validate_knowledge_base_file(file_path)
-        
-        if valid:
-            logger.info(f"✅ {file_name} is valid")
+    for file_name, result in results.items():
+        if result["valid"]:
+            logger.info(f"✅ {file_name} is valid" + (" (unchanged)" if result["cached"] else ""))
             valid_count += 1
         else:
-            logger.warning(f"⚠️ {file_name} has warnings/errors")
+            logger.warning(f"⚠️ {file_name} has warnings/errors" + (" (unchanged)" if result["cached"] else ""))
             warning_count += 1
         
         # Print warnings if any
-        for warning in warnings:
+        for warning in result["warnings"]:
             logger.warning(f"  - {warning}")
     
     # Summary
     logger.info("Knowledge base validation completed")
-    logger.info(f"Total files: {len(files)}, Valid: {valid_count}, With warnings/errors: {warning_count}")
+    logger.info(f"Total files: {len(results)}, Valid: {valid_count}, With warnings/errors: {warning_count}")
+    
+    # Compile the valid files into the pack read by the prompt enhancement, unless it is up to date
+    invalid_files = sorted(name for name, result in results.items() if not result["valid"])
+    pack_path = get_pack_path(kb_dir)
+    pack = None if args.force else get_knowledge_base_pack(kb_dir)
+    pack_compiled = pack is None or pack.header.get("excluded") != invalid_files
+    if pack_compiled:
+        compile_knowledge_base_pack(kb_dir, exclude=invalid_files)
+        logger.info(f"Knowledge base pack compiled: {pack_path}" + (f" (left out: {', '.join(invalid_files)})" if invalid_files else ""))
+    else:
+        logger.info(f"Knowledge base pack is up to date: {pack_path}")
+    
+    if args.json:
+        print(json.dumps({
+            "knowledgeBaseDir": kb_dir,
+            "total": len(results),
+            "valid": valid_count,
+            "invalid": warning_count,
+            "validated": sum(1 for result in results.values() if not result["cached"]),
+            "files": [
+                {"file": name, "valid": result["valid"], "warnings": result["warnings"], "cached": result["cached"]}
+                for name, result in results.items()
+            ],
+            "pack": {"path": pack_path, "compiled": pack_compiled, "size": os.path.getsize(pack_path), "excluded": invalid_files},
+            "durationSeconds": round(time.monotonic() - start_time, 3)
+        }, indent=2))
+        return 1 if invalid_files else 0
     
     # Print summary to console
     print("\nKnowledge base validation completed:")
-    print(f"Total files: {len(files)}")
+    print(f"Total files: {len(results)}")
     print(f"Valid files: {valid_count}")
     print(f"Files with warnings/errors: {warning_count}")
+    print(("Compiled" if pack_compiled else "Up-to-date") + f" knowledge base pack: {pack_path} ({os.path.getsize(pack_path) / 1024:.1f} KB)")
+    if invalid_files:
+        print(f"Left out of the pack until fixed: {', '.join(invalid_files)}")
+    return 1 if invalid_files else 0
 
 if __name__ == "__main__":
+    setup_logging()
     try:
-        main()
+        sys.exit(main())
     except Exception as e:
         logger.error(f"Error in knowledge base synchronization: {str(e)}", exc_info=True)
         print(f"Error: {str(e)}")
@@ -0,0 +1,632 @@
+# Asyncio pipeline for the Test Case Generator
+#
+# Async counterparts of the Jira, Claude and Xray clients, sharing their request
+# builders and response parsers. A single event loop can keep hundreds of user
+# stories in flight while the number of concurrent calls per host stays bounded.
+# Xray imports go through the bulk import engine shared with the synchronous path.
+import asyncio
+import json
+import logging
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import aiohttp
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from utils import compute_retry_delay, RETRY_STATUS_CODES, NOT_PROCESSED_STATUS_CODES, IDEMPOTENT_METHODS
+from jira_client import build_search_url, search_jira_issue_keys, MAX_KEYS_PER_QUERY
+from claude_client import (build_claude_request, extract_test_cases_from_response, get_cached_test_cases, generate_fallback_test_cases,
+                           needs_continuation, build_continuation_request, merge_continuation, StreamedClaudeResponse,
+                           save_claude_response, build_default_test_cases)
+from generation_cache import store_generation
+from xray_client import get_cached_xray_auth_token, store_xray_auth_token, invalidate_xray_auth_token
+from bulk_import import get_bulk_import_engine
+from generator import (generate_test_cases_from_user_story, process_generated_test_cases, prepare_output_directory,
+                       save_test_case, apply_import_result, build_generation_result)
+from scenarios import split_story_blocks, build_scenario_story, merge_scenario_test_cases
+from dedup import NearDuplicateFilter, collapse_near_duplicates
+from batch import (build_story_result, build_story_error, build_story_skipped, record_story_result, summarize_batch,
+                   select_changed_stories, record_story_processed)
+
+logger = logging.getLogger(__name__)
+
+XRAY_API_URL = "https://xray.cloud.getxray.app/api/v2"
+
+class AsyncHttpClient:
+    """
+    Shared aiohttp session with a concurrency limit per host and retries
+
+    Use it as an async context manager; every async client function takes it
+    as first argument.
+    """
+
+    def __init__(self):
+        self._session = None
+        self._semaphores = {}
+        self._auth_lock = None
+
+    async def __aenter__(self):
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=settings.http.get("connectTimeout", 10),
+            sock_read=settings.http.get("readTimeout", 300)
+        )
+        # Les limites par hôte sont appliquées par les sémaphores
+        connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+        self._auth_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+
+    def _semaphore(self, host):
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            limits = settings.async_pipeline.get("hostConcurrency", {})
+            semaphore = asyncio.Semaphore(limits.get(host, limits.get("default", 10)))
+            self._semaphores[host] = semaphore
+        return semaphore
+
+    async def request(self, method, url, headers=None, json_data=None):
+        """
+        Send an HTTP request, retrying on connection errors and 429/5xx responses
+
+        Args:
+            method (str): HTTP method
+            url (str): Request URL
+            headers (dict, optional): Request headers
+            json_data (dict or list, optional): JSON data to send
+
+        Returns:
+            tuple: (status code, response text)
+        """
+        method = method.upper()
+        host = urlparse(url).netloc
+        max_retries = settings.http.get("maxRetries", 3)
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self._semaphore(host):
+                    async with self._session.request(method, url, headers=headers, json=json_data) as response:
+                        status = response.status
+                        text = await response.text()
+                        retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                retryable = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+                if not retryable or attempt >= max_retries:
+                    raise
+                delay = compute_retry_delay(attempt)
+                logger.warning(f"{method} {url} failed ({type(e).__name__}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            else:
+                retryable = status in (RETRY_STATUS_CODES if idempotent else NOT_PROCESSED_STATUS_CODES)
+                if not retryable or attempt >= max_retries:
+                    return status, text
+                delay = compute_retry_delay(attempt, retry_after)
+                logger.warning(f"{method} {url} returned {status}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stream_events(self, method, url, headers=None, json_data=None):
+        """
+        Send an HTTP request and yield the server-sent events of its response
+
+        The request is retried like request() until the response starts; once
+        events have been received, an error ends the stream.
+
+        Args:
+            method (str): HTTP method
+            url (str): Request URL
+            headers (dict, optional): Request headers
+            json_data (dict, optional): JSON data to send
+
+        Yields:
+            dict: Data of each event (the "data:" lines of the stream)
+
+        Raises:
+            Exception: If the response status is not 2xx or the stream reports an error
+        """
+        method = method.upper()
+        host = urlparse(url).netloc
+        max_retries = settings.http.get("maxRetries", 3)
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore(host):
+                    async with self._session.request(method, url, headers=headers, json=json_data) as response:
+                        status = response.status
+                        if status < 200 or status >= 300:
+                            text = await response.text()
+                            retryable = status in (RETRY_STATUS_CODES if idempotent else NOT_PROCESSED_STATUS_CODES)
+                            if not retryable or attempt >= max_retries:
+                                error_preview = text[:200] + "..." if len(text) > 200 else text
+                                raise Exception(f"HTTP Error {status}: {error_preview}")
+                            delay = compute_retry_delay(attempt, response.headers.get('Retry-After'))
+                            logger.warning(f"{method} {url} returned {status}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+                        else:
+                            # Seules les lignes "data:" portent le contenu, le type est répété dans le JSON
+                            async for line in response.content:
+                                line = line.decode('utf-8').strip()
+                                if not line.startswith('data:'):
+                                    continue
+                                event = json.loads(line[5:].strip())
+                                if event.get('type') == 'error':
+                                    raise Exception(f"Claude stream error: {event.get('error', {}).get('message', event)}")
+                                yield event
+                            return
+            except aiohttp.ClientConnectorError as e:
+                # Connexion impossible: la requête n'a pas été envoyée
+                if attempt >= max_retries:
+                    raise
+                delay = compute_retry_delay(attempt)
+                logger.warning(f"{method} {url} failed ({type(e).__name__}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def request_json(self, method, url, headers=None, json_data=None):
+        """
+        Send an HTTP request and decode its JSON response
+
+        Raises:
+            Exception: If the response status is not 2xx (same message as utils.make_request)
+
+        Returns:
+            dict or list: Response data
+        """
+        status, text = await self.request(method, url, headers=headers, json_data=json_data)
+        if status < 200 or status >= 300:
+            error_preview = text[:200] + "..." if len(text) > 200 else text
+            raise Exception(f"HTTP Error {status}: {error_preview}")
+        return json.loads(text) if text else {}
+
+    async def xray_token(self, force_refresh=False):
+        """
+        Get the Xray API token, shared with the synchronous client cache
+
+        Args:
+            force_refresh (bool, optional): Ignore the cache and authenticate again
+
+        Returns:
+            str: Authentication token
+        """
+        token = None if force_refresh else get_cached_xray_auth_token()
+        if token:
+            return token
+
+        async with self._auth_lock:
+            token = None if force_refresh else get_cached_xray_auth_token()
+            if token:
+                return token
+            logger.info("Obtaining Xray API authentication token")
+            auth_data = {
+                "client_id": settings.xray["client_id"],
+                "client_secret": settings.xray["client_secret"]
+            }
+            status, text = await self.request('POST', f"{XRAY_API_URL}/authenticate", headers={'Content-Type': 'application/json'}, json_data=auth_data)
+            if status != 200:
+                raise Exception(f"Error obtaining Xray API token: HTTP {status}")
+            token = text.strip('"')
+            store_xray_auth_token(token)
+            return token
+
+    async def xray_request(self, method, url, json_data=None):
+        """
+        Send an authenticated request to the Xray API, re-authenticating once on 401
+
+        Returns:
+            dict or list: Response data
+        """
+        token = await self.xray_token()
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'}
+        status, text = await self.request(method, url, headers=headers, json_data=json_data)
+
+        if status == 401:
+            logger.info("Xray API token rejected, re-authenticating")
+            invalidate_xray_auth_token(token)
+            headers['Authorization'] = f'Bearer {await self.xray_token(force_refresh=True)}'
+            status, text = await self.request(method, url, headers=headers, json_data=json_data)
+
+        if status < 200 or status >= 300:
+            raise Exception(f"HTTP Error {status}: {text[:200]}")
+        return json.loads(text) if text else {}
+
+def _jira_headers():
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': settings.jira['authToken']
+    }
+
+async def get_jira_issue_async(client, issue_key):
+    """
+    Async counterpart of jira_client.get_jira_issue
+
+    Args:
+        client (AsyncHttpClient): Shared HTTP client
+        issue_key (str): The key of the Jira issue
+
+    Returns:
+        dict: Issue details
+    """
+    url = f"https://{settings.jira['baseUrl']}{settings.jira['apiEndpoint']}/issue/{issue_key}?expand=renderedFields"
+    return await client.request_json('GET', url, headers=_jira_headers())
+
+async def search_jira_issues_async(client, jql, fields=None, page_size=100):
+    """
+    Async counterpart of jira_client.search_jira_issues
+
+    Yields:
+        dict: Issue details, one issue at a time
+    """
+    start_at = 0
+    while True:
+        page = await client.request_json('GET', build_search_url(jql, fields, False, start_at, page_size), headers=_jira_headers())
+        for warning in page.get("warningMessages", []):
+            logger.warning(f"Jira search warning: {warning}")
+
+        issues = page.get("issues", [])
+        for issue in issues:
+            yield issue
+
+        start_at += len(issues)
+        if not issues or start_at >= page.get("total", 0):
+            break
+
+async def get_jira_issues_async(client, issue_keys, fields=None):
+    """
+    Async counterpart of jira_client.get_jira_issues
+
+    Yields:
+        dict: Issue details, one issue at a time (unknown keys are skipped)
+    """
+    issue_keys = list(issue_keys)
+    for i in range(0, len(issue_keys), MAX_KEYS_PER_QUERY):
+        chunk = issue_keys[i:i + MAX_KEYS_PER_QUERY]
+        found = set()
+        async for issue in search_jira_issues_async(client, f"key in ({', '.join(chunk)})", fields):
+            found.add(issue["key"])
+            yield issue
+
+        missing = [key for key in chunk if key not in found]
+        if missing:
+            logger.warning(f"Jira issues not found: {', '.join(missing)}")
+
+async def analyze_with_claude_async(client, user_story):
+    """
+    Async counterpart of claude_client.analyze_with_claude
+
+    Args:
+        client (AsyncHttpClient): Shared HTTP client
+        user_story (dict): The user story to analyze
+
+    Returns:
+        list: Generated test cases
+    """
+    logger.info('Calling Claude API to analyze the user story and generate test cases...')
+
+    try:
+        # La construction du prompt lit la base de connaissances: hors de la boucle d'événements
+        url, headers, claude_request_data = await asyncio.to_thread(build_claude_request, user_story)
+        cached_test_cases = await asyncio.to_thread(get_cached_test_cases, claude_request_data)
+        if cached_test_cases:
+            return cached_test_cases
+        claude_response = await client.request_json('POST', url, headers=headers, json_data=claude_request_data)
+        while needs_continuation(claude_response, claude_response['content'][0]['text'], claude_response.get('continuations', 0)):
+            continuation_data = build_continuation_request(claude_request_data, claude_response['content'][0]['text'])
+            continuation_response = await client.request_json('POST', url, headers=headers, json_data=continuation_data)
+            claude_response = merge_continuation(claude_response, continuation_response)
+        return await asyncio.to_thread(extract_test_cases_from_response, claude_response, claude_request_data)
+    except Exception as error:
+        logger.error(f'Error calling Claude API: {str(error)}')
+        logger.info('Using fallback test case generation since Claude API call failed')
+        return generate_fallback_test_cases(user_story)
+
+async def analyze_with_claude_streaming_async(client, user_story, on_test_case=None):
+    """
+    Async counterpart of claude_client.analyze_with_claude_streaming
+
+    Args:
+        client (AsyncHttpClient): Shared HTTP client
+        user_story (dict): The user story to analyze
+        on_test_case (callable, optional): Called on the event loop with each test case as it is completed
+
+    Returns:
+        list: Generated test cases
+    """
+    logger.info('Calling Claude API in streaming mode to analyze the user story...')
+
+    test_cases = []
+    def emit(test_case):
+        test_cases.append(test_case)
+        if on_test_case:
+            on_test_case(test_case)
+
+    try:
+        url, headers, claude_request_data = await asyncio.to_thread(build_claude_request, user_story)
+        cached_test_cases = await asyncio.to_thread(get_cached_test_cases, claude_request_data)
+        if cached_test_cases:
+            for test_case in cached_test_cases:
+                emit(test_case)
+            return test_cases
+
+        stream = StreamedClaudeResponse()
+        request_data = claude_request_data
+        while request_data is not None:
+            async for event in client.stream_events('POST', url, headers=headers, json_data=dict(request_data, stream=True)):
+                for test_case in stream.add_event(event):
+                    emit(test_case)
+            request_data = stream.continuation_request(claude_request_data)
+
+        for test_case in stream.close():
+            emit(test_case)
+        await asyncio.to_thread(save_claude_response, stream.message, claude_request_data)
+
+        if not test_cases:
+            for test_case in build_default_test_cases():
+                emit(test_case)
+            return test_cases
+        logger.info(f"Successfully streamed {len(test_cases)} test cases from Claude response")
+        if stream.message.get('stop_reason') != "max_tokens":
+            await asyncio.to_thread(store_generation, claude_request_data, stream.text)
+        return test_cases
+    except Exception as error:
+        logger.error(f'Error calling Claude API: {str(error)}')
+        if test_cases:
+            # Les test cases déjà transmis sont conservés
+            logger.warning(f"Claude stream interrupted, keeping the {len(test_cases)} test cases already received")
+            return test_cases
+
+        logger.info('Using fallback test case generation since Claude API call failed')
+        for test_case in generate_fallback_test_cases(user_story):
+            emit(test_case)
+        return test_cases
+
+async def bulk_import_test_cases_async(test_cases, user_story_key):
+    """
+    Import the test cases of a story through the shared bulk import engine without blocking the event loop
+
+    The test cases go into the chunks shared with the other stories of the
+    process (see bulk_import.BulkImportEngine).
+
+    Args:
+        test_cases (list): Test cases to import
+        user_story_key (str): Key of the user story the created tests are linked to
+
+    Returns:
+        dict: Merged import result, with the key of each test case in "testKeys"
+    """
+    return await asyncio.wrap_future(get_bulk_import_engine().submit(test_cases, user_story_key))
+
+async def generate_test_cases_from_user_story_async(client, user_story_key, user_story=None):
+    """
+    Async counterpart of generator.generate_test_cases_from_user_story
+
+    Args:
+        client (AsyncHttpClient): Shared HTTP client
+        user_story_key (str): The key of the user story
+        user_story (dict, optional): User story details already fetched from Jira
+
+    Returns:
+        dict: Generation results
+    """
+    logger.info(f"Generating test cases for user story: {user_story_key}")
+
+    if user_story is None:
+        user_story = await get_jira_issue_async(client, user_story_key)
+
+    if settings.generator.get("incremental", False):
+        # Mode propre au générateur synchrone (manifeste par scénario): la story y est traitée entière, dans un thread
+        return await asyncio.to_thread(generate_test_cases_from_user_story, user_story_key, user_story)
+
+    # L'import individuel et l'upsert restent sur le client synchrone
+    async_import = settings.xray.get("use_bulk_import", False) and not settings.xray.get("upsert", False)
+
+    context, blocks = split_story_blocks(user_story['fields']['description'])
+    if settings.generator.get("shardScenarios", False) and len(blocks) >= 2:
+        # Un scénario par requête; la concurrence reste bornée par hôte
+        shards = await asyncio.gather(*(analyze_with_claude_async(client, build_scenario_story(user_story, context, block))
+                                        for block in blocks))
+        test_cases = merge_scenario_test_cases(list(zip(blocks, shards)), user_story['fields']['summary'])
+    elif settings.claude.get("stream", False):
+        if async_import:
+            return await generate_test_cases_streaming_async(client, user_story_key, user_story)
+        test_cases = await analyze_with_claude_streaming_async(client, user_story)
+    else:
+        test_cases = await analyze_with_claude_async(client, user_story)
+    logger.info(f"Generated {len(test_cases)} test cases for {user_story_key}")
+
+    if not async_import:
+        # L'import individuel et l'upsert restent sur le client synchrone
+        return await asyncio.to_thread(process_generated_test_cases, user_story_key, user_story, test_cases)
+
+    test_cases, duplicates = collapse_near_duplicates(test_cases, user_story['fields']['summary'])
+
+    def save_all():
+        output_dir = prepare_output_directory(user_story)
+        return [save_test_case(test_case, user_story, output_dir) for test_case in test_cases]
+
+    results = await asyncio.to_thread(save_all)
+    bulk_import_result = None
+    try:
+        bulk_import_result = await bulk_import_test_cases_async(test_cases, user_story_key)
+        apply_import_result(results, bulk_import_result)
+    except Exception as error:
+        logger.error(f"Error during test case import: {str(error)}")
+        for result in results:
+            result["error"] = str(error)
+    generation_result = build_generation_result(user_story_key, user_story, results, bulk_import_result)
+    if duplicates:
+        generation_result["duplicates"] = duplicates
+    return generation_result
+
+async def generate_test_cases_streaming_async(client, user_story_key, user_story):
+    """
+    Async counterpart of generator.generate_test_cases_streaming (bulk import only)
+
+    Test cases are imported by chunks of xray["streamImportChunkSize"] while
+    Claude is still generating the following ones.
+
+    Args:
+        client (AsyncHttpClient): Shared HTTP client
+        user_story_key (str): The key of the user story
+        user_story (dict): User story details
+
+    Returns:
+        dict: Generation results
+    """
+    chunk_size = max(1, settings.xray.get("streamImportChunkSize", 10))
+    output_dir = await asyncio.to_thread(prepare_output_directory, user_story)
+    duplicates = NearDuplicateFilter(user_story['fields']['summary'])
+    pending = []
+    imports = []      # Tâches d'import des lots, dans l'ordre des test cases
+
+    async def import_chunk(chunk):
+        results = await asyncio.to_thread(lambda: [save_test_case(test_case, user_story, output_dir) for test_case in chunk])
+        try:
+            return results, await bulk_import_test_cases_async(chunk, user_story_key)
+        except Exception as error:
+            logger.error(f"Error during test case import: {str(error)}")
+            for result in results:
+                result["error"] = str(error)
+            return results, None
+
+    def submit_chunk():
+        imports.append(asyncio.create_task(import_chunk(list(pending))))
+        pending.clear()
+
+    def on_test_case(test_case):
+        # Un quasi-doublon d'un test déjà reçu n'est ni enregistré ni importé
+        if settings.dedup.get("enabled", True) and duplicates.add(test_case) is not None:
+            return
+        pending.append(test_case)
+        if len(pending) >= chunk_size:
+            submit_chunk()
+
+    test_cases = await analyze_with_claude_streaming_async(client, user_story, on_test_case)
+    logger.info(f"Generated {len(test_cases)} test cases for {user_story_key}")
+    if pending:
+        submit_chunk()
+
+    results = []
+    bulk_import_results = []
+    for chunk_results, import_result in await asyncio.gather(*imports):
+        results.extend(chunk_results)
+        if import_result is not None:
+            apply_import_result(chunk_results, import_result)
+            bulk_import_results.append(import_result)
+
+    generation_result = build_generation_result(user_story_key, user_story, results,
+                                                bulk_import_results[0] if len(bulk_import_results) == 1 else None)
+    if len(bulk_import_results) > 1:
+        generation_result["importJobs"] = [
+            {"jobId": r.get("jobId"), "status": r.get("status"), "success": r["success"]}
+            for r in bulk_import_results
+        ]
+    if duplicates.report:
+        generation_result["duplicates"] = duplicates.report
+    return generation_result
+
+async def _process_story_async(client, user_story_key, user_story):
+    start_time = time.monotonic()
+    try:
+        results = await generate_test_cases_from_user_story_async(client, user_story_key, user_story)
+        story_result = build_story_result(user_story_key, results, start_time)
+        await asyncio.to_thread(record_story_processed, user_story, story_result)
+        return story_result
+    except Exception as error:
+        logger.error(f"Error processing user story {user_story_key}: {str(error)}")
+        return build_story_error(user_story_key, str(error), start_time)
+
+async def _run_batch_async(client, issues, max_in_flight):
+    """
+    Process an async stream of user stories with at most max_in_flight stories at a time
+
+    Returns:
+        tuple: (story results indexed by key, keys in the order received from Jira)
+    """
+    stories = {}
+    order = []
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+
+    async def run(issue):
+        try:
+            record_story_result(await _process_story_async(client, issue["key"], issue), stories)
+        finally:
+            in_flight.release()
+
+    async for issue in issues:
+        # Ne lire la story suivante que lorsqu'une place se libère
+        await in_flight.acquire()
+        order.append(issue["key"])
+        task = asyncio.create_task(run(issue))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    return stories, order
+
+async def generate_test_cases_for_stories_async(user_story_keys=None, jql=None, max_in_flight=None, changed_only=False):
+    """
+    Generate test cases for many user stories on a single event loop
+
+    Args:
+        user_story_keys (list, optional): Keys of the user stories to process
+        jql (str, optional): JQL query selecting the user stories (used if no keys are given)
+        max_in_flight (int, optional): Maximum number of stories processed at the same time.
+            Defaults to settings.async_pipeline["maxStoriesInFlight"].
+        changed_only (bool): Skip the stories unchanged since their last generation
+
+    Returns:
+        dict: Aggregated batch summary, in the same format as batch.generate_test_cases_for_stories
+    """
+    if max_in_flight is None:
+        max_in_flight = settings.async_pipeline.get("maxStoriesInFlight", 100)
+    max_in_flight = max(1, max_in_flight)
+
+    logger.info(f"Starting async batch generation with up to {max_in_flight} stories in flight")
+    if settings.generator.get("incremental", False):
+        # Les stories confiées au générateur synchrone occupent chacune un thread
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="async-story"))
+    start_time = time.monotonic()
+
+    unchanged = set()
+    if changed_only:
+        # Vérification légère (champ updated seulement) avec le client synchrone
+        if user_story_keys is None:
+            user_story_keys = await asyncio.to_thread(search_jira_issue_keys, jql)
+        changed, skipped = await asyncio.to_thread(select_changed_stories, user_story_keys)
+        unchanged = set(skipped)
+
+    async with AsyncHttpClient() as client:
+        if user_story_keys is not None:
+            keys_to_process = [key for key in user_story_keys if key not in unchanged]
+            stories, _ = await _run_batch_async(client, get_jira_issues_async(client, keys_to_process), max_in_flight)
+            ordered = []
+            for key in user_story_keys:
+                if key in stories:
+                    ordered.append(stories[key])
+                elif key in unchanged:
+                    ordered.append(build_story_skipped(key))
+                else:
+                    ordered.append(build_story_error(key, "User story not found in Jira"))
+        else:
+            stories, order = await _run_batch_async(client, search_jira_issues_async(client, jql), max_in_flight)
+            ordered = [stories[key] for key in order]
+
+    return summarize_batch(ordered, start_time)
@@ -0,0 +1,328 @@
+# Batch processing of several user stories for the Test Case Generator
+import logging
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from jira_client import search_jira_issues, search_jira_issue_keys, get_jira_issues
+from issue_cache import is_issue_processed, mark_issue_processed, get_issue_updated
+from generator import generate_test_cases_from_user_story
+from utils import get_pool_stats, log_pool_stats
+
+logger = logging.getLogger(__name__)
+
+def load_story_keys_from_file(file_path):
+    """
+    Lire une liste de clés de user stories depuis un fichier texte
+
+    Args:
+        file_path (str): Chemin du fichier (une clé par ligne, ou séparées par des virgules)
+
+    Returns:
+        list: Clés des user stories, sans doublons et dans l'ordre du fichier
+    """
+    keys = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            # Ignorer les commentaires et les lignes vides
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            for key in line.replace(';', ',').split(','):
+                key = key.strip().upper()
+                if key and key not in keys:
+                    keys.append(key)
+
+    logger.info(f"Loaded {len(keys)} user story keys from {file_path}")
+    return keys
+
+def build_story_result(user_story_key, results, start_time):
+    """
+    Construire l'entrée du résumé de batch pour une story traitée
+
+    Args:
+        user_story_key (str): La clé de la user story
+        results (dict): Résultat de la génération
+        start_time (float): Début du traitement (time.monotonic())
+
+    Returns:
+        dict: Entrée du résumé de batch
+    """
+    test_cases = results.get("testCases", [])
+    return {
+        "userStory": user_story_key,
+        "success": True,
+        "title": results.get("title"),
+        "generated": len(test_cases),
+        "imported": sum(1 for tc in test_cases if tc.get("success")),
+        "results": results,
+        "duration": time.monotonic() - start_time
+    }
+
+def build_story_error(user_story_key, error, start_time=None):
+    """
+    Construire l'entrée du résumé de batch pour une story en échec
+
+    Args:
+        user_story_key (str): La clé de la user story
+        error (str): Message d'erreur
+        start_time (float, optional): Début du traitement (time.monotonic())
+
+    Returns:
+        dict: Entrée du résumé de batch
+    """
+    return {
+        "userStory": user_story_key,
+        "success": False,
+        "error": error,
+        "generated": 0,
+        "imported": 0,
+        "duration": time.monotonic() - start_time if start_time is not None else 0.0
+    }
+
+def build_story_skipped(user_story_key):
+    """
+    Construire l'entrée du résumé de batch pour une story inchangée depuis la dernière génération
+
+    Args:
+        user_story_key (str): La clé de la user story
+
+    Returns:
+        dict: Entrée du résumé de batch
+    """
+    return {
+        "userStory": user_story_key,
+        "success": True,
+        "skipped": True,
+        "generated": 0,
+        "imported": 0,
+        "duration": 0.0
+    }
+
+def select_changed_stories(user_story_keys):
+    """
+    Trouver les user stories modifiées depuis la dernière génération de leurs test cases
+
+    Seul le champ updated est demandé à Jira, ce qui rend la vérification peu coûteuse.
+
+    Args:
+        user_story_keys (list): Clés des user stories à vérifier
+
+    Returns:
+        tuple: (clés à traiter, clés inchangées), dans l'ordre des clés
+    """
+    unchanged = set()
+    for issue in get_jira_issues(user_story_keys, fields=["updated"]):
+        if is_issue_processed(issue["key"], get_issue_updated(issue)):
+            unchanged.add(issue["key"])
+
+    changed = [key for key in user_story_keys if key not in unchanged]
+    logger.info(f"{len(changed)} user stories changed since their last generation, {len(unchanged)} unchanged")
+    return changed, [key for key in user_story_keys if key in unchanged]
+
+def record_story_processed(user_story, story_result):
+    """
+    Mémoriser dans le cache la version d'une story dont tous les test cases ont été importés
+
+    Args:
+        user_story (dict): Détails de la user story
+        story_result (dict): Entrée du résumé de batch
+    """
+    if story_result["success"] and story_result["generated"] and story_result["imported"] == story_result["generated"]:
+        mark_issue_processed(user_story)
+
+def _process_story(user_story_key, user_story=None):
+    """
+    Traiter une user story en isolant ses erreurs du reste du batch
+
+    Args:
+        user_story_key (str): La clé de la user story
+        user_story (dict, optional): Détails de la user story déjà récupérés depuis Jira
+
+    Returns:
+        dict: Résultat de la génération, avec le statut et la durée du traitement
+    """
+    start_time = time.monotonic()
+    try:
+        results = generate_test_cases_from_user_story(user_story_key, user_story)
+        story_result = build_story_result(user_story_key, results, start_time)
+        if user_story is not None:
+            record_story_processed(user_story, story_result)
+        return story_result
+    except Exception as error:
+        logger.error(f"Error processing user story {user_story_key}: {str(error)}")
+        return build_story_error(user_story_key, str(error), start_time)
+
+def _run_batch(issues, max_workers):
+    """
+    Traiter un flux de user stories avec un nombre borné de workers
+
+    Les issues sont consommées au fur et à mesure: au plus deux fois plus de
+    stories que de workers sont en attente, de sorte qu'un grand backlog n'est
+    jamais entièrement chargé en mémoire.
+
+    Args:
+        issues (iterable): User stories récupérées depuis Jira
+        max_workers (int): Nombre de stories traitées simultanément
+
+    Returns:
+        dict: Résultat de chaque story, indexé par sa clé
+    """
+    stories = {}
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="story") as executor:
+        for issue in issues:
+            pending.add(executor.submit(_process_story, issue["key"], issue))
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done, stories)
+        _collect(wait(pending).done, stories)
+    return stories
+
+def _collect(futures, stories):
+    """Enregistrer les résultats des stories terminées"""
+    for future in futures:
+        record_story_result(future.result(), stories)
+
+def record_story_result(story_result, stories):
+    """
+    Enregistrer le résultat d'une story terminée
+
+    Args:
+        story_result (dict): Entrée du résumé de batch
+        stories (dict): Résultats déjà enregistrés, indexés par clé (mis à jour)
+    """
+    stories[story_result["userStory"]] = story_result
+    status = "done" if story_result["success"] else "failed"
+    logger.info(f"[{len(stories)}] {story_result['userStory']} {status} in {story_result['duration']:.1f}s")
+
+def summarize_batch(ordered, start_time):
+    """
+    Construire le résumé agrégé d'un batch
+
+    Args:
+        ordered (list): Entrées des stories, dans l'ordre à afficher
+        start_time (float): Début du batch (time.monotonic())
+
+    Returns:
+        dict: Résumé agrégé du batch
+    """
+    summary = {
+        "stories": ordered,
+        "total": len(ordered),
+        "succeeded": sum(1 for s in ordered if s["success"] and not s.get("skipped")),
+        "skipped": sum(1 for s in ordered if s.get("skipped")),
+        "failed": sum(1 for s in ordered if not s["success"]),
+        "generated": sum(s["generated"] for s in ordered),
+        "imported": sum(s["imported"] for s in ordered),
+        "duration": time.monotonic() - start_time,
+        "httpPools": get_pool_stats()
+    }
+    log_pool_stats()
+    logger.info(f"Batch completed in {summary['duration']:.1f}s: {summary['succeeded']} succeeded, {summary['failed']} failed")
+    return summary
+
+def generate_test_cases_for_stories(user_story_keys, max_workers=None, changed_only=False):
+    """
+    Générer les test cases de plusieurs user stories en parallèle
+
+    Les user stories sont récupérées par paquets via la recherche Jira plutôt
+    qu'une requête par story.
+
+    Args:
+        user_story_keys (list): Clés des user stories à traiter
+        max_workers (int, optional): Nombre de stories traitées simultanément.
+            Par défaut la valeur de settings.generator["batchWorkers"].
+        changed_only (bool): Ignorer les stories inchangées depuis la dernière génération
+
+    Returns:
+        dict: Résumé agrégé du batch avec le détail de chaque story, dans l'ordre des clés
+    """
+    if max_workers is None:
+        max_workers = settings.generator.get("batchWorkers", 4)
+    max_workers = max(1, min(max_workers, len(user_story_keys) or 1))
+
+    logger.info(f"Starting batch generation for {len(user_story_keys)} user stories with {max_workers} workers")
+    start_time = time.monotonic()
+
+    keys_to_process = user_story_keys
+    unchanged = set()
+    if changed_only:
+        keys_to_process, unchanged = select_changed_stories(user_story_keys)
+        unchanged = set(unchanged)
+
+    stories = _run_batch(get_jira_issues(keys_to_process), max_workers)
+
+    ordered = []
+    for key in user_story_keys:
+        if key in stories:
+            ordered.append(stories[key])
+        elif key in unchanged:
+            ordered.append(build_story_skipped(key))
+        else:
+            ordered.append(build_story_error(key, "User story not found in Jira"))
+    return summarize_batch(ordered, start_time)
+
+def generate_test_cases_for_jql(jql, max_workers=None, changed_only=False):
+    """
+    Générer les test cases de toutes les user stories correspondant à une requête JQL
+
+    Args:
+        jql (str): Requête JQL sélectionnant les user stories
+        max_workers (int, optional): Nombre de stories traitées simultanément
+        changed_only (bool): Ignorer les stories inchangées depuis la dernière génération
+
+    Returns:
+        dict: Résumé agrégé du batch, dans l'ordre retourné par Jira
+    """
+    if changed_only:
+        return generate_test_cases_for_stories(search_jira_issue_keys(jql), max_workers, changed_only=True)
+
+    if max_workers is None:
+        max_workers = settings.generator.get("batchWorkers", 4)
+    max_workers = max(1, max_workers)
+
+    logger.info(f"Starting batch generation for JQL query with {max_workers} workers")
+    start_time = time.monotonic()
+
+    # Mémoriser l'ordre de Jira au passage, les stories se terminant dans le désordre
+    order = []
+    def ordered_issues():
+        for issue in search_jira_issues(jql):
+            order.append(issue["key"])
+            yield issue
+
+    stories = _run_batch(ordered_issues(), max_workers)
+    return summarize_batch([stories[key] for key in order], start_time)
+
+def print_batch_summary(summary):
+    """
+    Afficher le résumé d'un batch dans la console
+
+    Args:
+        summary (dict): Résumé retourné par generate_test_cases_for_stories
+    """
+    print('\n======== BATCH SUMMARY ========')
+    print(f"User Stories: {summary['total']} (succeeded: {summary['succeeded']}, failed: {summary['failed']}, unchanged: {summary.get('skipped', 0)})")
+    print(f"Test Cases Generated: {summary['generated']}")
+    print(f"Successfully Imported: {summary['imported']}")
+    print(f"Duration: {summary['duration']:.1f}s")
+    for host, pool in summary.get('httpPools', {}).items():
+        print(f"HTTP {host}: {pool['requests']} requests, {pool['connections']} connections, {pool['retries']} retries")
+
+    print('\n======== USER STORIES ========')
+    for i, story in enumerate(summary['stories']):
+        if story.get('skipped'):
+            print(f"{i + 1}. {story['userStory']} -> Unchanged since last generation, skipped")
+        elif story['success']:
+            print(f"{i + 1}. {story['userStory']} ({story['title']}) -> {story['imported']}/{story['generated']} imported")
+        else:
+            print(f"{i + 1}. {story['userStory']} -> Failed: {story['error']}")
@@ -0,0 +1,230 @@
+# Chunked and concurrent Xray bulk import, shared by all the stories of the process
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from xray_client import import_xray_tests_chunk, link_tests_to_story
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+class _ImportGroup:
+    """Test cases of one story submitted together, with the outcome of each one"""
+
+    def __init__(self, test_cases, user_story_key):
+        self.test_cases = test_cases
+        self.user_story_key = user_story_key
+        self.keys = [None] * len(test_cases)
+        self.errors = [None] * len(test_cases)
+        self.jobs = []
+        self.remaining = len(test_cases)
+        self.finished = False  # Résultat ou erreur déjà transmis au future
+        self.future = Future()
+
+    def build_result(self):
+        """
+        Merge the outcomes of the chunks into one import result
+
+        Returns:
+            dict: Result in the format of xray_client.import_test_cases_to_xray, plus
+                "testKeys" (key of each test case in the submitted order, None if it
+                was not created) and "jobIds" (every bulk import job, "jobId" being the first)
+        """
+        imported = [key for key in self.keys if key]
+        errors = [{"elementNumber": i, "errors": error} for i, error in enumerate(self.errors) if error is not None]
+        job_ids = [job_id for job_id, _ in self.jobs if job_id]
+        if len(imported) == len(self.keys):
+            status = "successful"
+        elif imported:
+            status = "partially_successful"
+        else:
+            status = "unsuccessful"
+        result = {
+            "success": bool(imported) or not self.keys,
+            "jobIds": job_ids,
+            "status": status,
+            "importedTests": imported,
+            "testKeys": list(self.keys),
+            "errors": errors,
+            "message": f"Import completed. Successfully imported: {len(imported)}, Failed: {len(errors)}"
+        }
+        if job_ids:
+            result["jobId"] = job_ids[0]
+        return result
+
+class BulkImportEngine:
+    """
+    Import test cases into Xray by chunks, across stories
+
+    Test cases submitted by any story are queued and sent by chunks of
+    xray["bulkImportChunkSize"], so a chunk may hold the test cases of several
+    stories and a large story is split over several jobs. At most
+    xray["bulkImportWorkers"] chunks are imported at the same time. A chunk that
+    is not full is sent once no test case was queued for
+    xray["bulkImportLinger"] seconds. Each story gets back a single result with
+    the keys in the order of its test cases, whatever the chunks they went into.
+    """
+
+    def __init__(self, chunk_size=None, max_workers=None, linger=None):
+        """
+        Initialize the engine
+
+        Args:
+            chunk_size (int, optional): Test cases per bulk import. Defaults to xray["bulkImportChunkSize"].
+            max_workers (int, optional): Chunks imported concurrently. Defaults to xray["bulkImportWorkers"].
+            linger (float, optional): Seconds a chunk that is not full waits for more test cases.
+                Defaults to xray["bulkImportLinger"].
+        """
+        self.chunk_size = max(1, chunk_size or settings.xray.get("bulkImportChunkSize", 50))
+        self.linger = settings.xray.get("bulkImportLinger", 0.5) if linger is None else linger
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers or settings.xray.get("bulkImportWorkers", 4)),
+                                            thread_name_prefix="bulk-import")
+        self._lock = threading.Lock()
+        self._pending = []  # (groupe, position du test case dans le groupe)
+        self._timer = None
+
+    def submit(self, test_cases, user_story_key):
+        """
+        Queue the test cases of a story for import
+
+        Args:
+            test_cases (list): Test cases to import
+            user_story_key (str): Key of the user story the created tests are linked to
+
+        Returns:
+            concurrent.futures.Future: Resolves to the merged import result of these test cases
+        """
+        group = _ImportGroup(list(test_cases), user_story_key)
+        if not group.test_cases:
+            group.future.set_result(group.build_result())
+            return group.future
+
+        logger.info(f"Queueing {len(group.test_cases)} test cases of {user_story_key} for bulk import")
+        with self._lock:
+            self._pending.extend((group, i) for i in range(len(group.test_cases)))
+            while len(self._pending) >= self.chunk_size:
+                self._submit_chunk(self._pending[:self.chunk_size])
+                del self._pending[:self.chunk_size]
+            self._schedule_flush()
+        return group.future
+
+    def flush(self):
+        """Send the queued test cases now, even if they do not fill a chunk"""
+        with self._lock:
+            if self._pending:
+                self._submit_chunk(self._pending)
+                self._pending = []
+
+    def _schedule_flush(self):
+        # Appelé avec le verrou: repousser l'envoi du lot incomplet à chaque nouveau test case
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        if self.linger <= 0:
+            self._submit_chunk(self._pending)
+            self._pending = []
+            return
+        self._timer = threading.Timer(self.linger, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _submit_chunk(self, chunk):
+        stories = len({group.user_story_key for group, _ in chunk})
+        logger.info(f"Submitting a bulk import chunk of {len(chunk)} test cases from {stories} stories")
+        self._executor.submit(self._import_chunk, list(chunk))
+
+    def _import_chunk(self, chunk):
+        try:
+            completed = self._record_chunk(chunk, self._run_chunk(chunk))
+        except Exception as e:
+            # Sans cela, les stories du lot attendraient leur résultat indéfiniment
+            logger.error(f"Unexpected error completing a bulk import chunk: {str(e)}")
+            with self._lock:
+                failed = list({id(group): group for group, _ in chunk if not group.finished}.values())
+                for group in failed:
+                    group.finished = True
+            for group in failed:
+                group.future.set_exception(e)
+            return
+        for group in completed:
+            group.future.set_result(group.build_result())
+
+    def _run_chunk(self, chunk):
+        test_cases = [group.test_cases[i] for group, i in chunk]
+        try:
+            outcome = import_xray_tests_chunk(test_cases)
+        except Exception as e:
+            logger.error(f"Error importing a chunk of {len(chunk)} test cases to Xray: {str(e)}")
+            return {"keys": [None] * len(chunk), "errors": {}, "jobId": None, "status": "error", "message": str(e)}
+
+        # Lier les tests créés à leur story, une story à la fois
+        created = {}
+        for (group, _), key in zip(chunk, outcome["keys"]):
+            if key:
+                created.setdefault(group.user_story_key, []).append(key)
+        for user_story_key, keys in created.items():
+            try:
+                link_tests_to_story(keys, user_story_key)
+            except Exception as e:
+                # Les tests sont créés: garder leurs clés même sans lien
+                logger.error(f"Error linking {len(keys)} tests to {user_story_key}: {str(e)}")
+        return outcome
+
+    def _record_chunk(self, chunk, outcome):
+        # Reporter le résultat de chaque test case dans son groupe; retourne les groupes terminés
+        if len(outcome["keys"]) != len(chunk):
+            raise Exception(f"Import of a chunk of {len(chunk)} test cases returned {len(outcome['keys'])} keys")
+        default_error = outcome.get("message") or f"Test not created by import job (status: {outcome['status']})"
+        completed = []
+        with self._lock:
+            for position, ((group, i), key) in enumerate(zip(chunk, outcome["keys"])):
+                group.keys[i] = key
+                if not key:
+                    group.errors[i] = outcome["errors"].get(position, default_error)
+                if (outcome["jobId"], outcome["status"]) not in group.jobs:
+                    group.jobs.append((outcome["jobId"], outcome["status"]))
+                group.remaining -= 1
+                if group.remaining == 0 and not group.finished:
+                    group.finished = True
+                    completed.append(group)
+        return completed
+
+def get_bulk_import_engine():
+    """
+    Get the bulk import engine shared by all the stories of the process
+
+    Returns:
+        BulkImportEngine: The engine, created on first use
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = BulkImportEngine()
+    return _engine
+
+def bulk_import_test_cases(test_cases, user_story_key):
+    """
+    Import the test cases of a story through the shared engine and wait for the result
+
+    Args:
+        test_cases (list): Test cases to import
+        user_story_key (str): Key of the user story the created tests are linked to
+
+    Returns:
+        dict: Merged import result (see BulkImportEngine.submit)
+    """
+    return get_bulk_import_engine().submit(test_cases, user_story_key).result()
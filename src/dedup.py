@@ -0,0 +1,175 @@
+# Near-duplicate detection of generated test cases
+import logging
+import re
+import sys
+import os
+import zlib
+
+import numpy as np
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from scenarios import NUMBERING_REGEX
+
+logger = logging.getLogger(__name__)
+
+# Nombre premier supérieur à 2^32 pour les permutations (a * x + b) mod p
+MINHASH_PRIME = 4294967311
+
+# Coefficients des permutations, par nombre de permutations
+_permutations = {}
+
+def _get_permutations(count):
+    if count not in _permutations:
+        # Graine fixe: les signatures restent comparables d'une exécution à l'autre
+        rng = np.random.default_rng(20240501)
+        _permutations[count] = (
+            rng.integers(1, 2 ** 32, size=count, dtype=np.uint64),
+            rng.integers(0, 2 ** 32, size=count, dtype=np.uint64)
+        )
+    return _permutations[count]
+
+def test_case_text(test_case, story_summary=None):
+    """
+    Get the text of a test case compared for near-duplicates
+
+    The story title and the numbering at the start of the summary are left out,
+    as well as the description, whose preconditions are often shared.
+
+    Args:
+        test_case (dict): Generated test case
+        story_summary (str, optional): Title of the story
+
+    Returns:
+        str: Summary and steps of the test case
+    """
+    summary = test_case.get("summary", "")
+    if story_summary and summary.startswith(story_summary):
+        summary = summary[len(story_summary):].lstrip(': -')
+    match = NUMBERING_REGEX.match(summary)
+    if match:
+        summary = summary[match.end():]
+
+    parts = [summary]
+    steps = test_case.get("steps")
+    if isinstance(steps, list):
+        for step in steps:
+            if isinstance(step, dict):
+                parts.extend(str(step.get(field, "")) for field in ("action", "data", "result", "expected_result"))
+    return ' '.join(parts)
+
+def shingles(text, size):
+    """
+    Split a text into word shingles
+
+    Args:
+        text (str): Text to split
+        size (int): Words per shingle
+
+    Returns:
+        set: Shingles (the whole text if it has fewer words than a shingle)
+    """
+    words = re.sub(r'[^\w]+', ' ', text.lower()).split()
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def minhash_signature(shingle_set, num_permutations):
+    """
+    Compute the MinHash signature of a set of shingles
+
+    Args:
+        shingle_set (set): Shingles of a text
+        num_permutations (int): Length of the signature
+
+    Returns:
+        numpy.ndarray: Signature (None for an empty set)
+    """
+    if not shingle_set:
+        return None
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    a, b = _get_permutations(num_permutations)
+    # a * x + b tient dans 64 bits puisque a, x et b sont inférieurs à 2^32
+    return ((np.outer(a, hashes) + b[:, None]) % MINHASH_PRIME).min(axis=1)
+
+class NearDuplicateFilter:
+    """
+    Detect the near-duplicate test cases of one story as they are generated
+
+    Each test case is compared with the test cases kept so far through the
+    MinHash signatures of their summary and steps; one whose estimated Jaccard
+    similarity with a kept test case reaches dedup["threshold"] is reported as
+    a duplicate of it.
+    """
+
+    def __init__(self, story_summary=None, threshold=None):
+        """
+        Initialize the filter
+
+        Args:
+            story_summary (str, optional): Title of the story, ignored in the summaries
+            threshold (float, optional): Similarity from which two test cases are duplicates.
+                Defaults to settings.dedup["threshold"].
+        """
+        self.story_summary = story_summary
+        self.threshold = settings.dedup.get("threshold", 0.8) if threshold is None else threshold
+        self.num_permutations = settings.dedup.get("numPermutations", 128)
+        self.shingle_size = settings.dedup.get("shingleSize", 3)
+        self.kept = []
+        self.signatures = np.empty((0, self.num_permutations), dtype=np.uint64)
+        self.report = []
+
+    def add(self, test_case):
+        """
+        Check a test case against the ones kept so far
+
+        Args:
+            test_case (dict): Generated test case
+
+        Returns:
+            dict or None: The kept test case it duplicates, or None if it is kept
+        """
+        signature = minhash_signature(shingles(test_case_text(test_case, self.story_summary), self.shingle_size),
+                                      self.num_permutations)
+        if signature is not None and len(self.kept):
+            similarities = (self.signatures == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] >= self.threshold:
+                kept = self.kept[best]
+                self.report.append({
+                    "kept": kept.get("summary", ""),
+                    "dropped": test_case.get("summary", ""),
+                    "similarity": round(float(similarities[best]), 3)
+                })
+                logger.info(f"Dropping near-duplicate test case '{test_case.get('summary', '')}' "
+                            f"({similarities[best]:.0%} similar to '{kept.get('summary', '')}')")
+                return kept
+
+        if signature is not None:
+            self.kept.append(test_case)
+            self.signatures = np.vstack([self.signatures, signature])
+        return None
+
+def collapse_near_duplicates(test_cases, story_summary=None):
+    """
+    Remove the near-duplicates from the test cases of a story, keeping the first of each group
+
+    Args:
+        test_cases (list): Generated test cases
+        story_summary (str, optional): Title of the story
+
+    Returns:
+        tuple: (kept test cases, report of the dropped ones as {"kept", "dropped", "similarity"} dicts)
+    """
+    if not settings.dedup.get("enabled", True):
+        return test_cases, []
+    duplicates = NearDuplicateFilter(story_summary)
+    kept = [test_case for test_case in test_cases if duplicates.add(test_case) is None]
+    if duplicates.report:
+        logger.info(f"Collapsed {len(duplicates.report)} near-duplicate test cases, {len(kept)} left")
+    return kept, duplicates.report
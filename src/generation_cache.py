@@ -0,0 +1,197 @@
+# On-disk cache of Claude generations for the Test Case Generator
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_eviction_lock = threading.Lock()
+# Taille totale des entrées du cache, calculée au premier stockage puis tenue à jour
+_cache_size = None
+
+def get_cache_dir():
+    """Directory of the cached Claude generations"""
+    return os.path.join(settings.generator["outputBaseDir"], settings.cache.get("claudeCacheDir", "cache/claude"))
+
+def generation_cache_key(claude_request_data):
+    """
+    Compute the cache key of a Messages API request
+
+    The key is a hash of everything that determines the generation: the final
+    prompt (system and messages), the model, the temperature and max_tokens.
+
+    Args:
+        claude_request_data (dict): Request body sent to the Messages API
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    material = {
+        "model": claude_request_data.get("model"),
+        "system": claude_request_data.get("system"),
+        "messages": claude_request_data.get("messages"),
+        "temperature": claude_request_data.get("temperature"),
+        "max_tokens": claude_request_data.get("max_tokens")
+    }
+    payload = json.dumps(material, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_paths(key):
+    base = os.path.join(get_cache_dir(), key[:2], key)
+    return base + '.json.gz', base + '.json'
+
+def get_cached_generation(claude_request_data):
+    """
+    Look up the text generated by Claude for a request
+
+    Args:
+        claude_request_data (dict): Request body sent to the Messages API
+
+    Returns:
+        str or None: The cached response text, or None on a miss or if the cache is disabled
+    """
+    if not settings.cache.get("enabled", True):
+        return None
+
+    key = generation_cache_key(claude_request_data)
+    for path in _cache_paths(key):
+        try:
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            continue
+
+        # Mettre à jour la date d'accès pour l'éviction LRU
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logger.info(f"Claude generation cache hit ({key[:12]})")
+        return entry["text"]
+
+    return None
+
+def store_generation(claude_request_data, text):
+    """
+    Store the text generated by Claude for a request, then evict old entries if needed
+
+    The cache is best-effort: an entry that cannot be written is only logged.
+
+    Args:
+        claude_request_data (dict): Request body sent to the Messages API
+        text (str): Text of the response
+
+    Returns:
+        bool: True if the entry was stored
+    """
+    if not settings.cache.get("enabled", True):
+        return False
+
+    key = generation_cache_key(claude_request_data)
+    compressed_path, plain_path = _cache_paths(key)
+    path = compressed_path if settings.cache.get("compress", False) else plain_path
+
+    entry = {
+        "model": claude_request_data.get("model"),
+        "created": time.time(),
+        "text": text
+    }
+    # Écriture atomique: un autre thread peut lire la même entrée
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f)
+        size = os.path.getsize(temp_path)
+        try:
+            replaced_size = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not store the Claude generation in cache ({key[:12]}): {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    logger.info(f"Claude generation stored in cache ({key[:12]})")
+
+    global _cache_size
+    with _eviction_lock:
+        if _cache_size is not None:
+            _cache_size += size - replaced_size
+        over_limit = _cache_size is None or _cache_size > settings.cache.get("maxSizeMB", 200) * 1024 * 1024
+    # Le répertoire n'est parcouru qu'une fois, puis seulement quand la limite est dépassée
+    if over_limit:
+        try:
+            evict_generation_cache()
+        except OSError as e:
+            logger.warning(f"Could not evict old Claude generations from cache: {e}")
+    return True
+
+def evict_generation_cache():
+    """
+    Delete the least recently used entries once the cache exceeds its size limit
+
+    Entries are deleted until the cache is back under cache["evictionTargetPercent"]
+    of the limit, so the next stores do not trigger another eviction right away.
+
+    Returns:
+        int: Number of entries deleted
+    """
+    global _cache_size
+    max_size = settings.cache.get("maxSizeMB", 200) * 1024 * 1024
+    target_size = max_size * settings.cache.get("evictionTargetPercent", 90) / 100
+    cache_dir = get_cache_dir()
+
+    with _eviction_lock:
+        entries = []
+        for root, _, files in os.walk(cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        _cache_size = total
+        if total <= max_size:
+            return 0
+
+        deleted = 0
+        for _, size, path in sorted(entries):
+            if total <= target_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            deleted += 1
+        _cache_size = total
+
+    logger.info(f"Evicted {deleted} entries from the Claude generation cache")
+    return deleted
@@ -5,6 +5,7 @@ import logging
 import re
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 # Ajouter le chemin du projet au PYTHONPATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -14,17 +15,26 @@ if parent_dir not in sys.path:
 
 from config import settings
 from jira_client import get_jira_issue, create_xray_test_case, create_issue_link
-from xray_client import import_test_cases_to_xray
-from claude_client import analyze_with_claude
+from bulk_import import bulk_import_test_cases, get_bulk_import_engine
+from claude_client import analyze_with_claude, analyze_with_claude_streaming, generate_fallback_test_cases
+from scenarios import split_story_blocks, story_context_hash, build_scenario_story, merge_scenario_test_cases
+from regeneration import load_manifest, save_manifest, plan_regeneration, build_manifest, find_stale_tests
+from dedup import NearDuplicateFilter, collapse_near_duplicates
+from upsert import StoryTestUpserter
 
 logger = logging.getLogger(__name__)
 
-def generate_test_cases_from_user_story(user_story_key):
+# Imports Xray lancés en parallèle de la génération en mode streaming
+STREAM_IMPORT_WORKERS = 4
+
+def generate_test_cases_from_user_story(user_story_key, user_story=None):
     """
     Generate test cases for a user story
     
     Args:
         user_story_key (str): The key of the user story
+        user_story (dict, optional): User story details already fetched from Jira.
+            If None, the user story is retrieved from Jira.
     
     Returns:
         dict: Generation results
@@ -33,230 +43,600 @@ def generate_test_cases_from_user_story(user_story_key):
         logger.info(f"Generating test cases for user story: {user_story_key}")
         
         # Get user story details from Jira
-        user_story = get_jira_issue(user_story_key)
+        if user_story is None:
+            user_story = get_jira_issue(user_story_key)
         logger.info(f"Retrieved user story: {user_story['fields']['summary']}")
         
-        # Create output directory based on user story title
-        folder_name = re.sub(r'[^\w\s-]', '', user_story['fields']['summary']).replace(' ', '_')
-        output_dir = os.path.join(settings.generator["outputBaseDir"], folder_name)
+        if settings.generator.get("incremental", False):
+            results = generate_test_cases_incremental(user_story_key, user_story)
+            if results is not None:
+                return results
+        
+        if settings.generator.get("shardScenarios", False):
+            test_cases = generate_sharded_test_cases(user_story)
+            if test_cases is not None:
+                logger.info(f"Generated {len(test_cases)} test cases")
+                return process_generated_test_cases(user_story_key, user_story, test_cases)
         
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        if settings.claude.get("stream", False):
+            return generate_test_cases_streaming(user_story_key, user_story)
         
         # Use Claude to analyze the user story and generate test cases
         test_cases = analyze_with_claude(user_story)
         logger.info(f"Generated {len(test_cases)} test cases")
         
-        # Save test cases to files
-        results = []
-        for test_case in test_cases:
-            # Vérifier et ajuster le format du titre si nécessaire
-            if not test_case["summary"].startswith(user_story['fields']['summary']):
-                test_case["summary"] = f"{user_story['fields']['summary']}: {test_case['summary']}"
-            
-            # Create a valid filename
-            file_name = re.sub(r'[^\w\s-]', '', test_case["summary"]).replace(' ', '_')[:100] + '.json'
-            file_path = os.path.join(output_dir, file_name)
+        return process_generated_test_cases(user_story_key, user_story, test_cases)
+    except Exception as error:
+        logger.error(f"Error generating test cases: {str(error)}")
+        raise
+
+def process_generated_test_cases(user_story_key, user_story, test_cases, deduplicate=True, upsert=None,
+                                 excluded_keys=None, candidate_keys=None):
+    """
+    Save generated test cases and import them into Xray
+    
+    Args:
+        user_story_key (str): The key of the user story
+        user_story (dict): User story details
+        test_cases (list): Test cases generated by Claude
+        deduplicate (bool, optional): Drop near-duplicate test cases first (see dedup.collapse_near_duplicates)
+        upsert (bool, optional): Update the tests already linked to the story instead of
+            creating new ones. Defaults to xray["upsert"].
+        excluded_keys (iterable, optional): Linked tests the upsert must not update
+        candidate_keys (iterable, optional): If given, the only linked tests the upsert may update
+    
+    Returns:
+        dict: Generation results
+    """
+    duplicates = []
+    if deduplicate:
+        test_cases, duplicates = collapse_near_duplicates(test_cases, user_story['fields']['summary'])
+    
+    output_dir = prepare_output_directory(user_story)
+    
+    # Save test cases to files
+    results = [save_test_case(test_case, user_story, output_dir) for test_case in test_cases]
+    
+    # En mode upsert, les tests déjà liés à la story sont mis à jour au lieu d'être recréés
+    upserter = None
+    to_create, to_create_results = test_cases, results
+    bulk_import_result = None
+    try:
+        if settings.xray.get("upsert", False) if upsert is None else upsert:
+            upserter = StoryTestUpserter(user_story_key, user_story['fields']['summary'], excluded_keys, candidate_keys)
+            created = [i for i, test_case in enumerate(test_cases) if not upserter.apply(test_case, results[i])]
+            to_create = [test_cases[i] for i in created]
+            to_create_results = [results[i] for i in created]
+        
+        # Import all test cases in bulk
+        if not to_create:
+            logger.info("No new test case to import")
+        elif settings.xray.get("use_bulk_import", False):
+            logger.info(f"Importing {len(to_create)} test cases in bulk to Xray")
+            # Découpé en lots importés en parallèle, partagés avec les autres stories du batch
+            bulk_import_result = bulk_import_test_cases(to_create, user_story_key)
+            apply_import_result(to_create_results, bulk_import_result)
+        else:
+            # Fallback to individual import if bulk import is disabled
+            logger.info("Bulk import disabled, falling back to individual import")
+            for i, test_case in enumerate(to_create):
+                import_test_case(test_case, to_create_results[i], user_story_key)
+    except Exception as error:
+        error_message = str(error)
+        logger.error(f"Error during test case import: {error_message}")
+        # Mark all test cases as failed
+        for result in results:
+            if not result.get("success"):
+                result["error"] = error_message
+    
+    generation_result = build_generation_result(user_story_key, user_story, results, bulk_import_result)
+    if upserter is not None:
+        upserter.record_created(to_create, to_create_results)
+        add_upsert_report(generation_result, upserter)
+    if duplicates:
+        generation_result["duplicates"] = duplicates
+    return generation_result
+
+def generate_test_cases_incremental(user_story_key, user_story):
+    """
+    Generate test cases only for the acceptance scenarios that changed since the last run
+    
+    Each scenario block is generated separately and the test cases it produced
+    are recorded in the manifest of the story. On the next run, the blocks whose
+    content is unchanged keep their existing Xray tests; only the added or
+    modified blocks are sent to Claude and imported. Blocks whose generation
+    fell back to basic test cases are not recorded, so they are sent to Claude
+    again on the next run. If the shared context changed, every block is
+    regenerated and the tests already linked to the story are updated rather
+    than created again. Otherwise, an upsert may only update the tests of the
+    scenarios removed or edited since the last run, never those of the
+    scenarios kept. The tests the new manifest no longer tracks are logged
+    and returned in "staleTests" so they can be cleaned up.
+    
+    Args:
+        user_story_key (str): The key of the user story
+        user_story (dict): User story details
+    
+    Returns:
+        dict or None: Generation results, or None if the story has no scenario blocks
+    """
+    context, blocks = split_story_blocks(user_story['fields']['description'])
+    if not blocks:
+        logger.info("No acceptance scenario found in the story, generating it as a whole")
+        return None
+    
+    context_hash = story_context_hash(user_story, context)
+    manifest = load_manifest(user_story_key)
+    unchanged, to_generate, removed = plan_regeneration(manifest, context_hash, blocks)
+    context_changed = bool(manifest) and manifest.get("contextHash") != context_hash
+    logger.info(f"{len(unchanged)} scenarios unchanged, {len(to_generate)} to generate")
+    for label in removed:
+        logger.info(f"{label} was removed or edited since the last run")
+    
+    # Générer les scénarios ajoutés ou modifiés, en gardant la trace du bloc d'origine
+    generated = generate_scenario_test_cases(user_story, context, to_generate)
+    
+    # Écarter les quasi-doublons avant d'aplatir, pour garder l'alignement avec les blocs
+    duplicates = NearDuplicateFilter(user_story['fields']['summary'])
+    if settings.dedup.get("enabled", True):
+        generated = [(block, [tc for tc in block_test_cases if duplicates.add(tc) is None], from_claude)
+                     for block, block_test_cases, from_claude in generated]
+    test_cases = [test_case for _, block_test_cases, _ in generated for test_case in block_test_cases]
+    
+    excluded_keys = candidate_keys = None
+    if manifest and not context_changed:
+        # Les tests des scénarios inchangés restent à eux; seuls ceux des scénarios retirés ou modifiés peuvent être mis à jour
+        excluded_keys = {tc["key"] for block in unchanged for tc in manifest["blocks"][block["key"]]["testCases"]}
+        current = {block["key"] for block in blocks}
+        candidate_keys = {tc["key"] for block_key, entry in manifest["blocks"].items() if block_key not in current
+                          for tc in entry["testCases"]} - excluded_keys
+    
+    if test_cases:
+        # Les tests du contexte précédent existent déjà dans Xray: les mettre à jour plutôt que les dupliquer
+        results = process_generated_test_cases(user_story_key, user_story, test_cases, deduplicate=False,
+                                               upsert=True if context_changed else None,
+                                               excluded_keys=excluded_keys, candidate_keys=candidate_keys)
+    else:
+        results = build_generation_result(user_story_key, user_story, [])
+    
+    # Les blocs entièrement importés sont mémorisés; les autres seront régénérés au prochain passage
+    kept = []
+    for block in unchanged:
+        entries = [
+            {"testCase": tc["summary"], "filePath": None, "success": True, "key": tc["key"], "unchanged": True}
+            for tc in manifest["blocks"][block["key"]]["testCases"]
+        ]
+        kept.append((block, entries))
+    
+    imported = []
+    offset = 0
+    for block, block_test_cases, from_claude in generated:
+        entries = results["testCases"][offset:offset + len(block_test_cases)]
+        offset += len(block_test_cases)
+        if from_claude and entries and all(entry.get("success") for entry in entries):
+            imported.append((block, entries))
+    
+    new_manifest = build_manifest(context_hash, kept + imported)
+    save_manifest(user_story_key, new_manifest)
+    
+    results["testCases"] = [entry for _, entries in kept for entry in entries] + results["testCases"]
+    results["unchangedScenarios"] = len(unchanged)
+    results["regeneratedScenarios"] = len(to_generate)
+    # Les tests de l'ancien manifeste qui ne sont plus suivis ne sont jamais supprimés: les signaler pour nettoyage
+    stale_tests = find_stale_tests(manifest, new_manifest)
+    if stale_tests:
+        logger.warning(f"Xray tests no longer tracked by any scenario of {user_story_key}, to clean up if obsolete: {', '.join(stale_tests)}")
+        results["staleTests"] = stale_tests
+    if duplicates.report:
+        results["duplicates"] = duplicates.report
+    return results
+
+def generate_scenario_test_cases(user_story, context, blocks):
+    """
+    Generate the test cases of several acceptance scenarios, one concurrent Claude request per scenario
+    
+    Args:
+        user_story (dict): User story details
+        context (str): Description text shared by the scenarios
+        blocks (list): Scenario blocks to generate
+    
+    Returns:
+        list: (block, test cases, True if Claude generated them) tuples, in the order of the blocks.
+            A block whose generation failed gets basic test cases built from its text.
+    """
+    if not blocks:
+        return []
+    
+    def generate(block):
+        logger.info(f"Generating test cases for {block['label']}")
+        scenario_story = build_scenario_story(user_story, context, block)
+        try:
+            return block, analyze_with_claude(scenario_story, allow_fallback=False), True
+        except Exception as error:
+            logger.error(f"Error generating test cases for {block['label']}: {str(error)}")
+            return block, generate_fallback_test_cases(scenario_story), False
+    
+    # Une requête Claude par scénario, en parallèle: la latence suit le plus gros scénario
+    max_workers = max(1, min(settings.generator.get("shardWorkers", 4), len(blocks)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard") as executor:
+        return list(executor.map(generate, blocks))
+
+def generate_sharded_test_cases(user_story):
+    """
+    Generate the test cases of a story with one concurrent Claude request per acceptance scenario
+    
+    Each request contains the shared context of the story and a single scenario,
+    so large stories no longer hit max_tokens. The results are merged,
+    de-duplicated and renumbered.
+    
+    Args:
+        user_story (dict): User story details
+    
+    Returns:
+        list or None: Merged test cases, or None if the story has fewer than two scenarios
+    """
+    context, blocks = split_story_blocks(user_story['fields']['description'])
+    if len(blocks) < 2:
+        return None
+    
+    logger.info(f"Splitting the story into {len(blocks)} scenario shards")
+    generated = generate_scenario_test_cases(user_story, context, blocks)
+    return merge_scenario_test_cases([(block, test_cases) for block, test_cases, _ in generated],
+                                     user_story['fields']['summary'])
+
+def generate_test_cases_streaming(user_story_key, user_story):
+    """
+    Generate test cases with a streamed Claude response
+    
+    Each test case is saved as soon as Claude has finished writing it, and is
+    imported into Xray in the background (by chunks in bulk mode) while the
+    following test cases are still being generated.
+    
+    Args:
+        user_story_key (str): The key of the user story
+        user_story (dict): User story details
+    
+    Returns:
+        dict: Generation results
+    """
+    output_dir = prepare_output_directory(user_story)
+    use_bulk_import = settings.xray.get("use_bulk_import", False)
+    chunk_size = max(1, settings.xray.get("streamImportChunkSize", 10))
+    
+    results = []
+    pending = []      # Test cases en attente d'un import en masse
+    imports = []      # (entrées de résultat, future de l'import)
+    duplicates = NearDuplicateFilter(user_story['fields']['summary'])
+    upserter = StoryTestUpserter(user_story_key, user_story['fields']['summary']) if settings.xray.get("upsert", False) else None
+    created = []      # (test case, entrée de résultat) des tests à créer
+    
+    with ThreadPoolExecutor(max_workers=STREAM_IMPORT_WORKERS, thread_name_prefix="import") as executor:
+        def submit_bulk_import():
+            entries = [result for _, result in created[-len(pending):]]
+            chunk = list(pending)
+            pending.clear()
+            logger.info(f"Importing {len(chunk)} test cases in bulk to Xray")
+            imports.append((entries, get_bulk_import_engine().submit(chunk, user_story_key)))
+        
+        def on_test_case(test_case):
+            # Un quasi-doublon d'un test déjà reçu n'est ni enregistré ni importé
+            if settings.dedup.get("enabled", True) and duplicates.add(test_case) is not None:
+                return
+            result = save_test_case(test_case, user_story, output_dir)
+            results.append(result)
+            if upserter is not None and upserter.apply(test_case, result):
+                return
+            created.append((test_case, result))
+            if use_bulk_import:
+                pending.append(test_case)
+                if len(pending) >= chunk_size:
+                    submit_bulk_import()
+            else:
+                imports.append(([result], executor.submit(import_test_case, test_case, result, user_story_key)))
+        
+        test_cases = analyze_with_claude_streaming(user_story, on_test_case)
+        logger.info(f"Generated {len(test_cases)} test cases")
+        if pending:
+            submit_bulk_import()
+        
+        bulk_import_results = []
+        for entries, future in imports:
+            try:
+                import_result = future.result()
+            except Exception as error:
+                logger.error(f"Error during test case import: {str(error)}")
+                for entry in entries:
+                    entry["error"] = str(error)
+                continue
+            if use_bulk_import:
+                apply_import_result(entries, import_result)
+                bulk_import_results.append(import_result)
+    
+    generation_result = build_generation_result(user_story_key, user_story, results,
+                                                bulk_import_results[0] if len(bulk_import_results) == 1 else None)
+    if len(bulk_import_results) > 1:
+        generation_result["importJobs"] = [
+            {"jobId": r.get("jobId"), "status": r.get("status"), "success": r["success"]}
+            for r in bulk_import_results
+        ]
+    if upserter is not None:
+        upserter.record_created([tc for tc, _ in created], [result for _, result in created])
+        add_upsert_report(generation_result, upserter)
+    if duplicates.report:
+        generation_result["duplicates"] = duplicates.report
+    return generation_result
+
+def import_test_case(test_case, result, user_story_key):
+    """
+    Import a single test case into Xray and link it to its user story
+    
+    Args:
+        test_case (dict): The test case to import
+        result (dict): Result entry of the test case (updated in place)
+        user_story_key (str): The key of the user story
+    """
+    try:
+        logger.info(f"Importing test case: {test_case['summary']}")
+        import_result = create_xray_test_case(test_case)
+        
+        # Create link to user story
+        if import_result and import_result.get('key'):
+            logger.info(f"Creating link between {import_result['key']} and {user_story_key}")
+            link_result = create_issue_link(import_result['key'], user_story_key)
+            logger.info(f"Link creation result: {link_result}")
+        
+        result["key"] = import_result['key']
+        result["success"] = True
+    except Exception as error:
+        logger.error(f"Error importing test case: {str(error)}")
+        result["error"] = str(error)
+
+def prepare_output_directory(user_story):
+    """
+    Create the output directory of a user story
+    
+    Args:
+        user_story (dict): User story details
+    
+    Returns:
+        str: Path of the output directory, named after the user story title
+    """
+    folder_name = re.sub(r'[^\w\s-]', '', user_story['fields']['summary']).replace(' ', '_')
+    output_dir = os.path.join(settings.generator["outputBaseDir"], folder_name)
+    
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+def save_test_case(test_case, user_story, output_dir):
+    """
+    Format a generated test case for Xray and save it to a file
+    
+    Args:
+        test_case (dict): Test case generated by Claude (updated in place)
+        user_story (dict): User story details
+        output_dir (str): Output directory of the user story
+    
+    Returns:
+        dict: Result entry for this test case, to be completed by the import
+    """
+    # Vérifier et ajuster le format du titre si nécessaire
+    if not test_case["summary"].startswith(user_story['fields']['summary']):
+        test_case["summary"] = f"{user_story['fields']['summary']}: {test_case['summary']}"
+    
+    # Create a valid filename
+    file_name = re.sub(r'[^\w\s-]', '', test_case["summary"]).replace(' ', '_')[:100] + '.json'
+    file_path = os.path.join(output_dir, file_name)
+    
+    # Formater correctement la description pour Xray
+    if "description" in test_case:
+        # Nettoyer le formatage de la description
+        description = test_case["description"]
+        
+        # Corriger les problèmes d'astérisques dans la description
+        # Normaliser les doubles astérisques pour la mise en forme du texte en gras
+        # Problème avec le format '* *Text**' -> correction en '**Text**'
+        description = re.sub(r'\*\s*\*(.*?)\*\*', r'**\1**', description)
+        
+        # Corriger les astérisques à la fin des titres sans * en début
+        # Problème avec le format 'Text*' qui devrait être '**Text**'
+        description = re.sub(r'([^\*])\*([\s\n])', r'\1\2', description)
+        
+        # Corriger les astérisques en trop dans les titres
+        description = description.replace("***Prerequisites and Test Data", "**Prerequisites and Test Data**")
+        description = description.replace("Test Data:***", "**Test Data:**")
+        description = description.replace("* *Prerequisites:**", "**Prerequisites:**")
+        description = description.replace("* *Test Data:**", "**Test Data:**")
+        
+        # S'assurer que les retours à la ligne sont correctement interprétés
+        # Remplacer explicitement les séquences \n par des sauts de ligne réels
+        description = description.replace("\\n", "\n")
+        
+        # Détecter si nous avons des tables dans le texte
+        if '|' in description and '-|' in description:
+            # Extraction des lignes du tableau
+            table_lines = []
+            in_table = False
+            new_description_lines = []
             
-            # Formater correctement la description pour Xray
-            if "description" in test_case:
-                # Nettoyer le formatage de la description
-                description = test_case["description"]
-                
-                # Corriger les problèmes d'astérisques dans la description
-                # Normaliser les doubles astérisques pour la mise en forme du texte en gras
-                # Problème avec le format '* *Text**' -> correction en '**Text**'
-                description = re.sub(r'\*\s*\*(.*?)\*\*', r'**\1**', description)
-                
-                # Corriger les astérisques à la fin des titres sans * en début
-                # Problème avec le format 'Text*' qui devrait être '**Text**'
-                description = re.sub(r'([^\*])\*([\s\n])', r'\1\2', description)
-                
-                # Corriger les astérisques en trop dans les titres
-                description = description.replace("***Prerequisites and Test Data", "**Prerequisites and Test Data**")
-                description = description.replace("Test Data:***", "**Test Data:**")
-                description = description.replace("* *Prerequisites:**", "**Prerequisites:**")
-                description = description.replace("* *Test Data:**", "**Test Data:**")
-                
-                # S'assurer que les retours à la ligne sont correctement interprétés
-                # Remplacer explicitement les séquences \n par des sauts de ligne réels
-                description = description.replace("\\n", "\n")
-                
-                # Détecter si nous avons des tables dans le texte
-                if '|' in description and '-|' in description:
-                    # Extraction des lignes du tableau
-                    table_lines = []
+            for line in description.split('\n'):
+                if '|' in line and not in_table:
+                    # Début potentiel du tableau
+                    in_table = True
+                    table_lines.append(line)
+                elif '|' in line and in_table:
+                    # Continuation du tableau
+                    table_lines.append(line)
+                elif in_table:
+                    # Fin du tableau
                     in_table = False
-                    new_description_lines = []
                     
-                    for line in description.split('\n'):
-                        if '|' in line and not in_table:
-                            # Début potentiel du tableau
-                            in_table = True
-                            table_lines.append(line)
-                        elif '|' in line and in_table:
-                            # Continuation du tableau
-                            table_lines.append(line)
-                        elif in_table:
-                            # Fin du tableau
-                            in_table = False
-                            
-                            # Formatter le tableau en liste à puces
-                            if len(table_lines) >= 3:  # Un tableau valide a au moins l'en-tête, le séparateur et une ligne
-                                # Ignorer les lignes d'en-tête et de séparation
-                                formatted_list = "\n"
-                                
-                                # Formatter chaque ligne de données en puce
-                                for data_line in table_lines[2:]:  # Ignorer l'en-tête et la ligne de séparation
-                                    cells = [c.strip() for c in data_line.split('|') if c.strip()]
-                                    if len(cells) >= 2:  # Assurez-vous qu'il y a au moins deux cellules
-                                        formatted_list += f"\u2022 {cells[0]}: {cells[1]}\n"
-                                
-                                new_description_lines.append(formatted_list)
-                            else:
-                                # Si le tableau n'est pas valide, le conserver tel quel
-                                new_description_lines.extend(table_lines)
-                            
-                            table_lines = []
-                            new_description_lines.append(line)
-                        else:
-                            new_description_lines.append(line)
-                    
-                    # Ajouter les dernières lignes de tableau si la boucle se termine dans un tableau
-                    if in_table and table_lines:
+                    # Formatter le tableau en liste à puces
+                    if len(table_lines) >= 3:  # Un tableau valide a au moins l'en-tête, le séparateur et une ligne
+                        # Ignorer les lignes d'en-tête et de séparation
                         formatted_list = "\n"
-                        for data_line in table_lines[2:]:  # Ignorer l'en-tête et la ligne de séparation si possible
+                        
+                        # Formatter chaque ligne de données en puce
+                        for data_line in table_lines[2:]:  # Ignorer l'en-tête et la ligne de séparation
                             cells = [c.strip() for c in data_line.split('|') if c.strip()]
-                            if len(cells) >= 2:
+                            if len(cells) >= 2:  # Assurez-vous qu'il y a au moins deux cellules
                                 formatted_list += f"\u2022 {cells[0]}: {cells[1]}\n"
+                        
                         new_description_lines.append(formatted_list)
-                    
-                    # Mettre à jour la description
-                    description = '\n'.join(new_description_lines)
-                
-                # Assurer des espaces consistants après les puces et numéros
-                description = re.sub(r'(^|\n)\s*([\*\-])\s*', r'\1\2 ', description)
-                description = re.sub(r'(^|\n)\s*(\d+\.)\s*', r'\1\2 ', description)
-                
-                # Mettre à jour la description formatée
-                test_case["description"] = description
-            
-            # Save test case to file
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(test_case, f, indent=2, ensure_ascii=False)
-            logger.info(f"Saved test case to: {file_path}")
-            
-            results.append({
-                "testCase": test_case["summary"],
-                "filePath": file_path,
-                "success": False,  # Sera mis à jour après l'import en masse
-                "key": None        # Sera mis à jour après l'import en masse
-            })
-            
-        # Import all test cases in bulk
-        try:
-            if settings.xray.get("use_bulk_import", False):
-                logger.info(f"Importing {len(test_cases)} test cases in bulk to Xray")
-                # Utiliser le mode avec wait_for_completion pour attendre la fin du job
-                # Définir un temps d'attente suffisant pour le traitement (30 tentatives avec 5 secondes = 2.5 minutes)
-                bulk_import_result = import_test_cases_to_xray(test_cases, user_story_key, wait_for_completion=True, max_polling_attempts=30, polling_interval=5)
-                
-                if bulk_import_result["success"]:
-                    # Vérifier si nous avons un résultat asynchrone avec jobId ou un résultat direct
-                    if "jobId" in bulk_import_result:
-                        logger.info(f"Processing import job results with ID: {bulk_import_result['jobId']}")
-                        # Pour un job asynchrone terminé, les clés sont dans importedTests
-                        if "importedTests" in bulk_import_result and bulk_import_result["importedTests"]:
-                            imported_keys = bulk_import_result["importedTests"]
-                            for i, key in enumerate(imported_keys):
-                                if i < len(results):
-                                    results[i]["key"] = key
-                                    results[i]["success"] = True
-                            
-                            logger.info(f"Successfully imported {len(imported_keys)} test cases")
-                        else:
-                            # Si pas de clés trouvées, marquer comme échoué
-                            logger.warning(f"No imported tests found in job result. Status: {bulk_import_result.get('status')}")
-                            for result in results:
-                                result["error"] = f"No test keys found in import job result. Status: {bulk_import_result.get('status')}"
                     else:
-                        # Pour un résultat direct
-                        imported_keys = bulk_import_result.get("importedTests", [])
-                        for i, key in enumerate(imported_keys):
-                            if i < len(results):
-                                results[i]["key"] = key
-                                results[i]["success"] = True
-                        
-                        logger.info(f"Successfully imported {len(imported_keys)} test cases")
+                        # Si le tableau n'est pas valide, le conserver tel quel
+                        new_description_lines.extend(table_lines)
                     
-                    # Log any errors
-                    if bulk_import_result.get("errors"):
-                        logger.warning(f"Encountered {len(bulk_import_result['errors'])} errors during import: {bulk_import_result['errors']}")
+                    table_lines = []
+                    new_description_lines.append(line)
                 else:
-                    error_message = bulk_import_result.get('message', 'Unknown error during bulk import')
-                    logger.error(f"Bulk import failed: {error_message}")
-                    
-                    # Journal des erreurs spécifiques
-                    if "errors" in bulk_import_result and bulk_import_result["errors"]:
-                        for i, error in enumerate(bulk_import_result["errors"]):
-                            element_num = error.get("elementNumber", i)
-                            error_details = error.get("errors", {})
-                            logger.error(f"  Test {element_num}: {error_details}")
-                    
-                    # Mark all test cases as failed
-                    for i, result in enumerate(results):
-                        if "errors" in bulk_import_result and bulk_import_result["errors"] and i < len(bulk_import_result["errors"]):
-                            error = bulk_import_result["errors"][i]
-                            element_num = error.get("elementNumber", i)
-                            error_details = error.get("errors", {})
-                            result["error"] = f"Import error: {error_details}"
-                        else:
-                            result["error"] = error_message
+                    new_description_lines.append(line)
+            
+            # Ajouter les dernières lignes de tableau si la boucle se termine dans un tableau
+            if in_table and table_lines:
+                formatted_list = "\n"
+                for data_line in table_lines[2:]:  # Ignorer l'en-tête et la ligne de séparation si possible
+                    cells = [c.strip() for c in data_line.split('|') if c.strip()]
+                    if len(cells) >= 2:
+                        formatted_list += f"\u2022 {cells[0]}: {cells[1]}\n"
+                new_description_lines.append(formatted_list)
+            
+            # Mettre à jour la description
+            description = '\n'.join(new_description_lines)
+        
+        # Assurer des espaces consistants après les puces et numéros
+        description = re.sub(r'(^|\n)\s*([\*\-])\s*', r'\1\2 ', description)
+        description = re.sub(r'(^|\n)\s*(\d+\.)\s*', r'\1\2 ', description)
+        
+        # Mettre à jour la description formatée
+        test_case["description"] = description
+    
+    # Save test case to file
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(test_case, f, indent=2, ensure_ascii=False)
+    logger.info(f"Saved test case to: {file_path}")
+    
+    return {
+        "testCase": test_case["summary"],
+        "filePath": file_path,
+        "success": False,  # Sera mis à jour après l'import en masse
+        "key": None        # Sera mis à jour après l'import en masse
+    }
+
+def apply_import_result(results, bulk_import_result):
+    """
+    Report the result of a bulk import on the result entries of the test cases
+    
+    Args:
+        results (list): Result entries, in the order of the imported test cases (updated in place)
+        bulk_import_result (dict): Result returned by bulk_import.bulk_import_test_cases
+            or xray_client.import_test_cases_to_xray
+    """
+    if "testKeys" in bulk_import_result:
+        # Résultat du moteur d'import par lots: une clé (ou None) par test case, dans l'ordre d'envoi
+        errors = {error["elementNumber"]: error.get("errors") for error in bulk_import_result.get("errors", [])}
+        for i, (result, key) in enumerate(zip(results, bulk_import_result["testKeys"])):
+            if key:
+                result["key"] = key
+                result["success"] = True
             else:
-                # Fallback to individual import if bulk import is disabled
-                logger.info("Bulk import disabled, falling back to individual import")
-                for i, test_case in enumerate(test_cases):
-                    try:
-                        logger.info(f"Importing test case: {test_case['summary']}")
-                        import_result = create_xray_test_case(test_case)
-                        
-                        # Create link to user story
-                        if import_result and import_result.get('key'):
-                            logger.info(f"Creating link between {import_result['key']} and {user_story_key}")
-                            link_result = create_issue_link(import_result['key'], user_story_key)
-                            logger.info(f"Link creation result: {link_result}")
-                        
-                        results[i]["key"] = import_result['key']
+                result["error"] = f"Import error: {errors.get(i, bulk_import_result.get('message'))}"
+        logger.info(f"Successfully imported {len(bulk_import_result['importedTests'])} of {len(results)} test cases")
+    elif bulk_import_result["success"]:
+        # Vérifier si nous avons un résultat asynchrone avec jobId ou un résultat direct
+        if "jobId" in bulk_import_result:
+            logger.info(f"Processing import job results with ID: {bulk_import_result['jobId']}")
+            # Pour un job asynchrone terminé, les clés sont dans importedTests
+            if "importedTests" in bulk_import_result and bulk_import_result["importedTests"]:
+                imported_keys = bulk_import_result["importedTests"]
+                for i, key in enumerate(imported_keys):
+                    if i < len(results):
+                        results[i]["key"] = key
                         results[i]["success"] = True
-                    except Exception as error:
-                        logger.error(f"Error importing test case: {str(error)}")
-                        results[i]["error"] = str(error)
-        except Exception as error:
-            error_message = str(error)
-            logger.error(f"Error during test case import: {error_message}")
-            # Mark all test cases as failed
-            for result in results:
-                if not result.get("success"):
-                    result["error"] = error_message
+                
+                logger.info(f"Successfully imported {len(imported_keys)} test cases")
+            else:
+                # Si pas de clés trouvées, marquer comme échoué
+                logger.warning(f"No imported tests found in job result. Status: {bulk_import_result.get('status')}")
+                for result in results:
+                    result["error"] = f"No test keys found in import job result. Status: {bulk_import_result.get('status')}"
+        else:
+            # Pour un résultat direct
+            imported_keys = bulk_import_result.get("importedTests", [])
+            for i, key in enumerate(imported_keys):
+                if i < len(results):
+                    results[i]["key"] = key
+                    results[i]["success"] = True
+            
+            logger.info(f"Successfully imported {len(imported_keys)} test cases")
         
-        # Préparer les données de retour
-        return_data = {
-            "userStory": user_story_key,
-            "title": user_story['fields']['summary'],
-            "testCases": results
-        }
+        # Log any errors
+        if bulk_import_result.get("errors"):
+            logger.warning(f"Encountered {len(bulk_import_result['errors'])} errors during import: {bulk_import_result['errors']}")
+    else:
+        error_message = bulk_import_result.get('message', 'Unknown error during bulk import')
+        logger.error(f"Bulk import failed: {error_message}")
         
-        # Ajouter les informations du job si disponibles
-        if 'bulk_import_result' in locals() and isinstance(bulk_import_result, dict):
-            if "jobId" in bulk_import_result:
-                return_data["jobId"] = bulk_import_result["jobId"]
-                return_data["status"] = bulk_import_result.get("status")
-                
-                # Ajouter les informations d'erreur
-                if "errors" in bulk_import_result:
-                    return_data["errors"] = bulk_import_result["errors"]
+        # Journal des erreurs spécifiques
+        if "errors" in bulk_import_result and bulk_import_result["errors"]:
+            for i, error in enumerate(bulk_import_result["errors"]):
+                element_num = error.get("elementNumber", i)
+                error_details = error.get("errors", {})
+                logger.error(f"  Test {element_num}: {error_details}")
         
-        return return_data
-    except Exception as error:
-        logger.error(f"Error generating test cases: {str(error)}")
-        raise
\ No newline at end of file
+        # Mark all test cases as failed
+        for i, result in enumerate(results):
+            if "errors" in bulk_import_result and bulk_import_result["errors"] and i < len(bulk_import_result["errors"]):
+                error = bulk_import_result["errors"][i]
+                element_num = error.get("elementNumber", i)
+                error_details = error.get("errors", {})
+                result["error"] = f"Import error: {error_details}"
+            else:
+                result["error"] = error_message
+
+def add_upsert_report(generation_result, upserter):
+    """
+    Add the existing tests updated or kept by an upsert to the generation results
+    
+    Args:
+        generation_result (dict): Generation results (updated in place)
+        upserter (StoryTestUpserter): Upserter used for the story
+    """
+    generation_result["upserted"] = upserter.report
+    untouched = upserter.unmatched_tests()
+    if untouched:
+        logger.info(f"Existing tests matching no generated test case, left untouched: {', '.join(untouched)}")
+        generation_result["untouchedTests"] = untouched
+
+def build_generation_result(user_story_key, user_story, results, bulk_import_result=None):
+    """
+    Build the generation results returned to the caller
+    
+    Args:
+        user_story_key (str): The key of the user story
+        user_story (dict): User story details
+        results (list): Result entries of the test cases
+        bulk_import_result (dict, optional): Result of the bulk import, if any
+    
+    Returns:
+        dict: Generation results
+    """
+    # Préparer les données de retour
+    return_data = {
+        "userStory": user_story_key,
+        "title": user_story['fields']['summary'],
+        "testCases": results
+    }
+    
+    # Ajouter les informations du job si disponibles
+    if isinstance(bulk_import_result, dict):
+        if "jobId" in bulk_import_result:
+            return_data["jobId"] = bulk_import_result["jobId"]
+            return_data["status"] = bulk_import_result.get("status")
+            if len(bulk_import_result.get("jobIds", [])) > 1:
+                return_data["jobIds"] = bulk_import_result["jobIds"]
+            
+            # Ajouter les informations d'erreur
+            if "errors" in bulk_import_result:
+                return_data["errors"] = bulk_import_result["errors"]
+    
+    return return_data
\ No newline at end of file
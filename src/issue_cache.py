@@ -0,0 +1,181 @@
+# Local cache of Jira issues for the Test Case Generator
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Entrées déjà lues, avec la date de la dernière vérification auprès de Jira,
+# de la moins récemment utilisée à la plus récente
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+def _entry_path(issue_key):
+    cache_dir = os.path.join(settings.generator["outputBaseDir"], settings.issue_cache.get("cacheDir", "cache/jira"))
+    return os.path.join(cache_dir, f"{issue_key}.json")
+
+def _remember(issue_key, entry):
+    # Appelé avec le verrou: une entrée oubliée sera relue sur disque
+    _memory[issue_key] = entry
+    _memory.move_to_end(issue_key)
+    while len(_memory) > max(1, settings.issue_cache.get("maxMemoryEntries", 1000)):
+        _memory.popitem(last=False)
+
+def _load_entry(issue_key):
+    with _lock:
+        if issue_key in _memory:
+            _memory.move_to_end(issue_key)
+            return _memory[issue_key]
+
+    try:
+        with open(_entry_path(issue_key), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable cache entry for {issue_key}: {e}")
+        return None
+
+    # Une entrée lue sur disque doit être revérifiée avant d'être considérée fraîche
+    entry["checkedAt"] = 0
+    with _lock:
+        if issue_key in _memory:
+            return _memory[issue_key]
+        _remember(issue_key, entry)
+        return entry
+
+def _save_entry(issue_key, entry):
+    path = _entry_path(issue_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({k: v for k, v in entry.items() if k != "checkedAt"}, f)
+    os.replace(temp_path, path)
+
+def get_issue_updated(issue):
+    """Get the fields.updated timestamp of a Jira issue payload"""
+    return (issue.get("fields") or {}).get("updated")
+
+def get_cached_issue(issue_key):
+    """
+    Get the cached payload of a Jira issue
+
+    Args:
+        issue_key (str): The key of the Jira issue
+
+    Returns:
+        dict or None: The last full payload fetched from Jira, or None if not cached
+    """
+    if not settings.issue_cache.get("enabled", True):
+        return None
+    entry = _load_entry(issue_key)
+    return entry["issue"] if entry else None
+
+def is_issue_fresh(issue_key):
+    """
+    Check whether a cached issue was verified against Jira recently enough to skip the check
+
+    Args:
+        issue_key (str): The key of the Jira issue
+
+    Returns:
+        bool: True if the cached payload was verified less than issue_cache["freshSeconds"] ago
+    """
+    entry = _load_entry(issue_key)
+    return bool(entry) and time.time() - entry["checkedAt"] < settings.issue_cache.get("freshSeconds", 60)
+
+def store_issue(issue):
+    """
+    Store the full payload of a Jira issue
+
+    Args:
+        issue (dict): Issue details, as returned by Jira (not projected on some fields)
+    """
+    if not settings.issue_cache.get("enabled", True):
+        return
+    issue_key = issue["key"]
+    previous = _load_entry(issue_key) or {}
+    entry = {
+        "issue": issue,
+        "updated": get_issue_updated(issue),
+        # Conserver la version traitée tant que la story n'a pas changé
+        "processedUpdated": previous.get("processedUpdated"),
+        "checkedAt": time.time()
+    }
+    with _lock:
+        _remember(issue_key, entry)
+    _save_entry(issue_key, entry)
+
+def confirm_issue_unchanged(issue_key, updated):
+    """
+    Check a cached issue against the updated timestamp returned by Jira
+
+    Args:
+        issue_key (str): The key of the Jira issue
+        updated (str): Current fields.updated value in Jira
+
+    Returns:
+        dict or None: The cached payload if it is still up to date, None otherwise
+    """
+    entry = _load_entry(issue_key)
+    if not entry or entry["issue"] is None or not updated or entry["updated"] != updated:
+        return None
+    with _lock:
+        entry["checkedAt"] = time.time()
+    return entry["issue"]
+
+def mark_issue_processed(issue):
+    """
+    Remember that test cases were generated for this version of an issue
+
+    Only the fields.updated timestamp of the issue is recorded: the batch modes
+    pass the projected payloads of a search, which must not replace the full
+    payload returned by get_cached_issue. The cached payload is kept if it is
+    the same version, and dropped otherwise.
+
+    Args:
+        issue (dict): Issue details, as returned by Jira (full or projected)
+    """
+    if not settings.issue_cache.get("enabled", True):
+        return
+    issue_key = issue["key"]
+    updated = get_issue_updated(issue)
+    previous = _load_entry(issue_key) or {}
+    same_version = previous.get("issue") is not None and previous.get("updated") == updated
+    entry = {
+        "issue": previous["issue"] if same_version else None,
+        "updated": updated,
+        "processedUpdated": updated,
+        "checkedAt": previous["checkedAt"] if same_version else 0
+    }
+    with _lock:
+        _remember(issue_key, entry)
+    _save_entry(issue_key, entry)
+
+def is_issue_processed(issue_key, updated):
+    """
+    Check whether test cases were already generated for this version of an issue
+
+    Args:
+        issue_key (str): The key of the Jira issue
+        updated (str): Current fields.updated value in Jira
+
+    Returns:
+        bool: True if the issue has not changed since its test cases were generated
+    """
+    if not settings.issue_cache.get("enabled", True):
+        return False
+    entry = _load_entry(issue_key)
+    return bool(entry) and bool(updated) and entry.get("processedUpdated") == updated
@@ -2,6 +2,7 @@
 import logging
 import sys
 import os
+from urllib.parse import urlencode
 
 # Ajouter le chemin du projet au PYTHONPATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,25 +12,165 @@ if parent_dir not in sys.path:
 
 from config import settings
 from utils import make_request
+from issue_cache import get_cached_issue, is_issue_fresh, confirm_issue_unchanged, store_issue
 
 logger = logging.getLogger(__name__)
 
-def get_jira_issue(issue_key):
+def get_jira_issue(issue_key, use_cache=True):
     """
     Get details of a Jira issue
     
+    The full payload is only downloaded when the issue changed since it was
+    cached: a projected request on fields.updated is enough to check it.
+    
     Args:
         issue_key (str): The key of the Jira issue
+        use_cache (bool): Use the local issue cache
     
     Returns:
         dict: Issue details
     """
+    if use_cache and get_cached_issue(issue_key):
+        if is_issue_fresh(issue_key):
+            logger.info(f"Using cached Jira issue {issue_key}")
+            return get_cached_issue(issue_key)
+        
+        cached_issue = confirm_issue_unchanged(issue_key, get_jira_issue_updated(issue_key))
+        if cached_issue:
+            logger.info(f"Jira issue {issue_key} unchanged, using cached payload")
+            return cached_issue
+    
     url = f"https://{settings.jira['baseUrl']}{settings.jira['apiEndpoint']}/issue/{issue_key}?expand=renderedFields"
     headers = {
         'Authorization': settings.jira['authToken']
     }
     
-    return make_request(url, method='GET', headers=headers)
+    issue = make_request(url, method='GET', headers=headers)
+    store_issue(issue)
+    return issue
+
+def get_jira_issue_updated(issue_key):
+    """
+    Get the last update timestamp of a Jira issue
+    
+    Args:
+        issue_key (str): The key of the Jira issue
+    
+    Returns:
+        str: Value of fields.updated
+    """
+    url = f"https://{settings.jira['baseUrl']}{settings.jira['apiEndpoint']}/issue/{issue_key}?fields=updated"
+    headers = {
+        'Authorization': settings.jira['authToken']
+    }
+    
+    return make_request(url, method='GET', headers=headers).get("fields", {}).get("updated")
+
+# Champs lus par le générateur: les requêtes de masse ne demandent que ceux-ci
+STORY_FIELDS = ["summary", "description", "updated"]
+
+# Nombre maximum de clés par requête "key in (...)"
+MAX_KEYS_PER_QUERY = 100
+
+def build_search_url(jql, fields=None, expand_rendered=False, start_at=0, page_size=100):
+    """
+    Build the URL of one page of a Jira search
+    
+    Args:
+        jql (str): The JQL query
+        fields (list, optional): Fields to return for each issue. Defaults to STORY_FIELDS.
+        expand_rendered (bool): Also return the rendered (HTML) fields
+        start_at (int): Index of the first issue of the page
+        page_size (int): Number of issues requested per page (Jira caps it at 100)
+    
+    Returns:
+        str: Search URL
+    """
+    if fields is None:
+        fields = STORY_FIELDS
+    
+    params = {
+        "jql": jql,
+        "fields": ",".join(fields),
+        "startAt": start_at,
+        "maxResults": page_size,
+        "validateQuery": "warn"
+    }
+    if expand_rendered:
+        params["expand"] = "renderedFields"
+    
+    return f"https://{settings.jira['baseUrl']}{settings.jira['apiEndpoint']}/search?{urlencode(params)}"
+
+def search_jira_issues(jql, fields=None, expand_rendered=False, page_size=100):
+    """
+    Search Jira issues with a JQL query, page by page
+    
+    Args:
+        jql (str): The JQL query
+        fields (list, optional): Fields to return for each issue. Defaults to STORY_FIELDS.
+        expand_rendered (bool): Also return the rendered (HTML) fields
+        page_size (int): Number of issues requested per page (Jira caps it at 100)
+    
+    Yields:
+        dict: Issue details, one issue at a time
+    """
+    headers = {
+        'Authorization': settings.jira['authToken']
+    }
+    
+    start_at = 0
+    while True:
+        url = build_search_url(jql, fields, expand_rendered, start_at, page_size)
+        page = make_request(url, method='GET', headers=headers)
+        
+        for warning in page.get("warningMessages", []):
+            logger.warning(f"Jira search warning: {warning}")
+        
+        issues = page.get("issues", [])
+        for issue in issues:
+            yield issue
+        
+        start_at += len(issues)
+        if not issues or start_at >= page.get("total", 0):
+            break
+
+def get_jira_issues(issue_keys, fields=None, expand_rendered=False):
+    """
+    Get details of several Jira issues with as few requests as possible
+    
+    Args:
+        issue_keys (list): The keys of the Jira issues
+        fields (list, optional): Fields to return for each issue. Defaults to STORY_FIELDS.
+        expand_rendered (bool): Also return the rendered (HTML) fields
+    
+    Yields:
+        dict: Issue details, one issue at a time (unknown keys are skipped)
+    """
+    issue_keys = list(issue_keys)
+    for i in range(0, len(issue_keys), MAX_KEYS_PER_QUERY):
+        chunk = issue_keys[i:i + MAX_KEYS_PER_QUERY]
+        jql = f"key in ({', '.join(chunk)})"
+        
+        found = set()
+        for issue in search_jira_issues(jql, fields=fields, expand_rendered=expand_rendered):
+            found.add(issue["key"])
+            yield issue
+        
+        missing = [key for key in chunk if key not in found]
+        if missing:
+            logger.warning(f"Jira issues not found: {', '.join(missing)}")
+
+def search_jira_issue_keys(jql):
+    """
+    Get the keys of all Jira issues matching a JQL query
+    
+    Args:
+        jql (str): The JQL query
+    
+    Returns:
+        list: Issue keys, in the order returned by Jira
+    """
+    return [issue["key"] for issue in search_jira_issues(jql, fields=["key"])]
 
 def create_xray_test_case(test_case_data):
     """
@@ -120,4 +261,21 @@ def create_issue_link(test_case_key, user_story_key):
         return {
             "success": False,
             "error": str(error)
-        }
\ No newline at end of file
+        }
+
+def update_jira_issue_fields(issue_key, fields):
+    """
+    Update some fields of a Jira issue
+    
+    Args:
+        issue_key (str): The key of the Jira issue
+        fields (dict): New values of the fields to change (the others are left untouched)
+    """
+    url = f"https://{settings.jira['baseUrl']}{settings.jira['apiEndpoint']}/issue/{issue_key}"
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': settings.jira['authToken']
+    }
+    
+    logger.info(f"Updating {', '.join(fields)} of {issue_key}")
+    make_request(url, method='PUT', headers=headers, json_data={"fields": fields})
@@ -0,0 +1,313 @@
+# Incremental JSON parsing of Claude responses for the Test Case Generator
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Caractères qui peuvent suivre la fin d'une chaîne: un guillemet suivi d'autre chose est littéral
+STRING_TERMINATORS = ',:}]'
+
+WHITESPACE = ' \t\r\n'
+
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\', '/': '/'}
+
+class TestCaseStreamParser:
+    """
+    Single-pass, incremental parser for the test cases returned by Claude
+
+    Text is fed as it arrives; each object of the top-level array is returned
+    as soon as its closing brace has been received. Prose and code fences
+    around the array are skipped, and common defects are repaired: trailing
+    commas, // line comments (between elements, after a key or after a value),
+    single-quoted strings, unescaped quotes and raw line breaks inside strings.
+    close() recovers a test case cut off by the end of the response
+    (unterminated string, missing braces).
+    """
+
+    def __init__(self):
+        self._depth = 0          # 0 = avant le tableau, 1 = dans le tableau, 2+ = dans un test case
+        self._quote = None       # Délimiteur de la chaîne en cours
+        self._escape = False
+        self._quote_pending = False
+        self._slash_pending = False  # "/" après une fin de chaîne possible: début de commentaire ?
+        self._comment = False
+        self._previous = ''
+        self._current = []       # Caractères du test case en cours
+        self._done = False
+        self.finished = False    # Crochet fermant du tableau reçu
+        self.count = 0
+
+    def feed(self, text):
+        """
+        Feed a chunk of the response
+
+        Args:
+            text (str): Next chunk of text
+
+        Returns:
+            list: Test cases completed by this chunk
+        """
+        completed = []
+        for char in text:
+            if self._done:
+                break
+
+            if self._depth >= 2:
+                self._current.append(char)
+                self._scan_element_char(char, completed)
+            elif self._depth == 1:
+                if self._comment:
+                    # Commentaire entre deux test cases
+                    self._comment = char != '\n'
+                elif char == '{':
+                    self._start_element(char)
+                elif char == ']':
+                    self._done = True
+                    self.finished = True
+                elif char == '/':
+                    self._comment = self._previous == '/'
+                elif char not in WHITESPACE and char != ',':
+                    # Un "[" dans la prose: ce n'était pas le tableau des test cases
+                    self._depth = 0
+            elif char == '[':
+                self._depth = 1
+            elif char == '{' and self._previous in WHITESPACE + ',':
+                # Test cases sans tableau englobant
+                self._start_element(char)
+            self._previous = char
+
+        return completed
+
+    def close(self):
+        """
+        Signal the end of the response
+
+        Returns:
+            list: The test case cut off by the end of the response, if it can be recovered
+        """
+        completed = []
+        if self._depth >= 2 and self._current:
+            test_case = parse_lenient(''.join(self._current))
+            self._current = []
+            if isinstance(test_case, dict) and test_case.get("summary"):
+                logger.warning(f"Recovered truncated test case: {test_case['summary']}")
+                self.count += 1
+                completed.append(test_case)
+        self._done = True
+        return completed
+
+    def _start_element(self, char):
+        self._current = [char]
+        self._depth = 2
+        self._quote = None
+        self._escape = False
+        self._quote_pending = False
+        self._slash_pending = False
+        self._comment = False
+
+    def _scan_element_char(self, char, completed):
+        if self._quote_pending:
+            if self._slash_pending:
+                self._slash_pending = False
+                self._quote_pending = False
+                if char == '/':
+                    # Commentaire après la valeur: la chaîne était terminée
+                    self._quote = None
+                    self._comment = True
+                    return
+                # Sinon, guillemet et "/" littéraux: la chaîne continue
+            elif char in WHITESPACE:
+                return
+            elif char == '/':
+                self._slash_pending = True
+                return
+            else:
+                self._quote_pending = False
+                if char in STRING_TERMINATORS:
+                    self._quote = None
+                # Sinon, guillemet non échappé au milieu d'une chaîne: la chaîne continue
+
+        if self._quote:
+            if self._escape:
+                self._escape = False
+            elif char == '\\':
+                self._escape = True
+            elif char == self._quote:
+                self._quote_pending = True
+            return
+
+        if self._comment:
+            if char == '\n':
+                self._comment = False
+        elif char in '"\'':
+            self._quote = char
+        elif char == '/' and self._current[-2:-1] == ['/']:
+            self._comment = True
+        elif char in '{[':
+            self._depth += 1
+        elif char in '}]':
+            self._depth -= 1
+            if self._depth == 1:
+                self._emit(completed)
+
+    def _emit(self, completed):
+        text = ''.join(self._current)
+        self._current = []
+        try:
+            test_case = json.loads(text)
+        except json.JSONDecodeError:
+            test_case = parse_lenient(text)
+        if isinstance(test_case, dict) and test_case.get("summary"):
+            self.count += 1
+            completed.append(test_case)
+        else:
+            logger.warning(f"Skipping unreadable test case in Claude response: {text[:100]}")
+
+def parse_test_cases(text):
+    """
+    Extract every test case that can be recovered from a complete Claude response
+
+    Args:
+        text (str): Text of the response
+
+    Returns:
+        list: Recovered test cases (empty if none)
+    """
+    parser = TestCaseStreamParser()
+    return parser.feed(text) + parser.close()
+
+def parse_lenient(text):
+    """
+    Parse a JSON value, repairing the defects of hand-written or truncated JSON
+
+    Args:
+        text (str): JSON text
+
+    Returns:
+        dict, list, str or None: Parsed value (containers left open are closed)
+    """
+    return _LenientReader(text).value()
+
+class _LenientReader:
+    """Recursive descent over a JSON text that never fails, in a single pass"""
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def skip(self):
+        text, length = self.text, len(self.text)
+        while self.pos < length:
+            char = text[self.pos]
+            if char in WHITESPACE:
+                self.pos += 1
+            elif text.startswith('//', self.pos):
+                end = text.find('\n', self.pos)
+                self.pos = length if end == -1 else end + 1
+            else:
+                break
+
+    def value(self):
+        self.skip()
+        if self.pos >= len(self.text):
+            return None
+        char = self.text[self.pos]
+        if char in ',}]':
+            # Valeur manquante
+            return None
+        if char == '{':
+            return self.object()
+        if char == '[':
+            return self.array()
+        if char in '"\'':
+            return self.string()
+        return self.literal()
+
+    def object(self):
+        result = {}
+        self.pos += 1
+        while True:
+            self.skip()
+            if self.pos >= len(self.text):
+                return result
+            char = self.text[self.pos]
+            if char == '}':
+                self.pos += 1
+                return result
+            if char == ',':
+                self.pos += 1
+                continue
+            if char == ']':
+                # Accolade manquante
+                return result
+
+            key = self.string() if char in '"\'' else self.literal(stop=':,}')
+            self.skip()
+            if self.text.startswith(':', self.pos):
+                self.pos += 1
+            result[str(key)] = self.value()
+
+    def array(self):
+        result = []
+        self.pos += 1
+        while True:
+            self.skip()
+            if self.pos >= len(self.text):
+                return result
+            char = self.text[self.pos]
+            if char == ']':
+                self.pos += 1
+                return result
+            if char == ',':
+                self.pos += 1
+                continue
+            if char == '}':
+                # Crochet manquant
+                return result
+            result.append(self.value())
+
+    def string(self):
+        text, length = self.text, len(self.text)
+        quote = text[self.pos]
+        self.pos += 1
+        chars = []
+        while self.pos < length:
+            char = text[self.pos]
+            self.pos += 1
+            if char == '\\' and self.pos < length:
+                escaped = text[self.pos]
+                self.pos += 1
+                if escaped == 'u' and self.pos + 4 <= length:
+                    try:
+                        chars.append(chr(int(text[self.pos:self.pos + 4], 16)))
+                        self.pos += 4
+                        continue
+                    except ValueError:
+                        pass
+                chars.append(ESCAPES.get(escaped, escaped))
+            elif char == quote:
+                # Fin de chaîne seulement si la suite est structurelle
+                end = self.pos
+                while end < length and text[end] in WHITESPACE:
+                    end += 1
+                if end >= length or text[end] in STRING_TERMINATORS or text.startswith('//', end):
+                    return ''.join(chars)
+                chars.append(char)
+            else:
+                chars.append(char)
+        # Chaîne non terminée
+        return ''.join(chars)
+
+    def literal(self, stop=',}]'):
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in stop and self.text[self.pos] != '\n' \
+                and not self.text.startswith('//', self.pos):
+            self.pos += 1
+        token = self.text[start:self.pos].strip()
+        if self.pos == start:
+            # Caractère inattendu: l'ignorer pour garantir la progression
+            self.pos += 1
+        try:
+            return json.loads(token)
+        except json.JSONDecodeError:
+            return {'True': True, 'False': False, 'None': None}.get(token, token)
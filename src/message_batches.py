@@ -0,0 +1,377 @@
+# Offline backlog generation through the Anthropic Message Batches API
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from utils import make_request, send_request
+from jira_client import search_jira_issues, get_jira_issues
+from claude_client import (build_claude_request, build_claude_headers, extract_test_cases_from_response,
+                           get_cached_test_cases, needs_continuation, build_continuation_request, merge_continuation)
+from generator import process_generated_test_cases
+from batch import build_story_result, build_story_error, record_story_processed, summarize_batch
+
+logger = logging.getLogger(__name__)
+
+# L'état est modifié et enregistré par les threads d'import
+_state_lock = threading.Lock()
+
+def _batches_url():
+    return f"{settings.claude.get('apiBaseUrl', 'https://api.anthropic.com')}/v1/messages/batches"
+
+def get_backlog_state_path(suffix=""):
+    """
+    Path of a file tracking the current backlog run
+
+    The run is kept in three files: message_batches.json (the Message Batches),
+    message_batches_stories.json (the stories and their requests, written once
+    when they are submitted) and message_batches_imported.jsonl (an append-only
+    log of the stories imported so far).
+
+    Args:
+        suffix (str, optional): "_stories" or "_imported" for the other files of the run
+
+    Returns:
+        str: Path of the file
+    """
+    state_dir = os.path.join(settings.generator["outputBaseDir"], settings.generator.get("stateDir", "state"))
+    extension = ".jsonl" if suffix == "_imported" else ".json"
+    return os.path.join(state_dir, f"message_batches{suffix}{extension}")
+
+def load_backlog_state():
+    """
+    Load the state of the backlog run in progress
+
+    Returns:
+        dict or None: The state, or None if no backlog run is in progress
+    """
+    try:
+        with open(get_backlog_state_path(), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    with open(get_backlog_state_path("_stories"), 'r', encoding='utf-8') as f:
+        state["stories"] = json.load(f)
+
+    try:
+        with open(get_backlog_state_path("_imported"), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Dernière ligne incomplète si le run a été interrompu pendant l'écriture
+                    continue
+                story = state["stories"].get(entry["userStory"])
+                if story is not None:
+                    story["imported"] = True
+                    story["result"] = entry["result"]
+    except FileNotFoundError:
+        pass
+    return state
+
+def _write_json(path, data):
+    """Write a JSON file atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def save_backlog_state(state):
+    """
+    Save the Message Batches of the backlog run (written atomically, so an interrupted run can resume)
+
+    The stories are not rewritten: see save_backlog_stories and record_story_imported.
+
+    Args:
+        state (dict): State of the backlog run
+    """
+    with _state_lock:
+        _write_json(get_backlog_state_path(), {"createdAt": state["createdAt"], "batches": state["batches"]})
+
+def save_backlog_stories(state):
+    """
+    Save the stories of the backlog run and their Claude requests
+
+    Args:
+        state (dict): State of the backlog run
+    """
+    stories = {
+        key: {name: value for name, value in story.items() if name not in ("imported", "result")}
+        for key, story in state["stories"].items()
+    }
+    with _state_lock:
+        _write_json(get_backlog_state_path("_stories"), stories)
+
+def record_story_imported(state, user_story_key, story_result):
+    """
+    Mark a story of the backlog run as imported, so that a resumed run does not import it again
+
+    Args:
+        state (dict): State of the backlog run (updated in place)
+        user_story_key (str): Key of the imported story
+        story_result (dict): Result of the story
+    """
+    path = get_backlog_state_path("_imported")
+    line = json.dumps({"userStory": user_story_key, "result": story_result}) + '\n'
+    with _state_lock:
+        story = state["stories"][user_story_key]
+        story["imported"] = True
+        story["result"] = story_result
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+def archive_backlog_state(state):
+    """Move the files of a finished backlog run aside, keeping them for reference"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    for suffix in ("", "_stories", "_imported"):
+        path = get_backlog_state_path(suffix)
+        if os.path.exists(path):
+            root, extension = os.path.splitext(path)
+            os.replace(path, f"{root}_{timestamp}{extension}")
+
+def to_custom_id(user_story_key):
+    """Convert a story key into a valid Message Batches custom_id"""
+    return re.sub(r'[^A-Za-z0-9_-]', '_', user_story_key)[:64]
+
+def prepare_backlog(issues):
+    """
+    Build the Claude request of each story of the backlog
+
+    Stories whose generation is already in the local cache are not submitted.
+
+    Args:
+        issues (iterable): User stories retrieved from Jira
+
+    Returns:
+        dict: New backlog state
+    """
+    state = {"createdAt": datetime.now().isoformat(), "batches": [], "stories": {}}
+    for issue in issues:
+        _, _, claude_request_data = build_claude_request(issue)
+        state["stories"][issue["key"]] = {
+            "customId": to_custom_id(issue["key"]),
+            "story": issue,
+            "request": claude_request_data,
+            "cached": get_cached_test_cases(claude_request_data) is not None
+        }
+
+    cached = sum(1 for story in state["stories"].values() if story["cached"])
+    logger.info(f"Prepared {len(state['stories'])} stories for the backlog ({cached} already in the generation cache)")
+    return state
+
+def submit_backlog(state, keys=None):
+    """
+    Submit the stories of the backlog as Message Batches
+
+    The stories are saved before the first submission, and the batches after
+    each submission so that the batch IDs survive an interruption.
+
+    Args:
+        state (dict): Backlog state returned by prepare_backlog (updated in place)
+        keys (list, optional): Stories to submit. Defaults to the stories not in the generation cache.
+    """
+    if keys is None:
+        save_backlog_stories(state)
+    pending = [key for key, story in state["stories"].items() if not story["cached"]] if keys is None else list(keys)
+    chunk_size = max(1, settings.claude.get("maxRequestsPerBatch", 10000))
+
+    for i in range(0, len(pending), chunk_size):
+        keys = pending[i:i + chunk_size]
+        requests_data = [
+            {"custom_id": state["stories"][key]["customId"], "params": state["stories"][key]["request"]}
+            for key in keys
+        ]
+        batch = make_request(_batches_url(), method='POST', headers=build_claude_headers(), json_data={"requests": requests_data})
+        logger.info(f"Submitted Message Batch {batch['id']} with {len(keys)} stories")
+        state["batches"].append({"id": batch["id"], "status": batch.get("processing_status"), "keys": keys})
+        save_backlog_state(state)
+
+    if not pending:
+        save_backlog_state(state)
+
+def poll_message_batch(batch_id, interval=None):
+    """
+    Wait for a Message Batch to finish processing
+
+    Args:
+        batch_id (str): ID of the Message Batch
+        interval (float, optional): Seconds between two checks. Defaults to settings.claude["batchPollInterval"].
+
+    Returns:
+        dict: The ended Message Batch
+    """
+    if interval is None:
+        interval = settings.claude.get("batchPollInterval", 60)
+
+    while True:
+        batch = make_request(f"{_batches_url()}/{batch_id}", method='GET', headers=build_claude_headers())
+        if batch.get("processing_status") == "ended":
+            logger.info(f"Message Batch {batch_id} ended: {batch.get('request_counts')}")
+            return batch
+        logger.info(f"Message Batch {batch_id} {batch.get('processing_status')}: {batch.get('request_counts')}, checking again in {interval}s")
+        time.sleep(interval)
+
+def iter_message_batch_results(batch):
+    """
+    Read the results of an ended Message Batch
+
+    Args:
+        batch (dict): The ended Message Batch
+
+    Yields:
+        dict: One result per request ({"custom_id": ..., "result": {"type": ..., ...}})
+    """
+    response = send_request('GET', batch["results_url"], headers=build_claude_headers(), stream=True)
+    with response:
+        if response.status_code < 200 or response.status_code >= 300:
+            raise Exception(f"HTTP Error {response.status_code}: {response.text[:200]}")
+        response.encoding = 'utf-8'
+        for line in response.iter_lines(decode_unicode=True):
+            if line.strip():
+                yield json.loads(line)
+
+def _test_cases_from_result(story, result):
+    """Turn the result of one batch request into test cases, continuing it if it was truncated"""
+    if result["type"] != "succeeded":
+        error = result.get("error") or {}
+        message = (error.get("error") or error).get("message")
+        raise Exception(f"Message Batch request {result['type']}" + (f": {message}" if message else ""))
+
+    claude_response = result["message"]
+    claude_request_data = story["request"]
+    url = f"{settings.claude.get('apiBaseUrl', 'https://api.anthropic.com')}/v1/messages"
+
+    # Les reprises après max_tokens se font en direct, elles sont rares
+    while needs_continuation(claude_response, claude_response['content'][0]['text'], claude_response.get('continuations', 0)):
+        continuation_data = build_continuation_request(claude_request_data, claude_response['content'][0]['text'])
+        claude_response = merge_continuation(claude_response, make_request(url, method='POST', headers=build_claude_headers(), json_data=continuation_data))
+
+    return extract_test_cases_from_response(claude_response, claude_request_data)
+
+def _import_story(state, user_story_key, test_cases=None, error=None):
+    start_time = time.monotonic()
+    story = state["stories"][user_story_key]
+    if error is not None:
+        return build_story_error(user_story_key, error, start_time)
+    try:
+        results = process_generated_test_cases(user_story_key, story["story"], test_cases)
+        story_result = build_story_result(user_story_key, results, start_time)
+        record_story_processed(story["story"], story_result)
+    except Exception as e:
+        logger.error(f"Error importing test cases of {user_story_key}: {str(e)}")
+        return build_story_error(user_story_key, str(e), start_time)
+
+    # Une reprise du run ne doit pas importer la story une seconde fois
+    record_story_imported(state, user_story_key, story_result)
+    return story_result
+
+def process_backlog_results(state, max_workers=None):
+    """
+    Wait for the Message Batches of the backlog and feed their results to the save and import stages
+
+    Stories already imported by an interrupted run are not imported again.
+    A story found in the generation cache when the backlog was prepared, but
+    whose cache entry has since been evicted, is submitted in a new Message Batch.
+
+    Args:
+        state (dict): Backlog state
+        max_workers (int, optional): Stories saved and imported concurrently.
+            Defaults to settings.generator["batchWorkers"].
+
+    Returns:
+        dict: Aggregated batch summary, in the order of the backlog
+    """
+    if max_workers is None:
+        max_workers = settings.generator.get("batchWorkers", 4)
+    start_time = time.monotonic()
+    by_custom_id = {story["customId"]: key for key, story in state["stories"].items()}
+    stories = {key: story["result"] for key, story in state["stories"].items() if story.get("imported")}
+    if stories:
+        logger.info(f"{len(stories)} stories already imported by the interrupted run")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="backlog") as executor:
+        futures = []
+        evicted = []
+        # Une story évincée du cache a été soumise dans un batch par le run interrompu
+        submitted = {key for batch_state in state["batches"] for key in batch_state["keys"]}
+        for key, story in state["stories"].items():
+            if not story["cached"] or story.get("imported") or key in submitted:
+                continue
+            test_cases = get_cached_test_cases(story["request"])
+            if test_cases is None:
+                evicted.append(key)
+                continue
+            futures.append(executor.submit(_import_story, state, key, test_cases))
+        if evicted:
+            logger.warning(f"{len(evicted)} stories are no longer in the generation cache, submitting them again")
+            submit_backlog(state, evicted)
+
+        for batch_state in state["batches"]:
+            if all(state["stories"][key].get("imported") for key in batch_state["keys"]):
+                continue
+            batch = poll_message_batch(batch_state["id"])
+            batch_state["status"] = batch.get("processing_status")
+            save_backlog_state(state)
+
+            for entry in iter_message_batch_results(batch):
+                key = by_custom_id.get(entry["custom_id"])
+                if key is None:
+                    logger.warning(f"Ignoring result for unknown custom_id {entry['custom_id']}")
+                    continue
+                if state["stories"][key].get("imported"):
+                    continue
+                try:
+                    test_cases = _test_cases_from_result(state["stories"][key], entry["result"])
+                    futures.append(executor.submit(_import_story, state, key, test_cases))
+                except Exception as e:
+                    logger.error(f"Error processing batch result of {key}: {str(e)}")
+                    futures.append(executor.submit(_import_story, state, key, error=str(e)))
+
+        for future in futures:
+            story_result = future.result()
+            stories[story_result["userStory"]] = story_result
+
+    ordered = [stories.get(key) or build_story_error(key, "No result in the Message Batch") for key in state["stories"]]
+    archive_backlog_state(state)
+    return summarize_batch(ordered, start_time)
+
+def run_backlog(user_story_keys=None, jql=None, max_workers=None):
+    """
+    Generate the test cases of a backlog through the Message Batches API
+
+    A backlog run already in progress (see get_backlog_state_path) is resumed;
+    otherwise the stories selected by user_story_keys or jql are submitted.
+
+    Args:
+        user_story_keys (list, optional): Keys of the user stories to process
+        jql (str, optional): JQL query selecting the user stories (used if no keys are given)
+        max_workers (int, optional): Stories saved and imported concurrently
+
+    Returns:
+        dict: Aggregated batch summary
+    """
+    state = load_backlog_state()
+    if state:
+        logger.info(f"Resuming backlog run started at {state['createdAt']} ({len(state['batches'])} Message Batches)")
+    else:
+        if user_story_keys is None and jql is None:
+            raise Exception("No backlog run in progress: a JQL query or a list of user story keys is required")
+        issues = get_jira_issues(user_story_keys) if user_story_keys is not None else search_jira_issues(jql)
+        state = prepare_backlog(issues)
+        submit_backlog(state)
+
+    return process_backlog_results(state, max_workers)
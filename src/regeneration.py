@@ -0,0 +1,133 @@
+# Incremental regeneration state of user stories for the Test Case Generator
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+def _manifest_path(user_story_key):
+    state_dir = os.path.join(settings.generator["outputBaseDir"], settings.generator.get("stateDir", "state"))
+    return os.path.join(state_dir, f"{user_story_key}.json")
+
+def load_manifest(user_story_key):
+    """
+    Load the scenario manifest of a user story
+
+    The manifest records, for each acceptance scenario block (by block key, see
+    scenarios.split_story_blocks), the test cases generated from it and their Xray keys.
+
+    Args:
+        user_story_key (str): The key of the user story
+
+    Returns:
+        dict or None: The manifest, or None if the story was never generated incrementally
+            (or its manifest is of another format version)
+    """
+    try:
+        with open(_manifest_path(user_story_key), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest for {user_story_key}: {e}")
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        logger.info(f"Manifest of {user_story_key} has another format version, regenerating every scenario")
+        return None
+    return manifest
+
+def save_manifest(user_story_key, manifest):
+    """
+    Save the scenario manifest of a user story
+
+    Args:
+        user_story_key (str): The key of the user story
+        manifest (dict): Manifest built by build_manifest
+    """
+    path = _manifest_path(user_story_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+def plan_regeneration(manifest, context_hash, blocks):
+    """
+    Compare the scenario blocks of a story with its manifest
+
+    Args:
+        manifest (dict or None): Manifest of the previous run
+        context_hash (str): Hash of the shared context of the story
+        blocks (list): Scenario blocks returned by scenarios.split_story_blocks
+
+    Returns:
+        tuple: (blocks whose test cases can be kept, blocks to generate, labels of removed blocks)
+    """
+    if not manifest or manifest.get("contextHash") != context_hash:
+        if manifest:
+            logger.info("Shared context of the story changed, regenerating every scenario")
+        return [], list(blocks), []
+
+    known = manifest.get("blocks", {})
+    unchanged = [block for block in blocks if block["key"] in known]
+    to_generate = [block for block in blocks if block["key"] not in known]
+
+    current = {block["key"] for block in blocks}
+    removed = [entry["label"] for block_key, entry in known.items() if block_key not in current]
+    return unchanged, to_generate, removed
+
+def build_manifest(context_hash, blocks):
+    """
+    Build the manifest of a story after a run
+
+    Args:
+        context_hash (str): Hash of the shared context of the story
+        blocks (list): (block, result entries) pairs of the blocks generated by Claude
+            whose test cases were all imported, or kept from the previous manifest
+
+    Returns:
+        dict: New manifest
+    """
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "contextHash": context_hash,
+        "updatedAt": datetime.now().isoformat(),
+        "blocks": {}
+    }
+    for block, entries in blocks:
+        manifest["blocks"][block["key"]] = {
+            "label": block["label"],
+            "testCases": [{"summary": entry["testCase"], "key": entry["key"]} for entry in entries]
+        }
+    return manifest
+
+def find_stale_tests(manifest, new_manifest):
+    """
+    Find the Xray tests recorded in a previous manifest that the new one no longer tracks
+
+    These are the tests of scenarios removed or edited since the previous run
+    that were not reused for the new test cases: they are never deleted from
+    Xray, so they are reported for cleanup.
+
+    Args:
+        manifest (dict or None): Manifest of the previous run
+        new_manifest (dict): Manifest of this run
+
+    Returns:
+        list: Keys of the tests, sorted
+    """
+    if not manifest:
+        return []
+    tracked = {tc["key"] for entry in new_manifest["blocks"].values() for tc in entry["testCases"]}
+    return sorted({tc["key"] for entry in manifest.get("blocks", {}).values() for tc in entry["testCases"]
+                   if tc.get("key") and tc["key"] not in tracked})
@@ -0,0 +1,179 @@
+# Acceptance scenarios of user stories for the Test Case Generator
+import copy
+import hashlib
+import logging
+import re
+import sys
+import os
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# En-têtes de bloc: "*Scenario 1*", "h3. Scenario 2", "Scenario 3:", "AC 4", "Acceptance Criteria 5"...
+SCENARIO_HEADER_REGEX = re.compile(
+    r'^[ \t]*(?:h\d\.[ \t]*)?(?:#+[ \t]*)?\*?[ \t]*((?:Scenario|AC|Acceptance Criteri(?:on|a))[ \t]*#?[ \t]*\d+)\b[^\n]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+def content_hash(text):
+    """
+    Hash a block of text, ignoring whitespace and Jira color markup
+
+    Args:
+        text (str): Text to hash
+
+    Returns:
+        str: Short hexadecimal digest
+    """
+    normalized = re.sub(r'\{color(?::[^\}]*)?\}', '', text or '')
+    normalized = ' '.join(normalized.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+
+def split_story_blocks(description):
+    """
+    Split a user story description into its shared context and its acceptance scenarios
+
+    Args:
+        description (str): Description of the user story
+
+    Returns:
+        tuple: (context text before the first scenario, list of scenario blocks).
+            Each block is a dict with "label" (e.g. "Scenario 2"), "text" (header
+            included), "hash" (of its body, so renumbering does not change it) and
+            "key" (the hash and the number of identical blocks before it, unique in the story).
+    """
+    description = description or ''
+    headers = list(SCENARIO_HEADER_REGEX.finditer(description))
+    if not headers:
+        return description.strip(), []
+
+    blocks = []
+    occurrences = {}
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(description)
+        body = description[header.end():end]
+        block_hash = content_hash(body)
+        # Deux scénarios identiques ont le même hash: les distinguer par leur rang
+        occurrence = occurrences.get(block_hash, 0)
+        occurrences[block_hash] = occurrence + 1
+        blocks.append({
+            "label": ' '.join(header.group(1).split()).title().replace('Ac ', 'AC '),
+            "text": description[header.start():end].strip(),
+            "body": body.strip(),
+            "hash": block_hash,
+            "key": f"{block_hash}-{occurrence}"
+        })
+
+    return description[:headers[0].start()].strip(), blocks
+
+def story_context_hash(user_story, context):
+    """
+    Hash the parts of a user story shared by all its scenarios
+
+    Args:
+        user_story (dict): The user story
+        context (str): Description text before the first scenario
+
+    Returns:
+        str: Short hexadecimal digest
+    """
+    return content_hash(f"{user_story['fields']['summary']}\n{context}")
+
+def build_scenario_story(user_story, context, block):
+    """
+    Build a copy of a user story restricted to one acceptance scenario
+
+    The copy keeps the shared context of the story so the prompt built from it
+    still describes the whole feature.
+
+    Args:
+        user_story (dict): The user story
+        context (str): Description text before the first scenario
+        block (dict): Scenario block returned by split_story_blocks
+
+    Returns:
+        dict: User story whose description only contains the context and this scenario
+    """
+    instruction = settings.claude.get(
+        "scenarioInstruction",
+        "Only write test cases for the acceptance scenario below; the other scenarios of this story are covered separately."
+    )
+    scenario_story = copy.deepcopy(user_story)
+    scenario_story['fields']['description'] = f"{context}\n\n{instruction}\n\n{block['text']}".strip()
+    return scenario_story
+
+# Numérotation propre à un shard en tête de titre: "TC-01: ", "Test 2 - ", "3. "...
+# Sans préfixe TC/Test, seul un numéro d'un ou deux chiffres compte: "500 - Server error" n'est pas numéroté
+NUMBERING_REGEX = re.compile(r'(\s*(?:(?:TC|Test(?:\s+Case)?)\s*[-#]?\s*(?=\d)|(?=\d{1,2}(?!\d))))(\d+)(\s*[:.)-]\s+)',
+                             re.IGNORECASE)
+
+def _normalize(text):
+    return re.sub(r'[^a-z0-9]+', ' ', (text or '').lower()).strip()
+
+def _match_numbering(summary, story_summary):
+    # Le titre commence normalement par celui de la story: la numérotation se trouve après
+    start = 0
+    if story_summary and summary.startswith(story_summary):
+        start = len(story_summary)
+        while start < len(summary) and summary[start] in ': -':
+            start += 1
+    return NUMBERING_REGEX.match(summary, start)
+
+def _steps_text(steps):
+    if not isinstance(steps, list):
+        return ''
+    return ' | '.join(
+        f"{step.get('action', '')} {step.get('result', step.get('expected_result', ''))}"
+        for step in steps if isinstance(step, dict)
+    )
+
+def merge_scenario_test_cases(generated, story_summary=None):
+    """
+    Merge the test cases generated for several scenarios into one list
+
+    Duplicates (same title once numbering is ignored, or same steps) are dropped,
+    keeping the first occurrence, and shard-local numbering is replaced by a
+    numbering over the merged list.
+
+    Args:
+        generated (list): (block, test cases) pairs, in the order of the scenarios
+        story_summary (str, optional): Title of the story, ignored when comparing titles
+
+    Returns:
+        list: Merged test cases
+    """
+    merged = []
+    seen = set()
+
+    for block, test_cases in generated:
+        for test_case in test_cases:
+            summary = test_case.get("summary", "")
+            match = _match_numbering(summary, story_summary)
+            title = summary[match.end():] if match else summary
+            if story_summary and title.startswith(story_summary):
+                title = title[len(story_summary):]
+
+            keys = {("title", _normalize(title))}
+            steps = _normalize(_steps_text(test_case.get("steps")))
+            if steps:
+                keys.add(("steps", steps))
+            if keys & seen:
+                logger.info(f"Dropping duplicate test case from {block['label']}: {summary}")
+                continue
+            seen |= keys
+            merged.append(test_case)
+
+    for number, test_case in enumerate(merged, start=1):
+        summary = test_case.get("summary", "")
+        match = _match_numbering(summary, story_summary)
+        if match:
+            test_case["summary"] = f"{summary[:match.start(2)]}{str(number).zfill(len(match.group(2)))}{summary[match.end(2):]}"
+
+    return merged
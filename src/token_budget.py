@@ -0,0 +1,157 @@
+# Token budget of the prompts sent to Claude
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from knowledge_base.prompt_enhancer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Marque ajoutée à une description raccourcie pour tenir dans le budget
+TRUNCATION_MARKER = "\n[... description truncated to fit the prompt budget ...]"
+
+_record_lock = threading.Lock()
+
+def estimate_prompt_tokens(prompt):
+    """
+    Estimate the input tokens of a prompt
+
+    Args:
+        prompt (str or list): Prompt text, or content blocks
+
+    Returns:
+        int: Estimated tokens
+    """
+    if isinstance(prompt, list):
+        return sum(estimate_tokens(block.get("text", "")) for block in prompt)
+    return estimate_tokens(prompt or "")
+
+def trim_text_to_tokens(text, max_tokens):
+    """
+    Shorten a text to an estimated number of tokens, cutting at a line break if possible
+
+    Args:
+        text (str): Text to shorten
+        max_tokens (int): Estimated tokens the result may use, marker included
+
+    Returns:
+        str: The text, shortened and marked as such if it was too long
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, (max_tokens - estimate_tokens(TRUNCATION_MARKER)) * 4)
+    cut = text.rfind('\n', 0, max_chars)
+    if cut < max_chars // 2:
+        cut = max_chars
+    return text[:cut].rstrip() + TRUNCATION_MARKER
+
+def allocate_prompt_budget(instructions, summary, description):
+    """
+    Split the input token budget between the sections of a prompt
+
+    The instructions and the story come first. What remains, up to
+    knowledge_base["contextTokenBudget"], goes to the knowledge base context,
+    which is dropped if less than claude["minKnowledgeBaseTokens"] remain. A
+    story too large for the budget on its own has its description shortened.
+
+    Args:
+        instructions (str): Static instructions of the prompt template
+        summary (str): Summary of the user story
+        description (str): Description of the user story
+
+    Returns:
+        dict: Budget with the estimates of each section ("instructions", "story"),
+            the tokens allowed for the knowledge base ("knowledgeBase", 0 to leave
+            it out), the description to use and the actions taken
+    """
+    input_budget = settings.claude.get("inputTokenBudget", 30000)
+    budget = {
+        "inputBudget": input_budget,
+        "instructions": estimate_tokens(instructions),
+        "story": estimate_tokens(summary) + estimate_tokens(description),
+        "description": description,
+        "actions": []
+    }
+
+    remaining = input_budget - budget["instructions"] - budget["story"]
+    if remaining < 0 and settings.claude.get("truncateStory", True):
+        allowed = max(0, estimate_tokens(description) + remaining)
+        budget["description"] = trim_text_to_tokens(description, allowed)
+        budget["story"] = estimate_tokens(summary) + estimate_tokens(budget["description"])
+        budget["actions"].append(f"description truncated to ~{allowed} tokens")
+        remaining = input_budget - budget["instructions"] - budget["story"]
+
+    knowledge_base_budget = min(settings.knowledge_base.get("contextTokenBudget", 1500), max(0, remaining))
+    if knowledge_base_budget < settings.claude.get("minKnowledgeBaseTokens", 200):
+        if settings.knowledge_base.get("use_knowledge_base", False):
+            budget["actions"].append("knowledge base context dropped")
+        knowledge_base_budget = 0
+    elif knowledge_base_budget < settings.knowledge_base.get("contextTokenBudget", 1500):
+        budget["actions"].append(f"knowledge base budget reduced to ~{knowledge_base_budget} tokens")
+    budget["knowledgeBase"] = knowledge_base_budget
+    return budget
+
+def output_token_budget(input_tokens):
+    """
+    Get the max_tokens of a request, within the context window of the model
+
+    Args:
+        input_tokens (int): Estimated input tokens of the request
+
+    Returns:
+        int: claude["maxTokens"], reduced if the input leaves less room in the context window
+    """
+    max_tokens = settings.claude.get("maxTokens", 8000)
+    room = settings.claude.get("contextWindow", 200000) - input_tokens
+    return max(1, min(max_tokens, room))
+
+def record_prompt_budget(user_story_key, budget, knowledge_base_context, prompt):
+    """
+    Complete the budget of a prompt with its final size and record it
+
+    The estimates are logged and appended to logs/token_budget.jsonl in the
+    output directory, to compare them with the usage reported by Claude.
+
+    Args:
+        user_story_key (str): Key of the user story
+        budget (dict): Budget returned by allocate_prompt_budget
+        knowledge_base_context (str): Knowledge base context added to the prompt
+        prompt (str or list): The assembled prompt
+
+    Returns:
+        dict: The recorded estimates
+    """
+    knowledge_base_tokens = estimate_tokens(knowledge_base_context) if knowledge_base_context else 0
+    total = estimate_prompt_tokens(prompt)
+    record = {
+        "userStory": user_story_key,
+        "timestamp": datetime.now().isoformat(),
+        "inputBudget": budget["inputBudget"],
+        "instructions": budget["instructions"],
+        "story": budget["story"],
+        "knowledgeBase": knowledge_base_tokens,
+        "total": total,
+        "maxTokens": output_token_budget(total),
+        "actions": budget["actions"]
+    }
+
+    logger.info(f"Prompt budget for {user_story_key}: ~{total} input tokens "
+                f"(instructions {record['instructions']}, story {record['story']}, knowledge base {knowledge_base_tokens})"
+                + (f", {'; '.join(budget['actions'])}" if budget["actions"] else ""))
+
+    logs_dir = os.path.join(settings.generator["outputBaseDir"], 'logs')
+    os.makedirs(logs_dir, exist_ok=True)
+    with _record_lock:
+        with open(os.path.join(logs_dir, 'token_budget.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    return record
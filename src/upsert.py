@@ -0,0 +1,218 @@
+# Update of the existing Xray tests of a story instead of creating new ones
+import logging
+import os
+import sys
+
+import numpy as np
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from dedup import test_case_text, shingles, minhash_signature
+from jira_client import update_jira_issue_fields
+from xray_client import build_xray_test, update_test_steps
+from xray_mirror import ensure_mirror_fresh, get_story_tests, refresh_mirrored_tests, record_story_tests
+
+logger = logging.getLogger(__name__)
+
+STEP_FIELDS = ("action", "data", "result")
+
+def _step_values(step):
+    return tuple(str(step.get(field) or "") for field in STEP_FIELDS)
+
+def diff_test_case(test_case, existing_test):
+    """
+    Compare a generated test case with an existing Xray test
+
+    Args:
+        test_case (dict): Generated test case
+        existing_test (dict): Test of the mirror (see xray_mirror.get_story_tests)
+
+    Returns:
+        dict: Changes to apply: "fields" (new summary and description, if changed),
+            "updatedSteps" ((step id, step) pairs), "addedSteps" and "removedStepIds"
+    """
+    xray_test = build_xray_test(test_case)
+    fields = {name: xray_test["fields"][name] for name in ("summary", "description")
+              if (xray_test["fields"][name] or "") != (existing_test.get(name) or "")}
+
+    new_steps = [dict(zip(STEP_FIELDS, _step_values(step))) for step in xray_test["steps"]]
+    old_steps = existing_test["steps"]
+    common = min(len(new_steps), len(old_steps))
+    return {
+        "fields": fields,
+        "updatedSteps": [(old_steps[i].get("id"), new_steps[i]) for i in range(common)
+                         if _step_values(old_steps[i]) != _step_values(new_steps[i])],
+        "addedSteps": new_steps[common:],
+        "removedStepIds": [step.get("id") for step in old_steps[common:]]
+    }
+
+def has_changes(changes):
+    """Check whether a diff returned by diff_test_case changes anything"""
+    return bool(changes["fields"] or changes["updatedSteps"] or changes["addedSteps"] or changes["removedStepIds"])
+
+class StoryTestUpserter:
+    """
+    Match the generated test cases of a story with the tests already linked to it
+
+    The tests linked to the story are read from the local Xray mirror. Each
+    generated test case is compared with the ones not matched yet through the
+    MinHash signatures of their summary and steps; if the best estimated
+    Jaccard similarity reaches xray["upsertThreshold"], the existing test is
+    updated with only the fields and steps that changed, instead of creating a
+    new test.
+    """
+
+    def __init__(self, user_story_key, story_summary=None, excluded_keys=None, candidate_keys=None):
+        """
+        Load the tests already linked to a story
+
+        Args:
+            user_story_key (str): The key of the user story
+            story_summary (str, optional): Title of the story, ignored in the summaries
+            excluded_keys (iterable, optional): Linked tests that must not be matched
+                (e.g. the tests of the scenarios kept by an incremental run)
+            candidate_keys (iterable, optional): If given, only these linked tests can be matched
+        """
+        self.user_story_key = user_story_key
+        self.story_summary = story_summary
+        self.threshold = settings.xray.get("upsertThreshold", 0.5)
+        self.num_permutations = settings.dedup.get("numPermutations", 128)
+        # Une régénération reformule le test: comparer des mots plutôt que des suites de mots
+        self.shingle_size = settings.xray.get("upsertShingleSize", 1)
+        self.report = []
+        self.matched = set()
+
+        if not ensure_mirror_fresh():
+            logger.warning("Xray mirror could not be synchronized, matching against the tests already mirrored")
+        self.existing = get_story_tests(user_story_key)
+        if excluded_keys:
+            excluded_keys = set(excluded_keys)
+            self.existing = [test for test in self.existing if test["key"] not in excluded_keys]
+        if candidate_keys is not None:
+            candidate_keys = set(candidate_keys)
+            self.existing = [test for test in self.existing if test["key"] in candidate_keys]
+        logger.info(f"{len(self.existing)} existing tests linked to {user_story_key} can be updated")
+
+        self.signatures = np.zeros((len(self.existing), self.num_permutations), dtype=np.uint64)
+        # Un test sans texte ni un test déjà associé ne peuvent plus être choisis
+        self.available = np.zeros(len(self.existing), dtype=bool)
+        for i, test in enumerate(self.existing):
+            signature = self._signature(test)
+            if signature is not None:
+                self.signatures[i] = signature
+                self.available[i] = True
+
+    def _signature(self, test_case):
+        return minhash_signature(shingles(test_case_text(test_case, self.story_summary), self.shingle_size),
+                                 self.num_permutations)
+
+    def match(self, test_case):
+        """
+        Find the existing test closest to a generated test case, among the ones not matched yet
+
+        Args:
+            test_case (dict): Generated test case
+
+        Returns:
+            tuple or None: (existing test, similarity), or None if no test is similar enough
+        """
+        signature = self._signature(test_case)
+        if signature is None or not self.available.any():
+            return None
+        similarities = np.where(self.available, (self.signatures == signature).mean(axis=1), -1.0)
+        best = int(similarities.argmax())
+        if similarities[best] < self.threshold:
+            return None
+        self.available[best] = False
+        self.matched.add(self.existing[best]["key"])
+        return self.existing[best], float(similarities[best])
+
+    def apply(self, test_case, result):
+        """
+        Update the existing test matching a generated test case, if any
+
+        Args:
+            test_case (dict): Generated test case
+            result (dict): Result entry of the test case (updated in place)
+
+        Returns:
+            bool: True if the test case matched an existing test (updated or not),
+                False if it must be created
+        """
+        matched = self.match(test_case)
+        if matched is None:
+            return False
+        existing_test, similarity = matched
+        key = existing_test["key"]
+        result["key"] = key
+
+        try:
+            changes = diff_test_case(test_case, existing_test)
+            if (changes["updatedSteps"] or changes["removedStepIds"] or changes["addedSteps"]) and \
+                    (not existing_test.get("issueId") or any(not step.get("id") for step in existing_test["steps"])):
+                # Test créé depuis la dernière synchronisation: relire ses identifiants d'étapes
+                existing_test = refresh_mirrored_tests([key]).get(key)
+                if existing_test is None:
+                    raise Exception("test not found in Xray")
+                changes = diff_test_case(test_case, existing_test)
+
+            if not has_changes(changes):
+                logger.info(f"Test {key} is up to date with '{test_case.get('summary', '')}'")
+                result["success"] = True
+                result["unchanged"] = True
+                self.report.append({"key": key, "testCase": test_case.get("summary", ""),
+                                    "similarity": round(similarity, 3), "changes": []})
+                return True
+
+            if changes["fields"]:
+                update_jira_issue_fields(key, changes["fields"])
+            mutations = update_test_steps(existing_test["issueId"], changes["updatedSteps"], changes["addedSteps"],
+                                          changes["removedStepIds"])
+        except Exception as error:
+            logger.error(f"Error updating test {key}: {str(error)}")
+            result["error"] = f"Update of {key} failed: {str(error)}"
+            return True
+
+        # Garder le miroir à jour, avec les identifiants des étapes ajoutées
+        updated_ids = {step_id: step for step_id, step in changes["updatedSteps"]}
+        steps = [dict(updated_ids.get(step.get("id"), step), id=step.get("id"))
+                 for step in existing_test["steps"] if step.get("id") not in changes["removedStepIds"]]
+        steps += [dict(step, id=(mutations.get(f"add{i}") or {}).get("id")) for i, step in enumerate(changes["addedSteps"])]
+        record_story_tests([dict(existing_test, steps=steps, **changes["fields"])], self.user_story_key)
+
+        described = list(changes["fields"])
+        if changes["updatedSteps"] or changes["addedSteps"] or changes["removedStepIds"]:
+            described.append(f"steps ({len(changes['updatedSteps'])} modified, {len(changes['addedSteps'])} added, "
+                             f"{len(changes['removedStepIds'])} removed)")
+        logger.info(f"Updated test {key}: {', '.join(described)}")
+        result["success"] = True
+        result["updated"] = True
+        self.report.append({"key": key, "testCase": test_case.get("summary", ""),
+                            "similarity": round(similarity, 3), "changes": described})
+        return True
+
+    def record_created(self, test_cases, results):
+        """
+        Record in the mirror the tests created for the unmatched test cases
+
+        Args:
+            test_cases (list): Test cases sent to Xray
+            results (list): Their result entries, in the same order
+        """
+        created = []
+        for test_case, result in zip(test_cases, results):
+            if result.get("success") and result.get("key"):
+                xray_test = build_xray_test(test_case)
+                created.append({"key": result["key"], "summary": xray_test["fields"]["summary"],
+                                "description": xray_test["fields"]["description"], "steps": xray_test["steps"]})
+        if created:
+            record_story_tests(created, self.user_story_key)
+
+    def unmatched_tests(self):
+        """Keys of the existing tests that matched no generated test case (left untouched)"""
+        return [test["key"] for test in self.existing if test["key"] not in self.matched]
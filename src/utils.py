@@ -4,8 +4,15 @@ import requests
 import os
 import logging
 import sys
+import time
+import random
+import threading
 from pathlib import Path
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from config import settings
 
@@ -29,16 +36,178 @@ def setup_logging():
 
 logger = setup_logging()
 
-def make_request(url, method='GET', headers=None, data=None, json_data=None):
+# Codes HTTP pour lesquels une nouvelle tentative a un sens
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+# Codes indiquant que la requête n'a pas été traitée: on peut réessayer même un POST
+NOT_PROCESSED_STATUS_CODES = {429, 503, 529}
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+# Une session (et donc un pool de connexions keep-alive) par hôte, partagée entre les threads
+_sessions = {}
+_stats = {}
+_sessions_lock = threading.Lock()
+
+def get_session(url):
+    """
+    Get the shared HTTP session for the host of a URL
+    
+    Args:
+        url (str): Request URL
+    
+    Returns:
+        requests.Session: Session with a keep-alive connection pool for this host
+    """
+    host = urlparse(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.http.get("poolMaxSize", 10),
+                max_retries=0
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+            _stats[host] = {"requests": 0, "retries": 0, "errors": 0}
+        return session
+
+def _record(host, counter):
+    with _sessions_lock:
+        _stats[host][counter] += 1
+
+def compute_retry_delay(attempt, retry_after=None):
+    """
+    Compute the delay before the next attempt
+    
+    The Retry-After header is honoured when the server sends one, otherwise
+    the delay follows an exponential backoff with full jitter.
+    
+    Args:
+        attempt (int): Number of the attempt that just failed (starting at 0)
+        retry_after (str, optional): Value of the Retry-After header of the failed attempt
+    
+    Returns:
+        float: Delay in seconds
+    """
+    backoff_max = settings.http.get("backoffMax", 30)
+    if retry_after:
+        try:
+            return min(float(retry_after), backoff_max)
+        except ValueError:
+            try:
+                retry_date = parsedate_to_datetime(retry_after)
+                return min(max(retry_date.timestamp() - time.time(), 0), backoff_max)
+            except (TypeError, ValueError):
+                pass
+    
+    ceiling = min(backoff_max, settings.http.get("backoffFactor", 0.5) * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+def is_connection_not_established(error):
+    """
+    Check whether a requests exception was raised before the request reached the server
+    
+    Args:
+        error (Exception): Exception raised by requests
+    
+    Returns:
+        bool: True on a connect timeout, a refused connection or a name resolution failure
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests enveloppe l'erreur urllib3 (MaxRetryError) dont la cause est dans "reason"
+    cause = error.args[0] if error.args else None
+    return isinstance(cause, NewConnectionError) or isinstance(getattr(cause, "reason", None), NewConnectionError)
+
+def send_request(method, url, **kwargs):
+    """
+    Send an HTTP request through the shared session of the host, with retries
+    
+    Requests are retried on connection errors and on 429/5xx responses. Requests
+    that are not idempotent (POST) are only retried when the server did not
+    process them (connect timeout, connection refused, 429, 503, 529).
+    
+    Args:
+        method (str): HTTP method (GET, POST, PUT, DELETE...)
+        url (str): Request URL
+        **kwargs: Arguments passed to requests.Session.request (headers, json, data, params...)
+    
+    Returns:
+        requests.Response: The last response received
+    """
+    method = method.upper()
+    session = get_session(url)
+    host = urlparse(url).netloc
+    kwargs.setdefault('timeout', (settings.http.get("connectTimeout", 10), settings.http.get("readTimeout", 300)))
+    max_retries = settings.http.get("maxRetries", 3)
+    idempotent = method in IDEMPOTENT_METHODS
+    
+    attempt = 0
+    while True:
+        _record(host, "requests")
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            retryable = idempotent or is_connection_not_established(e)
+            if not retryable or attempt >= max_retries:
+                _record(host, "errors")
+                raise
+            delay = compute_retry_delay(attempt)
+            logger.warning(f"{method} {url} failed ({type(e).__name__}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+        else:
+            retryable = response.status_code in (RETRY_STATUS_CODES if idempotent else NOT_PROCESSED_STATUS_CODES)
+            if not retryable or attempt >= max_retries:
+                if response.status_code >= 400:
+                    _record(host, "errors")
+                return response
+            delay = compute_retry_delay(attempt, response.headers.get('Retry-After'))
+            logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            response.close()
+        
+        _record(host, "retries")
+        time.sleep(delay)
+        attempt += 1
+
+def get_pool_stats():
+    """
+    Get statistics about the shared HTTP sessions
+    
+    Returns:
+        dict: For each host, the number of requests, retries and errors, and the
+              number of connections opened by the pool (requests / connections
+              gives the keep-alive reuse ratio)
+    """
+    stats = {}
+    with _sessions_lock:
+        for host, session in _sessions.items():
+            host_stats = dict(_stats[host])
+            adapter = session.get_adapter(f"https://{host}")
+            pools = [adapter.poolmanager.pools[key] for key in adapter.poolmanager.pools.keys()]
+            host_stats["connections"] = sum(pool.num_connections for pool in pools)
+            stats[host] = host_stats
+    return stats
+
+def log_pool_stats():
+    """Log the statistics of the shared HTTP sessions"""
+    for host, host_stats in get_pool_stats().items():
+        logger.info(f"HTTP pool {host}: {host_stats['requests']} requests over {host_stats['connections']} connections, "
+                    f"{host_stats['retries']} retries, {host_stats['errors']} errors")
+
+def make_request(url, method='GET', headers=None, data=None, json_data=None, params=None):
     """
     Make an HTTP request
     
     Args:
         url (str): Request URL
-        method (str): HTTP method (GET, POST, etc.)
+        method (str): HTTP method (GET, POST, PUT, DELETE)
         headers (dict): Request headers
         data (str): Raw data to send
         json_data (dict): JSON data to send
+        params (dict): Query string parameters
     
     Returns:
         dict or str: Response data
@@ -46,16 +215,14 @@ def make_request(url, method='GET', headers=None, data=None, json_data=None):
     logger.info(f"Making {method} request to: {url}")
     
     try:
-        if method == 'GET':
-            response = requests.get(url, headers=headers)
-        elif method == 'POST':
-            if json_data:
-                response = requests.post(url, headers=headers, json=json_data)
-            else:
-                response = requests.post(url, headers=headers, data=data)
-        else:
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
             raise ValueError(f"Unsupported HTTP method: {method}")
         
+        if json_data is not None:
+            response = send_request(method, url, headers=headers, json=json_data, params=params)
+        else:
+            response = send_request(method, url, headers=headers, data=data, params=params)
+        
         logger.info(f"Response status code: {response.status_code}")
         
         if response.status_code >= 200 and response.status_code < 300:
@@ -84,4 +251,4 @@ def make_request(url, method='GET', headers=None, data=None, json_data=None):
     
     except requests.RequestException as e:
         logger.error(f"Request error: {str(e)}")
-        raise
\ No newline at end of file
+        raise
@@ -1,10 +1,13 @@
 # Xray API client for the Test Case Generator
 import logging
-import requests
 import json
 import sys
 import os
 import re
+import time
+import base64
+import threading
+from datetime import datetime
 
 # Ajouter le chemin du projet au PYTHONPATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -13,13 +16,36 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 from config import settings
-from utils import make_request
+from utils import make_request, send_request
 
 logger = logging.getLogger(__name__)
 
-def get_xray_auth_token():
+# Token Xray partagé par tous les threads (un batch n'authentifie qu'une fois)
+_token_cache = {"token": None, "expiresAt": 0.0}
+_token_lock = threading.Lock()
+_auth_lock = threading.Lock()
+
+def _decode_token_expiry(token):
     """
-    Obtenir un token d'authentification pour l'API Xray
+    Lire la date d'expiration d'un token Xray (JWT)
+    
+    Args:
+        token (str): Token d'authentification
+    
+    Returns:
+        float or None: Timestamp d'expiration, ou None si le token ne peut pas être décodé
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+def _authenticate_xray():
+    """
+    Demander un nouveau token d'authentification à l'API Xray
     
     Returns:
         str: Token d'authentification
@@ -37,7 +63,7 @@ def get_xray_auth_token():
     }
     
     try:
-        response = requests.post(auth_url, json=auth_data, headers=headers)
+        response = send_request('POST', auth_url, json=auth_data, headers=headers)
         response.raise_for_status()
         token = response.text.strip('"')  # Le token est retourné entre guillemets
         logger.info("Successfully obtained Xray API token")
@@ -46,6 +72,277 @@ def get_xray_auth_token():
         logger.error(f"Error obtaining Xray API token: {str(e)}")
         raise
 
+def get_cached_xray_auth_token():
+    """
+    Lire le token Xray en cache s'il est encore valide
+    
+    Returns:
+        str or None: Token d'authentification, ou None s'il faut le renouveler
+    """
+    with _token_lock:
+        margin = settings.xray.get("tokenRefreshMargin", 300)
+        if _token_cache["token"] and time.time() < _token_cache["expiresAt"] - margin:
+            return _token_cache["token"]
+        return None
+
+def store_xray_auth_token(token):
+    """
+    Mettre en cache un nouveau token Xray avec sa date d'expiration
+    
+    Args:
+        token (str): Token d'authentification
+    """
+    expires_at = _decode_token_expiry(token)
+    if expires_at is None:
+        # Token opaque: se fier à la durée de validité configurée
+        expires_at = time.time() + settings.xray.get("tokenLifetime", 3600)
+    
+    with _token_lock:
+        _token_cache["token"] = token
+        _token_cache["expiresAt"] = expires_at
+    logger.debug(f"Xray API token valid until {datetime.fromtimestamp(expires_at).isoformat()}")
+
+def get_xray_auth_token(force_refresh=False):
+    """
+    Obtenir un token d'authentification pour l'API Xray
+    
+    Le token est mis en cache et partagé entre les threads. Il est renouvelé
+    peu avant son expiration (settings.xray["tokenRefreshMargin"]).
+    
+    Args:
+        force_refresh (bool, optional): Ignorer le cache et s'authentifier à nouveau
+    
+    Returns:
+        str: Token d'authentification
+    """
+    # Un seul thread s'authentifie, les autres attendent puis réutilisent son token
+    with _auth_lock:
+        token = None if force_refresh else get_cached_xray_auth_token()
+        if token is None:
+            token = _authenticate_xray()
+            store_xray_auth_token(token)
+        return token
+
+def invalidate_xray_auth_token(token=None):
+    """
+    Retirer un token du cache pour forcer une nouvelle authentification
+    
+    Args:
+        token (str, optional): Token refusé. Si un autre thread a déjà renouvelé le
+            token en cache, celui-ci est conservé.
+    """
+    with _token_lock:
+        if token is None or _token_cache["token"] == token:
+            _token_cache["token"] = None
+            _token_cache["expiresAt"] = 0.0
+
+def xray_request(method, url, **kwargs):
+    """
+    Envoyer une requête authentifiée à l'API Xray
+    
+    Si l'API répond 401, le token est renouvelé et la requête renvoyée une fois.
+    
+    Args:
+        method (str): Méthode HTTP
+        url (str): URL de la requête
+        **kwargs: Arguments passés à send_request (json, params...)
+    
+    Returns:
+        requests.Response: La réponse de l'API
+    """
+    headers = dict(kwargs.pop('headers', None) or {})
+    headers.setdefault('Content-Type', 'application/json')
+    
+    token = get_xray_auth_token()
+    headers['Authorization'] = f'Bearer {token}'
+    response = send_request(method, url, headers=headers, **kwargs)
+    
+    if response.status_code == 401:
+        logger.info("Xray API token rejected, re-authenticating")
+        invalidate_xray_auth_token(token)
+        headers['Authorization'] = f'Bearer {get_xray_auth_token()}'
+        response = send_request(method, url, headers=headers, **kwargs)
+    
+    return response
+
+def build_xray_test(test_case):
+    """
+    Convertir un test case généré par Claude au format d'import Xray
+    
+    Args:
+        test_case (dict): Test case généré (summary, description, steps)
+    
+    Returns:
+        dict: Test au format attendu par l'API Xray v2
+    """
+    # Convertir les étapes du format Claude au format attendu par Xray
+    xray_steps = []
+    # Vérifier si test_case contient directement des étapes ou si elles sont dans une sous-clé "steps"
+    steps_data = test_case.get("steps", [])
+    if not steps_data and isinstance(test_case, list):
+        # Si test_case est une liste, c'est peut-être directement une liste d'étapes
+        steps_data = test_case
+    
+    for step in steps_data:
+        xray_steps.append({
+            "action": step.get("action", ""),
+            "data": step.get("data", ""),
+            "result": step.get("result", "")
+        })
+    
+    # Créer le test au format Xray selon la structure attendue
+    # Extraire le résumé et la description en gérant le cas où ils n'existent pas
+    summary = test_case.get("summary", "Test Case")
+    description = test_case.get("description", "")
+    
+    # Si test_case est une liste d'étapes, utiliser un titre par défaut
+    if isinstance(test_case, list):
+        summary = "Generated Test Case"
+        description = "Test case generated from steps data"
+    
+    # Traitement spécial pour les tableaux markdown dans la description
+    if description and isinstance(description, str):
+        # Assurer que les lignes de tableau sont correctement formatées
+        # Vérifier si nous avons des tableaux dans la description
+        if "|" in description and "\n" in description:
+            # Ajouter des espaces autour du contenu des cellules pour une meilleure lisibilité
+            table_pattern = r'\|([^\|]*?)\|'
+            description = re.sub(table_pattern, lambda m: f"| {m.group(1).strip()} |", description)
+            
+            # S'assurer que les lignes de séparation des en-têtes sont correctes
+            table_header_pattern = r'\|(.*?)\|\s*\n\s*\|([-\|\s]+)\|'
+            description = re.sub(table_header_pattern, lambda m: f"|{m.group(1)}|\n|{m.group(2)}|\n", description)
+    
+    # Structure exacte du format attendu par Xray (format simple)
+    xray_test = {
+        "fields": {
+            "summary": summary,
+            "description": description,
+            "project": {
+                "key": settings.jira["testProjectKey"]
+            },
+            "issuetype": {
+                "name": "Test"
+            }
+        },
+        "testtype": settings.xray.get("defaultTestType", "Manual"),  # Utiliser la valeur par défaut de la configuration
+        "steps": xray_steps
+    }
+    
+    return xray_test
+
+def build_xray_tests(test_cases):
+    """
+    Préparer les données de test au format attendu par l'API Xray v2
+    
+    Args:
+        test_cases (list): Liste de dictionnaires contenant les données des test cases
+    
+    Returns:
+        list: Tests au format Xray, dans le même ordre
+    """
+    xray_tests = [build_xray_test(test_case) for test_case in test_cases]
+    
+    # Pour débogage, afficher les données envoyées à l'API
+    if settings.xray.get("debug_mode", False):
+        logger.debug(f"Data sent to API: {json.dumps(xray_tests, indent=2)}")
+    
+    return xray_tests
+
+def parse_single_import_response(result):
+    """
+    Interpréter la réponse d'un import simple (un seul test case)
+    
+    Args:
+        result (dict or list): Réponse de l'API /import/test
+    
+    Returns:
+        dict: Résultat de l'import
+    """
+    # Vérifier le format de la réponse qui peut avoir changé avec le nouveau format
+    if isinstance(result, dict) and "testKeys" in result:
+        test_keys = result.get("testKeys", [])
+    elif isinstance(result, list):
+        # Dans certaines versions de l'API, la réponse peut être une liste directement
+        test_keys = result
+    elif isinstance(result, dict) and "key" in result:
+        # Réponse pour un seul test case créé
+        test_keys = [result.get("key")]
+    else:
+        test_keys = []
+        logger.warning(f"Unexpected response format from Xray API: {result}")
+    
+    logger.info(f"Successfully imported {len(test_keys)} test cases to Xray")
+    
+    # Ajouter les détails d'import au résultat
+    return {
+        "success": True,
+        "importedTests": test_keys,
+        "errors": result.get("errors", []) if isinstance(result, dict) else [],
+        "message": f"Successfully imported {len(test_keys)} test cases"
+    }
+
+def build_job_result(job_id, final_status):
+    """
+    Construire le résultat d'un import en masse à partir du statut final du job
+    
+    Args:
+        job_id (str): L'identifiant du job d'import
+        final_status (dict): Statut final retourné par poll_import_job_status
+    
+    Returns:
+        dict: Résultat de l'import avec les clés des tests créés
+    """
+    # Vérifier si le job s'est terminé avec succès
+    if final_status.get("status") in ["successful", "partially_successful"]:
+        # Extraire les résultats
+        result = final_status.get("result", {})
+        logger.debug(f"Final job status: {final_status}")
+        issues = result.get("issues", [])
+        logger.info(f"Found {len(issues)} successfully imported tests in result")
+        
+        # Extraire les clés des issues créées
+        test_keys = []
+        for issue in issues:
+            if "key" in issue:
+                test_keys.append(issue.get("key"))
+                logger.debug(f"Added test key: {issue.get('key')}")
+        errors = result.get("errors", [])
+        
+        return {
+            "success": True,
+            "jobId": job_id,
+            "status": final_status.get("status"),
+            "importedTests": test_keys,
+            "errors": errors,
+            "message": f"Job completed. Successfully imported: {len(test_keys)}, Failed: {len(errors)}"
+        }
+    else:
+        return {
+            "success": False,
+            "jobId": job_id,
+            "status": final_status.get("status"),
+            "errors": final_status.get("result", {}).get("errors", []),
+            "message": f"Job failed or timed out with status: {final_status.get('status')}"
+        }
+
+def link_tests_to_story(test_keys, user_story_key):
+    """
+    Créer les liens entre les tests créés et la user story
+    
+    Args:
+        test_keys (list): Clés des tests créés
+        user_story_key (str): Clé de la user story associée
+    """
+    if len(test_keys) > 0 and user_story_key:
+        logger.info(f"Creating links between {len(test_keys)} tests and user story {user_story_key}")
+        for test_key in test_keys:
+            try:
+                # Utiliser une fonction pour créer un lien après la création des tests
+                create_test_to_story_link(test_key, user_story_key)
+            except Exception as link_error:
+                logger.warning(f"Failed to create link between {test_key} and {user_story_key}: {str(link_error)}")
+
 def import_test_cases_to_xray(test_cases, user_story_key, wait_for_completion=False, max_polling_attempts=20, polling_interval=5):
     """
     Importer des test cases en masse vers Xray en utilisant l'API v2
@@ -62,77 +359,7 @@ def import_test_cases_to_xray(test_cases, user_story_key, wait_for_completion=Fa
     """
     logger.info(f"Importing {len(test_cases)} test cases to Xray for user story {user_story_key}")
     
-    # Obtenir le token d'authentification
-    token = get_xray_auth_token()
-    
-    # Préparer les données de test au format attendu par l'API Xray v2
-    xray_tests = []
-    for test_case in test_cases:
-        # Convertir les étapes du format Claude au format attendu par Xray
-        xray_steps = []
-        # Vérifier si test_case contient directement des étapes ou si elles sont dans une sous-clé "steps"
-        steps_data = test_case.get("steps", [])
-        if not steps_data and isinstance(test_case, list):
-            # Si test_case est une liste, c'est peut-être directement une liste d'étapes
-            steps_data = test_case
-        
-        for step in steps_data:
-            xray_steps.append({
-                "action": step.get("action", ""),
-                "data": step.get("data", ""),
-                "result": step.get("result", "")
-            })
-        
-        # Créer le test au format Xray selon la structure attendue
-        # Extraire le résumé et la description en gérant le cas où ils n'existent pas
-        summary = test_case.get("summary", "Test Case")
-        description = test_case.get("description", "")
-        
-        # Si test_case est une liste d'étapes, utiliser un titre par défaut
-        if isinstance(test_case, list):
-            summary = "Generated Test Case"
-            description = "Test case generated from steps data"
-        
-        # Traitement spécial pour les tableaux markdown dans la description
-        if description and isinstance(description, str):
-            # Assurer que les lignes de tableau sont correctement formatées
-            # Vérifier si nous avons des tableaux dans la description
-            if "|" in description and "\n" in description:
-                # Ajouter des espaces autour du contenu des cellules pour une meilleure lisibilité
-                table_pattern = r'\|([^\|]*?)\|'
-                description = re.sub(table_pattern, lambda m: f"| {m.group(1).strip()} |", description)
-                
-                # S'assurer que les lignes de séparation des en-têtes sont correctes
-                table_header_pattern = r'\|(.*?)\|\s*\n\s*\|([-\|\s]+)\|'
-                description = re.sub(table_header_pattern, lambda m: f"|{m.group(1)}|\n|{m.group(2)}|\n", description)
-        
-        # Structure exacte du format attendu par Xray (format simple)
-        xray_test = {
-            "fields": {
-                "summary": summary,
-                "description": description,
-                "project": {
-                    "key": settings.jira["testProjectKey"]
-                },
-                "issuetype": {
-                    "name": "Test"
-                }
-            },
-            "testtype": settings.xray.get("defaultTestType", "Manual"),  # Utiliser la valeur par défaut de la configuration
-            "steps": xray_steps
-        }
-        
-        xray_tests.append(xray_test)
-    
-    # Préparer les en-têtes avec le token d'authentification
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {token}'
-    }
-    
-    # Pour débogage, afficher les données envoyées à l'API
-    if settings.xray.get("debug_mode", False):
-        logger.debug(f"Data sent to API: {json.dumps(xray_tests, indent=2)}")
+    xray_tests = build_xray_tests(test_cases)
         
     try:
         # Déterminer si nous utilisons l'import individuel ou en masse
@@ -141,14 +368,14 @@ def import_test_cases_to_xray(test_cases, user_story_key, wait_for_completion=Fa
             logger.info("Sending single test case import request to Xray API")
             # Utiliser l'URL standard
             import_url = "https://xray.cloud.getxray.app/api/v2/import/test"
-            response = requests.post(import_url, json=xray_tests[0], headers=headers)
+            response = xray_request('POST', import_url, json=xray_tests[0])
             is_bulk_import = False
         else:
             # Pour plusieurs test cases, utiliser l'import en masse 
             logger.info(f"Sending bulk import request to Xray API for {len(xray_tests)} test cases")
             # Utiliser l'URL standard pour l'import en masse
             import_url = "https://xray.cloud.getxray.app/api/v2/import/test/bulk"
-            response = requests.post(import_url, json=xray_tests, headers=headers)
+            response = xray_request('POST', import_url, json=xray_tests)
             is_bulk_import = True
         
         response.raise_for_status()
@@ -164,55 +391,17 @@ def import_test_cases_to_xray(test_cases, user_story_key, wait_for_completion=Fa
                 logger.info(f"Bulk import job created with ID: {job_id}")
                 
                 # Récupérer le statut initial du job
-                job_status = get_import_job_status(job_id, token)
+                job_status = get_import_job_status(job_id)
                 
                 # Si demandé, attendre la fin du job
                 if wait_for_completion:
                     logger.info(f"Waiting for job {job_id} to complete...")
                     final_status = poll_import_job_status(job_id, max_polling_attempts, polling_interval)
                     
-                    # Vérifier si le job s'est terminé avec succès
-                    if final_status.get("status") in ["successful", "partially_successful"]:
-                        # Extraire les résultats
-                        result = final_status.get("result", {})
-                        logger.debug(f"Final job status: {final_status}")
-                        issues = result.get("issues", [])
-                        logger.info(f"Found {len(issues)} successfully imported tests in result")
-                        
-                        # Extraire les clés des issues créées
-                        test_keys = []
-                        for issue in issues:
-                            if "key" in issue:
-                                test_keys.append(issue.get("key"))
-                                logger.debug(f"Added test key: {issue.get('key')}")
-                        errors = result.get("errors", [])
-                        
-                        # Créer les liens entre les tests créés et la user story
-                        if len(test_keys) > 0 and user_story_key:
-                            logger.info(f"Creating links between {len(test_keys)} tests and user story {user_story_key}")
-                            for test_key in test_keys:
-                                try:
-                                    # Utiliser une fonction pour créer un lien après la création des tests
-                                    create_test_to_story_link(test_key, user_story_key, token)
-                                except Exception as link_error:
-                                    logger.warning(f"Failed to create link between {test_key} and {user_story_key}: {str(link_error)}")
-                        
-                        return {
-                            "success": True,
-                            "jobId": job_id,
-                            "status": final_status.get("status"),
-                            "importedTests": test_keys,
-                            "errors": errors,
-                            "message": f"Job completed. Successfully imported: {len(test_keys)}, Failed: {len(errors)}"
-                        }
-                    else:
-                        return {
-                            "success": False,
-                            "jobId": job_id,
-                            "status": final_status.get("status"),
-                            "errors": final_status.get("result", {}).get("errors", []),
-                            "message": f"Job failed or timed out with status: {final_status.get('status')}"
-                        }
+                    job_result = build_job_result(job_id, final_status)
+                    if job_result["success"]:
+                        link_tests_to_story(job_result["importedTests"], user_story_key)
+                    return job_result
                 
                 # Si pas d'attente demandée, retourner le statut initial
                 return {
@@ -227,28 +416,7 @@ def import_test_cases_to_xray(test_cases, user_story_key, wait_for_completion=Fa
                 logger.warning(f"Unexpected response format from Xray API bulk import: {result}")
         else:
             # Pour l'import simple, nous avons une réponse directe
-            # Vérifier le format de la réponse qui peut avoir changé avec le nouveau format
-            if isinstance(result, dict) and "testKeys" in result:
-                test_keys = result.get("testKeys", [])
-            elif isinstance(result, list):
-                # Dans certaines versions de l'API, la réponse peut être une liste directement
-                test_keys = result
-            elif isinstance(result, dict) and "key" in result:
-                # Réponse pour un seul test case créé
-                test_keys = [result.get("key")]
-            else:
-                test_keys = []
-                logger.warning(f"Unexpected response format from Xray API: {result}")
-            
-            logger.info(f"Successfully imported {len(test_keys)} test cases to Xray")
-            
-            # Ajouter les détails d'import au résultat
-            return {
-                "success": True,
-                "importedTests": test_keys,
-                "errors": result.get("errors", []) if isinstance(result, dict) else [],
-                "message": f"Successfully imported {len(test_keys)} test cases"
-            }
+            return parse_single_import_response(result)
     except Exception as e:
         logger.error(f"Error importing test cases to Xray: {str(e)}")
         return {
@@ -263,7 +431,7 @@ def get_import_job_status(job_id, token=None):
     
     Args:
         job_id (str): L'identifiant du job d'import
-        token (str, optional): Token d'authentification. Si None, un nouveau token sera obtenu.
+        token (str, optional): Non utilisé, le token partagé est utilisé. Gardé pour compatibilité.
     
     Returns:
         dict: Statut du job d'import contenant les informations sur l'avancement
@@ -271,18 +439,10 @@ def get_import_job_status(job_id, token=None):
     """
     logger.info(f"Checking status of import job: {job_id}")
     
-    # Si pas de token fourni, en obtenir un nouveau
-    if token is None:
-        token = get_xray_auth_token()
-    
     url = f"https://xray.cloud.getxray.app/api/v2/import/test/bulk/{job_id}/status"
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {token}'
-    }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = xray_request('GET', url)
         response.raise_for_status()
         status_data = response.json()
         
@@ -323,15 +483,12 @@ def poll_import_job_status(job_id, max_attempts=20, interval=5):
     
     logger.info(f"Polling import job status for job {job_id}. Max attempts: {max_attempts}, Interval: {interval}s")
     
-    # Obtenir un token valide pour toutes les requêtes
-    token = get_xray_auth_token()
-    
     attempts = 0
     status_data = {"status": "unknown"}
     
     while attempts < max_attempts:
         # Vérifier le statut
-        status_data = get_import_job_status(job_id, token)
+        status_data = get_import_job_status(job_id)
         job_status = status_data.get("status", "")
         
         # Journaliser les progrès à chaque tentative
@@ -367,6 +524,29 @@ def poll_import_job_status(job_id, max_attempts=20, interval=5):
     logger.warning(f"Maximum polling attempts reached for job {job_id}. Last status: {status_data.get('status')}")
     return status_data
 
+def build_story_link_data(test_key, story_key):
+    """
+    Construire la requête Jira de lien entre un test et une user story
+    
+    Args:
+        test_key (str): La clé du test case
+        story_key (str): La clé de la user story
+    
+    Returns:
+        dict: Données de la requête /issueLink
+    """
+    return {
+        "type": {
+            "name": "Test"
+        },
+        "inwardIssue": {
+            "key": test_key
+        },
+        "outwardIssue": {
+            "key": story_key
+        }
+    }
+
 def create_test_to_story_link(test_key, story_key, token=None):
     """
     Créer un lien entre un test et une user story
@@ -385,17 +565,7 @@ def create_test_to_story_link(test_key, story_key, token=None):
     url = f"https://{settings.jira['baseUrl']}/rest/api/2/issueLink"
     
     # Structure de base pour la requête
-    link_data = {
-        "type": {
-            "name": "Test" # Sera rempli dans la boucle
-        },
-        "inwardIssue": {
-            "key": test_key
-        },
-        "outwardIssue": {
-            "key": story_key
-        }
-    }
+    link_data = build_story_link_data(test_key, story_key)
     
     success = False
     
@@ -411,7 +581,7 @@ def create_test_to_story_link(test_key, story_key, token=None):
         logger.debug(f"Sending link request to: {url}")
         logger.debug(f"Link data: {json.dumps(link_data)}")
         
-        response = requests.post(url, json=link_data, headers=headers)
+        response = send_request('POST', url, json=link_data, headers=headers)
         response.raise_for_status()
         
         logger.info(f"Successfully created link between {test_key} and {story_key}")
@@ -435,18 +605,145 @@ def get_test_case_details(test_key):
     Returns:
         dict: Détails du test case
     """
-    token = get_xray_auth_token()
-    
     url = f"https://xray.cloud.getxray.app/api/v2/tests/{test_key}"
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {token}'
-    }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = xray_request('GET', url)
         response.raise_for_status()
         return response.json()
     except Exception as e:
         logger.error(f"Error getting test case details: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+XRAY_GRAPHQL_URL = "https://xray.cloud.getxray.app/api/v2/graphql"
+
+def xray_graphql(query, variables=None):
+    """
+    Envoyer une requête à l'API GraphQL d'Xray
+    
+    Args:
+        query (str): Requête ou mutation GraphQL
+        variables (dict, optional): Variables de la requête
+    
+    Returns:
+        dict: Champ "data" de la réponse
+    
+    Raises:
+        Exception: Si l'API retourne des erreurs GraphQL
+    """
+    response = xray_request('POST', XRAY_GRAPHQL_URL, json={"query": query, "variables": variables or {}})
+    response.raise_for_status()
+    payload = response.json()
+    if payload.get("errors"):
+        raise Exception(f"Xray GraphQL error: {payload['errors'][0].get('message', payload['errors'])}")
+    return payload["data"]
+
+def update_test_steps(issue_id, updated_steps=None, added_steps=None, removed_step_ids=None):
+    """
+    Modifier les étapes d'un test existant en une seule requête GraphQL
+    
+    Args:
+        issue_id (str): Identifiant Jira du test (pas sa clé)
+        updated_steps (list, optional): (id de l'étape, {"action", "data", "result"}) des étapes modifiées
+        added_steps (list, optional): Étapes {"action", "data", "result"} à ajouter à la fin du test
+        removed_step_ids (list, optional): Identifiants des étapes à supprimer
+    
+    Returns:
+        dict: Résultat de chaque mutation, par alias
+    """
+    declarations = []
+    mutations = []
+    variables = {}
+    # Une mutation par étape, regroupées par alias dans la même requête
+    for i, (step_id, step) in enumerate(updated_steps or []):
+        declarations += [f"$updateId{i}: String!", f"$update{i}: UpdateStepInput!"]
+        mutations.append(f"update{i}: updateTestStep(stepId: $updateId{i}, step: $update{i}) {{ warnings }}")
+        variables[f"updateId{i}"] = step_id
+        variables[f"update{i}"] = step
+    for i, step in enumerate(added_steps or []):
+        declarations.append(f"$add{i}: CreateStepInput!")
+        mutations.append(f"add{i}: addTestStep(issueId: $issueId, step: $add{i}) {{ id }}")
+        variables[f"add{i}"] = step
+    for i, step_id in enumerate(removed_step_ids or []):
+        declarations.append(f"$removeId{i}: String!")
+        mutations.append(f"remove{i}: removeTestStep(stepId: $removeId{i})")
+        variables[f"removeId{i}"] = step_id
+    
+    if not mutations:
+        return {}
+    if added_steps:
+        declarations.insert(0, "$issueId: String!")
+        variables["issueId"] = issue_id
+    
+    query = f"mutation({', '.join(declarations)}) {{\n    " + "\n    ".join(mutations) + "\n}"
+    logger.info(f"Updating the steps of test {issue_id}: {len(updated_steps or [])} modified, "
+                f"{len(added_steps or [])} added, {len(removed_step_ids or [])} removed")
+    return xray_graphql(query, variables)
+
+def get_job_test_keys(final_status, count):
+    """
+    Associer les tests créés par un job d'import aux tests envoyés
+    
+    Args:
+        final_status (dict): Statut final retourné par poll_import_job_status
+        count (int): Nombre de tests envoyés dans le job
+    
+    Returns:
+        tuple: (clé de chaque test envoyé, None si le test n'a pas été créé;
+            erreurs de chaque test non créé, par position)
+    """
+    result = final_status.get("result") or {}
+    keys = [None] * count
+    issues = [issue for issue in result.get("issues", []) if issue.get("key")]
+    if all("elementNumber" in issue for issue in issues):
+        for issue in issues:
+            if 0 <= issue["elementNumber"] < count:
+                keys[issue["elementNumber"]] = issue["key"]
+    else:
+        # Sans numéro d'élément, les tests créés sont supposés dans l'ordre d'envoi
+        failed = {error.get("elementNumber") for error in result.get("errors", [])}
+        positions = [i for i in range(count) if i not in failed]
+        for position, issue in zip(positions, issues):
+            keys[position] = issue["key"]
+    
+    errors = {error["elementNumber"]: error.get("errors", {}) for error in result.get("errors", [])
+              if isinstance(error.get("elementNumber"), int)}
+    return keys, errors
+
+def import_xray_tests_chunk(test_cases, max_polling_attempts=30, polling_interval=5):
+    """
+    Importer un lot de test cases vers Xray et attendre la fin de l'import, sans créer de liens
+    
+    Args:
+        test_cases (list): Test cases du lot
+        max_polling_attempts (int, optional): Nombre maximum de vérifications du job. Par défaut 30.
+        polling_interval (int, optional): Intervalle en secondes entre deux vérifications. Par défaut 5.
+    
+    Returns:
+        dict: "keys" (clé de chaque test case, None s'il n'a pas été créé), "errors"
+            (erreurs par position), "jobId" et "status" du job (None pour un import simple)
+    
+    Raises:
+        Exception: Si la requête d'import échoue
+    """
+    xray_tests = build_xray_tests(test_cases)
+    
+    if len(xray_tests) == 1:
+        response = xray_request('POST', "https://xray.cloud.getxray.app/api/v2/import/test", json=xray_tests[0])
+        response.raise_for_status()
+        result = parse_single_import_response(response.json())
+        keys = (result["importedTests"] + [None])[:1]
+        return {"keys": keys, "errors": {} if keys[0] else {0: result.get("errors") or "No test key returned"},
+                "jobId": None, "status": "successful" if keys[0] else "unsuccessful"}
+    
+    response = xray_request('POST', "https://xray.cloud.getxray.app/api/v2/import/test/bulk", json=xray_tests)
+    response.raise_for_status()
+    result = response.json()
+    if not isinstance(result, dict) or "jobId" not in result:
+        raise Exception(f"Unexpected response format from Xray API bulk import: {result}")
+    
+    job_id = result["jobId"]
+    logger.info(f"Bulk import job created with ID: {job_id} ({len(xray_tests)} test cases)")
+    final_status = poll_import_job_status(job_id, max_polling_attempts, polling_interval)
+    keys, errors = get_job_test_keys(final_status, len(xray_tests))
+    return {"keys": keys, "errors": errors, "jobId": job_id, "status": final_status.get("status")}
@@ -0,0 +1,414 @@
+# Local SQLite mirror of the tests of the Xray test project
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Ajouter le chemin du projet au PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from config import settings
+from xray_client import xray_graphql
+
+logger = logging.getLogger(__name__)
+
+# Xray Cloud limite getTests à 100 tests par page
+MAX_PAGE_SIZE = 100
+
+MIRROR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tests (
+    key TEXT PRIMARY KEY,
+    issue_id TEXT,
+    summary TEXT NOT NULL,
+    normalized_summary TEXT NOT NULL,
+    description TEXT,
+    updated TEXT,
+    steps TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tests_normalized_summary ON tests (normalized_summary);
+CREATE TABLE IF NOT EXISTS links (
+    test_key TEXT NOT NULL,
+    issue_key TEXT NOT NULL,
+    link_type TEXT NOT NULL,
+    PRIMARY KEY (test_key, issue_key, link_type)
+);
+CREATE INDEX IF NOT EXISTS links_issue_key ON links (issue_key);
+CREATE TABLE IF NOT EXISTS sync_state (
+    project_key TEXT PRIMARY KEY,
+    last_updated TEXT,
+    synced_at TEXT
+);
+"""
+
+TESTS_QUERY = """
+query($jql: String, $limit: Int!, $start: Int) {
+    getTests(jql: $jql, limit: $limit, start: $start) {
+        total
+        start
+        results {
+            issueId
+            jira(fields: ["key", "summary", "description", "updated", "issuelinks"])
+            steps {
+                id
+                action
+                data
+                result
+            }
+        }
+    }
+}
+"""
+
+_sync_lock = threading.Lock()
+# Bases dont le schéma a déjà été créé par ce processus
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+def get_mirror_path():
+    """Path of the SQLite database of the mirror"""
+    return os.path.join(settings.generator["outputBaseDir"], settings.xray_mirror.get("dbFile", "cache/xray_mirror.db"))
+
+@contextmanager
+def _connect():
+    """Open a connection to the mirror for one operation, committed then closed when the block exits"""
+    path = get_mirror_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        connection.row_factory = sqlite3.Row
+        with _init_lock:
+            if path not in _initialized_paths:
+                # WAL: les lectures des autres threads ne sont pas bloquées pendant une synchronisation
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(MIRROR_SCHEMA)
+                _initialized_paths.add(path)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def normalize_summary(summary):
+    """Lowercase a test summary and collapse its punctuation and whitespace, for exact duplicate checks"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', (summary or "").lower()).split())
+
+def parse_jira_datetime(value):
+    """
+    Parse a Jira timestamp
+
+    Args:
+        value (str): Timestamp such as "2024-05-01T10:22:33.000+0200"
+
+    Returns:
+        datetime: The timestamp, with its timezone
+    """
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+def build_mirror_jql(project_key, since=None):
+    """
+    Build the JQL query of a mirror synchronization
+
+    Absolute JQL dates are read in the timezone of the API user, which is not
+    known here, so the query uses a relative date: the minutes elapsed since
+    the last synchronization started, plus xray_mirror["syncOverlapMinutes"];
+    tests fetched twice are simply written again.
+
+    Args:
+        project_key (str): Key of the test project
+        since (str, optional): Start of the last synchronization (local ISO timestamp,
+            see get_last_sync), None for a full synchronization
+
+    Returns:
+        str: JQL query
+    """
+    jql = f'project = "{project_key}"'
+    if since:
+        elapsed = max(0.0, (datetime.now() - datetime.fromisoformat(since)).total_seconds())
+        minutes = int(elapsed // 60) + 1 + settings.xray_mirror.get("syncOverlapMinutes", 60)
+        jql += f" AND updated >= -{minutes}m"
+    return jql + " ORDER BY updated ASC"
+
+def fetch_tests_page(jql, start, limit):
+    """
+    Get one page of tests from the Xray GraphQL API
+
+    Args:
+        jql (str): JQL query selecting the tests
+        start (int): Index of the first test of the page
+        limit (int): Number of tests requested (at most 100)
+
+    Returns:
+        dict: getTests result ("total", "start", "results")
+    """
+    return xray_graphql(TESTS_QUERY, {"jql": jql, "limit": limit, "start": start})["getTests"]
+
+def parse_mirror_test(result):
+    """
+    Convert a getTests result to a mirror entry
+
+    Args:
+        result (dict): Test returned by the Xray GraphQL API
+
+    Returns:
+        dict: Key, issue id, summary, description, updated timestamp, steps
+            (with their id) and (linked issue key, link type) pairs of the test
+    """
+    fields = result.get("jira") or {}
+    links = []
+    for link in fields.get("issuelinks") or []:
+        # Le test est l'une des extrémités du lien: garder l'autre
+        other = link.get("outwardIssue") or link.get("inwardIssue")
+        if other and other.get("key"):
+            links.append((other["key"], (link.get("type") or {}).get("name", "")))
+    return {
+        "key": fields.get("key"),
+        "issueId": result.get("issueId"),
+        "summary": fields.get("summary") or "",
+        "description": fields.get("description") or "",
+        "updated": fields.get("updated"),
+        "steps": [{"id": step.get("id"), "action": step.get("action") or "", "data": step.get("data") or "",
+                   "result": step.get("result") or ""}
+                  for step in result.get("steps") or []],
+        "links": links
+    }
+
+def store_mirror_tests(tests):
+    """
+    Insert or replace tests in the mirror
+
+    Args:
+        tests (list): Mirror entries, as returned by parse_mirror_test
+            ("links" may be left out to keep the recorded links of a test)
+    """
+    with _connect() as connection:
+        for test in tests:
+            connection.execute(
+                "INSERT OR REPLACE INTO tests (key, issue_id, summary, normalized_summary, description, updated, steps) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (test["key"], test.get("issueId"), test["summary"], normalize_summary(test["summary"]),
+                 test.get("description", ""), test.get("updated"), json.dumps(test.get("steps", [])))
+            )
+            # Sans "links", les liens déjà enregistrés sont gardés
+            if test.get("links") is not None:
+                connection.execute("DELETE FROM links WHERE test_key = ?", (test["key"],))
+                connection.executemany(
+                    "INSERT OR IGNORE INTO links (test_key, issue_key, link_type) VALUES (?, ?, ?)",
+                    [(test["key"], issue_key, link_type) for issue_key, link_type in test["links"]]
+                )
+
+def get_last_sync(project_key=None):
+    """
+    Get the synchronization state of the mirror of a test project
+
+    Args:
+        project_key (str, optional): Key of the test project. Defaults to jira["testProjectKey"].
+
+    Returns:
+        dict or None: "lastUpdated" (fields.updated of the last mirrored test) and
+            "syncedAt" (start of the last synchronization), or None if the project was never synchronized
+    """
+    project_key = project_key or settings.jira["testProjectKey"]
+    with _connect() as connection:
+        row = connection.execute("SELECT last_updated, synced_at FROM sync_state WHERE project_key = ?",
+                                 (project_key,)).fetchone()
+    return {"lastUpdated": row["last_updated"], "syncedAt": row["synced_at"]} if row else None
+
+def sync_xray_mirror(full=False, project_key=None):
+    """
+    Bring the mirror up to date with the tests of the Xray test project
+
+    Only the tests updated since the last synchronization are requested, by
+    pages of xray_mirror["pageSize"]. Deleted tests cannot be detected this
+    way: a full synchronization rebuilds the mirror from scratch.
+
+    Args:
+        full (bool): Fetch every test of the project and forget the tests no longer returned
+        project_key (str, optional): Key of the test project. Defaults to jira["testProjectKey"].
+
+    Returns:
+        dict: {"success", "fetched" (tests written), "total" (tests in the mirror), "lastUpdated"} or {"success": False, "error"}
+    """
+    project_key = project_key or settings.jira["testProjectKey"]
+    state = None if full else get_last_sync(project_key)
+    last_updated = state["lastUpdated"] if state else None
+    jql = build_mirror_jql(project_key, state["syncedAt"] if state else None)
+    # Les tests modifiés pendant la synchronisation seront relus par la suivante
+    synced_at = datetime.now().isoformat()
+    page_size = min(settings.xray_mirror.get("pageSize", MAX_PAGE_SIZE), MAX_PAGE_SIZE)
+    logger.info(f"Synchronizing the Xray mirror of {project_key}: {jql}")
+
+    fetched_keys = set()
+    start = 0
+    try:
+        while True:
+            page = fetch_tests_page(jql, start, page_size)
+            tests = [parse_mirror_test(result) for result in page.get("results") or []]
+            tests = [test for test in tests if test["key"]]
+            store_mirror_tests(tests)
+            for test in tests:
+                fetched_keys.add(test["key"])
+                if test["updated"] and (last_updated is None or parse_jira_datetime(test["updated"]) > parse_jira_datetime(last_updated)):
+                    last_updated = test["updated"]
+
+            start += len(page.get("results") or [])
+            if not page.get("results") or start >= page.get("total", 0):
+                break
+    except Exception as e:
+        # Les pages déjà écrites sont gardées; la date de reprise n'avance pas
+        logger.error(f"Error synchronizing the Xray mirror: {str(e)}")
+        return {"success": False, "error": str(e), "fetched": len(fetched_keys)}
+
+    with _connect() as connection:
+        if full:
+            # Tests supprimés ou déplacés depuis la dernière synchronisation
+            rows = connection.execute("SELECT key FROM tests WHERE key LIKE ?", (f"{project_key}-%",))
+            stale = [row["key"] for row in rows if row["key"] not in fetched_keys]
+            connection.executemany("DELETE FROM links WHERE test_key = ?", [(key,) for key in stale])
+            connection.executemany("DELETE FROM tests WHERE key = ?", [(key,) for key in stale])
+        connection.execute(
+            "INSERT OR REPLACE INTO sync_state (project_key, last_updated, synced_at) VALUES (?, ?, ?)",
+            (project_key, last_updated, synced_at)
+        )
+        total = connection.execute("SELECT COUNT(*) FROM tests").fetchone()[0]
+    logger.info(f"Xray mirror synchronized: {len(fetched_keys)} tests fetched, {total} tests mirrored")
+    return {"success": True, "fetched": len(fetched_keys), "total": total, "lastUpdated": last_updated}
+
+def ensure_mirror_fresh():
+    """
+    Synchronize the mirror if it was not synchronized in the last xray_mirror["maxAgeSeconds"] seconds
+
+    Returns:
+        bool: False if a needed synchronization failed (the mirror may then miss recent tests)
+    """
+    max_age = timedelta(seconds=settings.xray_mirror.get("maxAgeSeconds", 300))
+    # Un seul thread synchronise; les autres attendent puis lisent le miroir à jour
+    with _sync_lock:
+        state = get_last_sync()
+        if state and state["syncedAt"] and datetime.now() - datetime.fromisoformat(state["syncedAt"]) < max_age:
+            return True
+        return sync_xray_mirror()["success"]
+
+def refresh_mirrored_tests(test_keys):
+    """
+    Fetch some tests again from Xray and update them in the mirror
+
+    Args:
+        test_keys (list): Keys of the tests
+
+    Returns:
+        dict: Refreshed tests, by key (tests no longer in Xray are left out)
+    """
+    refreshed = {}
+    test_keys = list(test_keys)
+    for i in range(0, len(test_keys), MAX_PAGE_SIZE):
+        chunk = test_keys[i:i + MAX_PAGE_SIZE]
+        page = fetch_tests_page(f"key in ({', '.join(chunk)})", 0, len(chunk))
+        tests = [parse_mirror_test(result) for result in page.get("results") or []]
+        store_mirror_tests([test for test in tests if test["key"]])
+        refreshed.update((test["key"], test) for test in tests if test["key"])
+    return refreshed
+
+def _row_to_test(row):
+    return {
+        "key": row["key"],
+        "issueId": row["issue_id"],
+        "summary": row["summary"],
+        "description": row["description"],
+        "updated": row["updated"],
+        "steps": json.loads(row["steps"])
+    }
+
+def get_mirrored_test(test_key):
+    """
+    Get a test from the mirror
+
+    Args:
+        test_key (str): Key of the test
+
+    Returns:
+        dict or None: Key, issue id, summary, description, updated timestamp and steps of the test
+    """
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM tests WHERE key = ?", (test_key,)).fetchone()
+    return _row_to_test(row) if row else None
+
+def find_tests_by_summary(summary):
+    """
+    Find the mirrored tests with the same summary, ignoring case, punctuation and spacing
+
+    Args:
+        summary (str): Summary of a test case
+
+    Returns:
+        list: Matching tests
+    """
+    with _connect() as connection:
+        rows = connection.execute("SELECT * FROM tests WHERE normalized_summary = ?", (normalize_summary(summary),))
+        return [_row_to_test(row) for row in rows]
+
+def get_story_tests(story_key):
+    """
+    Get the mirrored tests linked to a user story
+
+    Args:
+        story_key (str): Key of the user story
+
+    Returns:
+        list: Tests linked to the story with a link of type xray_mirror["storyLinkType"], by key
+    """
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT tests.* FROM links JOIN tests ON tests.key = links.test_key "
+            "WHERE links.issue_key = ? AND links.link_type = ? ORDER BY tests.key",
+            (story_key, settings.xray_mirror.get("storyLinkType", "Test"))
+        )
+        return [_row_to_test(row) for row in rows]
+
+def get_stories_with_tests(story_keys=None):
+    """
+    Find the user stories that already have tests in the mirror
+
+    Args:
+        story_keys (list, optional): Stories to check. Defaults to every linked story.
+
+    Returns:
+        dict: Number of linked tests, by story key (stories without tests are left out)
+    """
+    link_type = settings.xray_mirror.get("storyLinkType", "Test")
+    query = "SELECT issue_key, COUNT(*) AS tests FROM links WHERE link_type = ?"
+    with _connect() as connection:
+        if story_keys is None:
+            rows = connection.execute(query + " GROUP BY issue_key", (link_type,))
+            return {row["issue_key"]: row["tests"] for row in rows}
+
+        counts = {}
+        story_keys = list(story_keys)
+        # Limite du nombre de paramètres d'une requête SQLite
+        for i in range(0, len(story_keys), 500):
+            chunk = story_keys[i:i + 500]
+            rows = connection.execute(query + f" AND issue_key IN ({', '.join('?' * len(chunk))}) GROUP BY issue_key",
+                                      (link_type, *chunk))
+            counts.update((row["issue_key"], row["tests"]) for row in rows)
+        return counts
+
+def record_story_tests(tests, story_key):
+    """
+    Record in the mirror tests written to Xray for a user story, without waiting for the next synchronization
+
+    Args:
+        tests (list): Tests with "key", "summary", "description" and "steps"
+            (steps without an "id" are fetched again before their next update)
+        story_key (str): Key of the user story the tests are linked to
+    """
+    link_type = settings.xray_mirror.get("storyLinkType", "Test")
+    store_mirror_tests([dict(test, links=None) for test in tests])
+    with _connect() as connection:
+        connection.executemany("INSERT OR IGNORE INTO links (test_key, issue_key, link_type) VALUES (?, ?, ?)",
+                               [(test["key"], story_key, link_type) for test in tests])
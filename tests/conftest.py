@@ -0,0 +1,19 @@
+# Configuration commune des tests
+import os
+import sys
+
+import pytest
+
+# Les modules de src/ s'importent entre eux sans préfixe
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (root_dir, os.path.join(root_dir, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from config import settings
+
+@pytest.fixture(autouse=True)
+def output_dir(tmp_path, monkeypatch):
+    """Write the outputs, caches and states of a test in its own temporary directory"""
+    monkeypatch.setitem(settings.generator, "outputBaseDir", str(tmp_path))
+    return tmp_path
@@ -0,0 +1,338 @@
+# Tests du pipeline asyncio contre des serveurs HTTP locaux
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from config import settings
+import async_pipeline
+import bulk_import
+import xray_client
+from bulk_import import BulkImportEngine
+
+SUMMARIES = ["Open the cart page", "Add an item to the cart", "Remove an item from the cart", "Pay the order by card"]
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode('utf-8')
+
+class ClaudeXrayStub:
+    """Local stand-in streaming a Messages API response, and recording the Xray bulk import chunks"""
+
+    def __init__(self):
+        self.claude_attempts = 0
+        self.imported = []
+        self.first_import = threading.Event()
+        self.imported_during_stream = False
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, data, status=200):
+                payload = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if self.path == '/v1/messages':
+                    stub.claude_attempts += 1
+                    if stub.claude_attempts == 1:
+                        # Surcharge: la requête n'a pas été traitée, elle est reprise
+                        return self._send_json({"type": "error", "error": {"message": "Overloaded"}}, 529)
+                    return stub.stream(self)
+                self._send_json({}, 404)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def import_chunk(self, test_cases):
+        # Tous les tests du lot sont créés
+        self.imported.append([test_case["summary"] for test_case in test_cases])
+        self.first_import.set()
+        job = len(self.imported)
+        return {"keys": [f"TEST-{job}{i}" for i in range(len(test_cases))], "errors": {},
+                "jobId": f"job{job}", "status": "successful"}
+
+    def stream(self, handler):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        text = json.dumps([{"summary": summary, "description": "", "steps": [
+            {"action": summary, "data": "", "result": "Done"}]} for summary in SUMMARIES])
+        half = text.index('{"summary": "' + SUMMARIES[2])
+        handler.wfile.write(_sse({"type": "message_start", "message": {"id": "msg", "usage": {"input_tokens": 10}}}))
+        for i in range(0, half, 7):
+            handler.wfile.write(_sse({"type": "content_block_delta", "index": 0,
+                                      "delta": {"type": "text_delta", "text": text[i:min(i + 7, half)]}}))
+        handler.wfile.flush()
+        # Le premier lot doit être importé pendant que la génération continue
+        self.imported_during_stream = self.first_import.wait(5)
+        handler.wfile.write(_sse({"type": "content_block_delta", "index": 0,
+                                  "delta": {"type": "text_delta", "text": text[half:]}}))
+        handler.wfile.write(_sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                                  "usage": {"output_tokens": 50}}))
+        handler.wfile.write(_sse({"type": "message_stop"}))
+        handler.wfile.flush()
+        handler.close_connection = True
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ClaudeXrayStub()
+    server.thread.start()
+    monkeypatch.setitem(settings.claude, "stream", True)
+    monkeypatch.setitem(settings.xray, "use_bulk_import", True)
+    monkeypatch.setitem(settings.xray, "upsert", False)
+    monkeypatch.setitem(settings.xray, "streamImportChunkSize", 2)
+    monkeypatch.setitem(settings.http, "backoffFactor", 0.001)
+    monkeypatch.setitem(settings.generator, "incremental", False)
+    monkeypatch.setitem(settings.generator, "shardScenarios", False)
+    monkeypatch.setattr(bulk_import, "import_xray_tests_chunk", server.import_chunk)
+    monkeypatch.setattr(bulk_import, "link_tests_to_story", lambda test_keys, user_story_key: None)
+    engine = BulkImportEngine(chunk_size=2, linger=0)
+    monkeypatch.setattr(async_pipeline, "get_bulk_import_engine", lambda: engine)
+    monkeypatch.setattr(async_pipeline, "build_claude_request", lambda user_story: (
+        f"{server.url}/v1/messages", {"Content-Type": "application/json"},
+        {"model": "test-model", "messages": [{"role": "user", "content": user_story["key"]}], "max_tokens": 1000}))
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+def test_streamed_test_cases_are_imported_while_claude_is_generating(stub):
+    story = {"key": "PROJ-1", "fields": {"summary": "Cart", "description": "As a buyer I manage my cart"}}
+
+    async def run():
+        async with async_pipeline.AsyncHttpClient() as client:
+            return await async_pipeline.generate_test_cases_from_user_story_async(client, "PROJ-1", story)
+
+    result = asyncio.run(run())
+
+    assert stub.claude_attempts == 2
+    assert stub.imported_during_stream
+    assert stub.imported == [[f"Cart: {summary}" for summary in SUMMARIES[:2]],
+                             [f"Cart: {summary}" for summary in SUMMARIES[2:]]]
+    assert [entry["key"] for entry in result["testCases"]] == ["TEST-10", "TEST-11", "TEST-20", "TEST-21"]
+    assert all(entry["success"] for entry in result["testCases"])
+    assert [job["jobId"] for job in result["importJobs"]] == ["job1", "job2"]
+
+def test_async_batch_shares_import_chunks_and_maps_keys_by_position(monkeypatch):
+    chunks = []
+
+    def import_chunk(test_cases):
+        chunks.append([test_case["summary"] for test_case in test_cases])
+        # Le deuxième test case du lot est refusé par Xray
+        keys = [None if i == 1 else f"TEST-{len(chunks)}{i}" for i in range(len(test_cases))]
+        return {"keys": keys, "errors": {1: {"summary": "invalid"}}, "jobId": f"job{len(chunks)}",
+                "status": "partially_successful"}
+
+    async def analyze_with_claude_async(client, user_story):
+        return [{"summary": f"{user_story['key']} test {i}", "description": "", "steps": [
+            {"action": f"Step of {user_story['key']} {i}", "data": "", "result": f"Result {i}"}]} for i in range(2)]
+
+    monkeypatch.setitem(settings.claude, "stream", False)
+    monkeypatch.setitem(settings.xray, "use_bulk_import", True)
+    monkeypatch.setitem(settings.xray, "upsert", False)
+    monkeypatch.setitem(settings.generator, "incremental", False)
+    monkeypatch.setitem(settings.generator, "shardScenarios", False)
+    monkeypatch.setattr(bulk_import, "import_xray_tests_chunk", import_chunk)
+    monkeypatch.setattr(bulk_import, "link_tests_to_story", lambda test_keys, user_story_key: None)
+    engine = BulkImportEngine(chunk_size=4, linger=0.2)
+    monkeypatch.setattr(async_pipeline, "get_bulk_import_engine", lambda: engine)
+    monkeypatch.setattr(async_pipeline, "analyze_with_claude_async", analyze_with_claude_async)
+
+    async def run():
+        async with async_pipeline.AsyncHttpClient() as client:
+            return await asyncio.gather(*(
+                async_pipeline.generate_test_cases_from_user_story_async(
+                    client, key, {"key": key, "fields": {"summary": key, "description": ""}})
+                for key in ("PROJ-1", "PROJ-2")))
+
+    first, second = asyncio.run(run())
+
+    # Un seul lot pour les deux stories
+    assert len(chunks) == 1 and len(chunks[0]) == 4
+    entries = first["testCases"] + second["testCases"]
+    assert sorted(entry["key"] for entry in entries if entry["success"]) == ["TEST-10", "TEST-12", "TEST-13"]
+    # Chaque clé revient au test case envoyé à sa position dans le lot
+    assert all(entry["testCase"] == chunks[0][int(entry["key"][-1])] for entry in entries if entry["success"])
+    failed = [entry for entry in entries if not entry["success"]]
+    assert len(failed) == 1 and failed[0]["testCase"] == chunks[0][1]
+
+class HostStub:
+    """Local HTTP server answering each request with respond(method, path, headers), counting concurrent requests"""
+
+    def __init__(self, respond, delay=0.0):
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                with stub.lock:
+                    stub.requests.append((self.command, self.path, self.headers.get('Authorization')))
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                time.sleep(delay)
+                with stub.lock:
+                    stub.active -= 1
+                    status, body, headers = respond(self.command, self.path, self.headers)
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _handle
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.url = f"http://{self.host}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def host_stub(monkeypatch):
+    monkeypatch.setitem(settings.http, "backoffFactor", 0.001)
+    monkeypatch.setitem(settings.http, "maxRetries", 3)
+    stubs = []
+
+    def start(respond, delay=0.0):
+        stubs.append(HostStub(respond, delay))
+        return stubs[-1]
+
+    yield start
+    for stub in stubs:
+        stub.close()
+
+def _run_with_client(coroutine_factory):
+    async def run():
+        async with async_pipeline.AsyncHttpClient() as client:
+            return await coroutine_factory(client)
+    return asyncio.run(run())
+
+def test_concurrent_requests_are_limited_per_host(host_stub, monkeypatch):
+    limited = host_stub(lambda method, path, headers: (200, "{}", {}), delay=0.05)
+    other = host_stub(lambda method, path, headers: (200, "{}", {}), delay=0.05)
+    monkeypatch.setitem(settings.async_pipeline, "hostConcurrency", {limited.host: 3, "default": 10})
+
+    statuses = _run_with_client(lambda client: asyncio.gather(
+        *(client.request('GET', f"{limited.url}/item/{i}") for i in range(12)),
+        *(client.request('GET', f"{other.url}/item/{i}") for i in range(8))))
+
+    assert [status for status, _ in statuses] == [200] * 20
+    assert limited.max_active == 3
+    # Les autres hôtes ont leur propre limite
+    assert other.max_active > 3
+
+def test_unprocessed_responses_are_retried(host_stub):
+    attempts = {}
+
+    def respond(method, path, headers):
+        attempts[path] = attempts.get(path, 0) + 1
+        if path == "/busy" and attempts[path] <= 2:
+            return 503, "busy", {"Retry-After": "0"}
+        if path == "/broken":
+            return 500, "broken", {}
+        return 200, '{"ok": true}', {}
+
+    stub = host_stub(respond)
+
+    async def requests(client):
+        return [await client.request_json('GET', f"{stub.url}/busy"),
+                await client.request('POST', f"{stub.url}/broken"),
+                await client.request('GET', f"{stub.url}/broken")]
+
+    busy, broken_post, broken_get = _run_with_client(requests)
+
+    assert busy == {"ok": True} and attempts["/busy"] == 3
+    # Un POST en erreur 500 a pu être traité: il n'est pas renvoyé; un GET l'est jusqu'à maxRetries
+    assert broken_post[0] == 500 and broken_get[0] == 500
+    assert [method for method, path, _ in stub.requests if path == "/broken"] == ["POST", "GET", "GET", "GET", "GET"]
+
+def test_xray_token_is_shared_by_concurrent_tasks(host_stub, monkeypatch):
+    tokens = iter(["token-1", "token-2"])
+
+    def respond(method, path, headers):
+        if path == "/authenticate":
+            return 200, f'"{next(tokens)}"', {}
+        if headers.get('Authorization') == "Bearer token-1" and path == "/tests/revoked":
+            return 401, "expired", {}
+        return 200, '{"ok": true}', {}
+
+    stub = host_stub(respond, delay=0.02)
+    monkeypatch.setattr(async_pipeline, "XRAY_API_URL", stub.url)
+    monkeypatch.setitem(xray_client._token_cache, "token", None)
+    monkeypatch.setitem(xray_client._token_cache, "expiresAt", 0.0)
+
+    async def requests(client):
+        results = await asyncio.gather(*(client.xray_request('GET', f"{stub.url}/tests/{i}") for i in range(10)))
+        return results + [await client.xray_request('GET', f"{stub.url}/tests/revoked")]
+
+    results = _run_with_client(requests)
+
+    assert results == [{"ok": True}] * 11
+    authentications = [request for request in stub.requests if request[1] == "/authenticate"]
+    assert len(authentications) == 2
+    assert [auth for _, path, auth in stub.requests if path == "/tests/revoked"] == ["Bearer token-1", "Bearer token-2"]
+    # Le token renouvelé est aussi celui du client synchrone
+    assert xray_client.get_cached_xray_auth_token() == "token-2"
+
+def test_async_batch_summary_follows_the_order_of_the_keys(monkeypatch):
+    keys = [f"PROJ-{number}" for number in range(1, 7)]
+    in_flight = []
+    active = []
+
+    async def get_jira_issues_async(client, issue_keys, fields=None):
+        for key in issue_keys:
+            if key != "PROJ-5":
+                yield {"key": key, "fields": {"summary": f"Story {key}", "description": "", "updated": "2024-05-01"}}
+
+    async def generate(client, user_story_key, user_story=None):
+        active.append(user_story_key)
+        in_flight.append(len(active))
+        # Les premières stories se terminent en dernier
+        await asyncio.sleep(0.01 * (7 - int(user_story_key.split('-')[1])))
+        active.remove(user_story_key)
+        if user_story_key == "PROJ-3":
+            raise Exception("Claude API error")
+        return {"userStory": user_story_key, "title": user_story["fields"]["summary"],
+                "testCases": [{"testCase": "Nominal", "success": True}]}
+
+    monkeypatch.setattr(async_pipeline, "get_jira_issues_async", get_jira_issues_async)
+    monkeypatch.setattr(async_pipeline, "generate_test_cases_from_user_story_async", generate)
+    monkeypatch.setitem(settings.generator, "incremental", False)
+
+    summary = asyncio.run(async_pipeline.generate_test_cases_for_stories_async(keys, max_in_flight=2))
+
+    assert [story["userStory"] for story in summary["stories"]] == keys
+    assert [story["success"] for story in summary["stories"]] == [True, True, False, True, False, True]
+    assert summary["stories"][2]["error"] == "Claude API error"
+    assert summary["stories"][4]["error"] == "User story not found in Jira"
+    assert (summary["succeeded"], summary["failed"], summary["imported"]) == (4, 2, 4)
+    assert max(in_flight) == 2
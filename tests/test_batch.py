@@ -0,0 +1,135 @@
+# Tests du traitement batch de plusieurs user stories
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+import batch
+import issue_cache
+from issue_cache import is_issue_processed, mark_issue_processed
+
+UPDATED = "2024-05-01T10:00:00.000+0000"
+
+def _issue(key, updated=UPDATED):
+    return {"key": key, "fields": {"summary": f"Story {key}", "description": "", "updated": updated}}
+
+class FakeGeneration:
+    """Stand-in for Jira and for the generation of each story"""
+
+    def __init__(self, issues, durations=None, failing=(), partially_imported=()):
+        self.issues = OrderedDict((issue["key"], issue) for issue in issues)
+        self.durations = durations or {}
+        self.failing = set(failing)
+        self.partially_imported = set(partially_imported)
+        self.lock = threading.Lock()
+        self.generated = []
+        self.updated_queries = []
+
+    def get_jira_issues(self, keys, fields=None):
+        if fields == ["updated"]:
+            self.updated_queries.append(list(keys))
+        return [self.issues[key] for key in keys if key in self.issues]
+
+    def search_jira_issues(self, jql):
+        return iter(self.issues.values())
+
+    def generate(self, user_story_key, user_story=None):
+        time.sleep(self.durations.get(user_story_key, 0))
+        with self.lock:
+            self.generated.append(user_story_key)
+        if user_story_key in self.failing:
+            raise Exception(f"Claude API error for {user_story_key}")
+        imported = user_story_key not in self.partially_imported
+        return {"userStory": user_story_key, "title": user_story["fields"]["summary"],
+                "testCases": [{"testCase": "Nominal", "success": True}, {"testCase": "Error", "success": imported}]}
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(issue_cache, "_memory", OrderedDict())
+
+    def install(*args, **kwargs):
+        generation = FakeGeneration(*args, **kwargs)
+        monkeypatch.setattr(batch, "get_jira_issues", generation.get_jira_issues)
+        monkeypatch.setattr(batch, "search_jira_issues", generation.search_jira_issues)
+        monkeypatch.setattr(batch, "search_jira_issue_keys", lambda jql: list(generation.issues))
+        monkeypatch.setattr(batch, "generate_test_cases_from_user_story", generation.generate)
+        return generation
+
+    return install
+
+def test_summary_follows_the_order_of_the_keys(fake):
+    keys = [f"PROJ-{number}" for number in range(1, 7)]
+    # Les premières stories se terminent en dernier
+    fake([_issue(key) for key in keys], durations={key: 0.05 * (6 - number) for number, key in enumerate(keys)})
+
+    summary = batch.generate_test_cases_for_stories(keys, max_workers=3)
+
+    assert [story["userStory"] for story in summary["stories"]] == keys
+    assert (summary["total"], summary["succeeded"], summary["generated"], summary["imported"]) == (6, 6, 12, 12)
+
+def test_jql_summary_follows_the_order_of_jira(fake):
+    keys = ["PROJ-3", "PROJ-1", "PROJ-2"]
+    fake([_issue(key) for key in keys], durations={"PROJ-3": 0.1})
+
+    summary = batch.generate_test_cases_for_jql("project = PROJ", max_workers=3)
+
+    assert [story["userStory"] for story in summary["stories"]] == keys
+
+def test_a_failing_story_does_not_stop_the_batch(fake):
+    keys = ["PROJ-1", "PROJ-2", "PROJ-3", "PROJ-4"]
+    generation = fake([_issue(key) for key in keys if key != "PROJ-4"], failing={"PROJ-2"})
+
+    summary = batch.generate_test_cases_for_stories(keys, max_workers=2)
+
+    assert sorted(generation.generated) == ["PROJ-1", "PROJ-2", "PROJ-3"]
+    assert [story["success"] for story in summary["stories"]] == [True, False, True, False]
+    assert summary["stories"][1]["error"] == "Claude API error for PROJ-2"
+    assert summary["stories"][3]["error"] == "User story not found in Jira"
+    assert (summary["succeeded"], summary["failed"], summary["generated"]) == (2, 2, 4)
+
+def test_issues_are_consumed_as_workers_free_up(fake, monkeypatch):
+    max_workers = 2
+    keys = [f"PROJ-{number}" for number in range(1, 21)]
+    generation = fake([_issue(key) for key in keys], durations={key: 0.01 for key in keys})
+    in_flight = []
+
+    def search_jira_issues(jql):
+        for issue in generation.issues.values():
+            # Stories lues depuis Jira mais pas encore terminées
+            with generation.lock:
+                in_flight.append(len(in_flight) - len(generation.generated) + 1)
+            yield issue
+
+    monkeypatch.setattr(batch, "search_jira_issues", search_jira_issues)
+
+    summary = batch.generate_test_cases_for_jql("project = PROJ", max_workers=max_workers)
+
+    assert summary["succeeded"] == 20
+    assert max(in_flight) <= max_workers * 2
+
+def test_changed_only_skips_the_stories_already_generated(fake):
+    keys = ["PROJ-1", "PROJ-2", "PROJ-3"]
+    mark_issue_processed(_issue("PROJ-1"))
+    mark_issue_processed(_issue("PROJ-2", "2024-04-01T10:00:00.000+0000"))
+    generation = fake([_issue(key) for key in keys])
+
+    summary = batch.generate_test_cases_for_stories(keys, max_workers=2, changed_only=True)
+
+    assert generation.updated_queries == [keys]
+    assert sorted(generation.generated) == ["PROJ-2", "PROJ-3"]
+    assert [story.get("skipped", False) for story in summary["stories"]] == [True, False, False]
+    assert (summary["skipped"], summary["succeeded"]) == (1, 2)
+    # Tous leurs test cases importés: la prochaine exécution les ignore aussi
+    assert is_issue_processed("PROJ-2", UPDATED) and is_issue_processed("PROJ-3", UPDATED)
+
+def test_stories_not_fully_imported_are_generated_again(fake):
+    keys = ["PROJ-1", "PROJ-2"]
+    generation = fake([_issue(key) for key in keys], failing={"PROJ-1"}, partially_imported={"PROJ-2"})
+    batch.generate_test_cases_for_stories(keys, max_workers=2, changed_only=True)
+
+    generation.generated.clear()
+    summary = batch.generate_test_cases_for_jql("project = PROJ", max_workers=2, changed_only=True)
+
+    assert sorted(generation.generated) == keys
+    assert summary["skipped"] == 0
@@ -0,0 +1,124 @@
+# Tests du moteur d'import par lots et de l'association des clés d'un job Xray
+import threading
+
+import pytest
+
+import bulk_import
+from bulk_import import BulkImportEngine
+from xray_client import get_job_test_keys
+
+def _test_cases(*summaries):
+    return [{"summary": summary, "steps": []} for summary in summaries]
+
+class FakeXray:
+    """Stand-in for import_xray_tests_chunk and link_tests_to_story, failing the summaries listed in fail"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.chunks = []
+        self.links = []
+        self.lock = threading.Lock()
+
+    def import_chunk(self, test_cases):
+        with self.lock:
+            self.chunks.append([test_case["summary"] for test_case in test_cases])
+            job_id = f"job{len(self.chunks)}"
+        keys = [None if test_case["summary"] in self.fail else f"TEST-{test_case['summary']}" for test_case in test_cases]
+        errors = {i: {"summary": "invalid"} for i, key in enumerate(keys) if key is None}
+        return {"keys": keys, "errors": errors, "jobId": job_id,
+                "status": "partially_successful" if errors else "successful"}
+
+    def link(self, test_keys, user_story_key):
+        with self.lock:
+            self.links.append((user_story_key, list(test_keys)))
+
+@pytest.fixture
+def xray(monkeypatch):
+    fake = FakeXray()
+    monkeypatch.setattr(bulk_import, "import_xray_tests_chunk", fake.import_chunk)
+    monkeypatch.setattr(bulk_import, "link_tests_to_story", fake.link)
+    return fake
+
+def test_large_story_is_split_and_keeps_the_order_of_its_test_cases(xray):
+    engine = BulkImportEngine(chunk_size=2, max_workers=3, linger=0)
+
+    result = engine.submit(_test_cases("1", "2", "3", "4", "5"), "PROJ-1").result(timeout=5)
+
+    assert sorted(xray.chunks) == [["1", "2"], ["3", "4"], ["5"]]
+    assert result["testKeys"] == ["TEST-1", "TEST-2", "TEST-3", "TEST-4", "TEST-5"]
+    assert result["status"] == "successful"
+    assert sorted(result["jobIds"]) == ["job1", "job2", "job3"]
+
+def test_partial_failure_reports_the_position_of_each_failed_test_case(xray):
+    xray.fail = {"2", "4"}
+    engine = BulkImportEngine(chunk_size=3, max_workers=2, linger=0)
+
+    result = engine.submit(_test_cases("1", "2", "3", "4"), "PROJ-1").result(timeout=5)
+
+    assert result["testKeys"] == ["TEST-1", None, "TEST-3", None]
+    assert result["importedTests"] == ["TEST-1", "TEST-3"]
+    assert [error["elementNumber"] for error in result["errors"]] == [1, 3]
+    assert result["status"] == "partially_successful" and result["success"]
+    assert sorted(key for _, keys in xray.links for key in keys) == ["TEST-1", "TEST-3"]
+
+def test_chunk_shared_by_stories_gives_each_story_its_own_result(xray):
+    xray.fail = {"b2"}
+    engine = BulkImportEngine(chunk_size=4, max_workers=1, linger=10)
+
+    first = engine.submit(_test_cases("a1", "a2"), "PROJ-1")
+    second = engine.submit(_test_cases("b1", "b2", "b3"), "PROJ-2")
+    engine.flush()
+
+    assert first.result(timeout=5)["testKeys"] == ["TEST-a1", "TEST-a2"]
+    assert second.result(timeout=5)["testKeys"] == ["TEST-b1", None, "TEST-b3"]
+    assert xray.chunks == [["a1", "a2", "b1", "b2"], ["b3"]]
+    assert second.result()["errors"] == [{"elementNumber": 1, "errors": {"summary": "invalid"}}]
+    assert ("PROJ-1", ["TEST-a1", "TEST-a2"]) in xray.links
+    assert ("PROJ-2", ["TEST-b1"]) in xray.links
+
+def test_failed_import_request_fails_every_test_case_of_the_chunk(xray, monkeypatch):
+    def import_chunk(test_cases):
+        raise Exception("HTTP Error 500")
+
+    monkeypatch.setattr(bulk_import, "import_xray_tests_chunk", import_chunk)
+    engine = BulkImportEngine(chunk_size=10, max_workers=1, linger=0)
+
+    result = engine.submit(_test_cases("1", "2"), "PROJ-1").result(timeout=5)
+
+    assert result["testKeys"] == [None, None]
+    assert result["status"] == "unsuccessful" and not result["success"]
+    assert [error["errors"] for error in result["errors"]] == ["HTTP Error 500", "HTTP Error 500"]
+
+def test_unexpected_error_is_raised_to_every_story_of_the_chunk(xray, monkeypatch):
+    monkeypatch.setattr(bulk_import, "import_xray_tests_chunk",
+                        lambda test_cases: {"keys": [], "errors": {}, "jobId": "job1", "status": "successful"})
+    engine = BulkImportEngine(chunk_size=3, max_workers=1, linger=10)
+
+    first = engine.submit(_test_cases("a1"), "PROJ-1")
+    second = engine.submit(_test_cases("b1", "b2"), "PROJ-2")
+
+    for future in (first, second):
+        with pytest.raises(Exception, match="returned 0 keys"):
+            future.result(timeout=5)
+
+def test_job_keys_follow_the_element_numbers():
+    final_status = {"status": "partially_successful", "result": {
+        "issues": [{"elementNumber": 2, "key": "TEST-3"}, {"elementNumber": 0, "key": "TEST-1"}],
+        "errors": [{"elementNumber": 1, "errors": {"summary": "required"}}]
+    }}
+
+    keys, errors = get_job_test_keys(final_status, 3)
+
+    assert keys == ["TEST-1", None, "TEST-3"]
+    assert errors == {1: {"summary": "required"}}
+
+def test_job_keys_without_element_numbers_skip_the_failed_positions():
+    final_status = {"status": "partially_successful", "result": {
+        "issues": [{"key": "TEST-1"}, {"key": "TEST-3"}],
+        "errors": [{"elementNumber": 1, "errors": {"summary": "required"}}]
+    }}
+
+    keys, errors = get_job_test_keys(final_status, 3)
+
+    assert keys == ["TEST-1", None, "TEST-3"]
+    assert errors == {1: {"summary": "required"}}
@@ -0,0 +1,110 @@
+# Tests de la construction des requêtes Claude
+import pytest
+
+from config import settings
+import claude_client
+
+KNOWLEDGE_BASE_CONTEXT = "KNOWLEDGE BASE CONTEXT:\n## Domain: Login\n"
+
+def _user_story(key="ABC-1"):
+    return {"key": key, "fields": {"summary": "Login form", "description": "The user logs in with a password"}}
+
+def _template(instructions):
+    return instructions + "\n\nUser Story Title: {USER_STORY_SUMMARY}\n\nUser Story Description:\n{USER_STORY_DESCRIPTION}\n\nAnswer in JSON."
+
+@pytest.fixture
+def prompt_caching(monkeypatch):
+    monkeypatch.setitem(settings.claude, "promptCaching", True)
+    monkeypatch.setattr(claude_client, "build_knowledge_base_context", lambda user_story, budget: KNOWLEDGE_BASE_CONTEXT)
+
+def test_prompt_caching_is_disabled_by_default():
+    assert settings.claude["promptCaching"] is False
+
+def test_only_the_shared_instructions_carry_a_cache_marker(monkeypatch, prompt_caching):
+    instructions = "Write test cases.\n" * 300
+    monkeypatch.setitem(settings.claude, "promptTemplate", _template(instructions))
+
+    prompt = claude_client.build_claude_prompt(_user_story())
+
+    assert [block["text"] for block in prompt[:2]] == [instructions.strip() + "\n\nAnswer in JSON.", KNOWLEDGE_BASE_CONTEXT]
+    assert "Login form" in prompt[2]["text"]
+    assert [block.get("cache_control") for block in prompt] == [{"type": "ephemeral"}, None, None]
+
+def test_instructions_shorter_than_the_cache_minimum_are_not_marked(monkeypatch, prompt_caching):
+    monkeypatch.setitem(settings.claude, "promptTemplate", _template("Write test cases."))
+
+    prompt = claude_client.build_claude_prompt(_user_story())
+
+    assert len(prompt) == 3
+    assert not any("cache_control" in block for block in prompt)
+
+def test_the_cached_prefix_is_identical_across_stories(monkeypatch, prompt_caching):
+    monkeypatch.setitem(settings.claude, "promptTemplate", _template("Write test cases.\n" * 300))
+
+    first = claude_client.build_claude_prompt(_user_story("ABC-1"))
+    second = claude_client.build_claude_prompt({"key": "ABC-2", "fields": {"summary": "Logout", "description": ""}})
+
+    assert first[0] == second[0]
+
+def _response(text, stop_reason="max_tokens", **usage):
+    return {"content": [{"type": "text", "text": text}], "stop_reason": stop_reason,
+            "usage": dict({"input_tokens": 100, "output_tokens": 50}, **usage)}
+
+REQUEST = {"model": "test-model", "messages": [{"role": "user", "content": "Generate"}], "max_tokens": 50}
+
+def test_truncated_array_needs_a_continuation():
+    assert claude_client.needs_continuation(_response('[{"summary": "A"}, {"summ'), '[{"summary": "A"}, {"summ', 0)
+
+def test_complete_array_or_finished_response_needs_no_continuation():
+    assert not claude_client.needs_continuation(_response('[{"summary": "A"}]'), '[{"summary": "A"}]', 0)
+    assert not claude_client.needs_continuation(_response('[{"summ', "end_turn"), '[{"summ', 0)
+
+def test_continuations_stop_at_the_configured_limit(monkeypatch):
+    monkeypatch.setitem(settings.claude, "maxContinuations", 2)
+
+    assert claude_client.needs_continuation(_response('[{"summ'), '[{"summ', 1)
+    assert not claude_client.needs_continuation(_response('[{"summ'), '[{"summ', 2)
+
+def test_continuation_prefills_the_partial_text_without_trailing_whitespace():
+    continuation = claude_client.build_continuation_request(REQUEST, '[{"summary": "A",\n  ')
+
+    assert continuation["messages"] == [{"role": "user", "content": "Generate"},
+                                        {"role": "assistant", "content": '[{"summary": "A",'}]
+    assert REQUEST["messages"] == [{"role": "user", "content": "Generate"}]
+    assert continuation["max_tokens"] == 50
+
+def test_continuation_is_joined_to_the_trimmed_text_and_usage_is_summed():
+    merged = claude_client.merge_continuation(
+        _response('[{"summary": "A",\n  ', cache_read_input_tokens=10),
+        _response(' "steps": []}]', "end_turn", input_tokens=120, output_tokens=8)
+    )
+
+    assert merged["content"] == [{"type": "text", "text": '[{"summary": "A", "steps": []}]'}]
+    assert merged["stop_reason"] == "end_turn"
+    assert merged["usage"] == {"input_tokens": 220, "output_tokens": 58, "cache_read_input_tokens": 10}
+    assert merged["continuations"] == 1
+
+def test_completion_is_continued_until_the_configured_limit(monkeypatch):
+    monkeypatch.setitem(settings.claude, "maxContinuations", 2)
+    # Chaque reprise commence après le préremplissage sans ses espaces finaux
+    fragments = ['[{"summary": "A", ', ' "steps": [{"action": "Open",\n', ' "result": "Shown"}', ']}]']
+    sent = []
+
+    def make_request(url, method, headers, json_data):
+        sent.append(json_data)
+        return _response(fragments[len(sent) - 1])
+
+    monkeypatch.setattr(claude_client, "make_request", make_request)
+
+    response = claude_client.request_claude_completion("http://claude", {}, REQUEST)
+
+    assert len(sent) == 3
+    assert sent[2]["messages"][-1]["content"] == '[{"summary": "A", "steps": [{"action": "Open",'
+    assert response["content"][0]["text"] == '[{"summary": "A", "steps": [{"action": "Open", "result": "Shown"}'
+    assert response["continuations"] == 2
+    assert response["stop_reason"] == "max_tokens"
+
+def test_truncation_warning_reports_the_max_tokens_of_the_request(caplog):
+    claude_client.save_claude_response(_response('[{"summ', output_tokens=50), REQUEST)
+
+    assert "Used 50 of 50 available tokens." in caplog.text
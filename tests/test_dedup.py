@@ -0,0 +1,54 @@
+# Tests de la détection des test cases quasi identiques
+from config import settings
+from dedup import NearDuplicateFilter, collapse_near_duplicates
+
+STEPS = [
+    {"action": "Open the login page of the application", "data": "", "result": "The login form is displayed with empty fields"},
+    {"action": "Enter the user name and the valid password", "data": "user1 / Secret123", "result": "The password characters are masked"},
+    {"action": "Click on the submit button of the form", "data": "", "result": "The user is redirected to the dashboard page"},
+    {"action": "Check the user name shown in the header", "data": "", "result": "The header shows the name of the logged in user"},
+]
+
+def _test_case(summary, steps=STEPS):
+    return {"summary": summary, "description": "", "steps": steps}
+
+def test_reworded_copy_is_collapsed_and_reported_with_its_similarity():
+    reworded = [dict(step) for step in STEPS]
+    reworded[2]["action"] = "Press the submit button of the form"
+
+    kept, report = collapse_near_duplicates([_test_case("Login with a valid password"),
+                                             _test_case("Log in with a valid password", reworded)])
+
+    assert [test_case["summary"] for test_case in kept] == ["Login with a valid password"]
+    assert len(report) == 1
+    assert report[0]["kept"] == "Login with a valid password"
+    assert report[0]["dropped"] == "Log in with a valid password"
+    assert settings.dedup["threshold"] <= report[0]["similarity"] < 1
+
+def test_distinct_test_cases_are_kept():
+    other_steps = [
+        {"action": "Open the report list", "data": "", "result": "Every monthly report is listed"},
+        {"action": "Export the selected report as CSV", "data": "May 2024", "result": "A CSV file is downloaded"},
+    ]
+
+    kept, report = collapse_near_duplicates([_test_case("Login with a valid password"),
+                                             _test_case("Export the monthly report", other_steps)])
+
+    assert len(kept) == 2 and report == []
+
+def test_story_title_and_numbering_are_ignored():
+    duplicates = NearDuplicateFilter(story_summary="User login")
+
+    assert duplicates.add(_test_case("User login - TC01: Valid password")) is None
+    kept = duplicates.add(_test_case("TC 2. Valid password"))
+
+    assert kept["summary"] == "User login - TC01: Valid password"
+    assert duplicates.report[0]["similarity"] == 1.0
+
+def test_disabled_dedup_keeps_every_test_case(monkeypatch):
+    monkeypatch.setitem(settings.dedup, "enabled", False)
+    test_cases = [_test_case("Login with a valid password"), _test_case("Login with a valid password")]
+
+    kept, report = collapse_near_duplicates(test_cases)
+
+    assert kept == test_cases and report == []
@@ -0,0 +1,99 @@
+# Tests du cache disque des générations Claude
+import os
+
+import pytest
+
+from config import settings
+import generation_cache
+from generation_cache import generation_cache_key, get_cached_generation, store_generation
+
+def _request(**overrides):
+    request = {"model": "test-model", "max_tokens": 4000, "temperature": 0.2,
+               "system": "Write test cases.", "messages": [{"role": "user", "content": "Login story"}]}
+    request.update(overrides)
+    return request
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setitem(settings.cache, "enabled", True)
+    monkeypatch.setitem(settings.cache, "compress", False)
+    # Taille tenue à jour par processus: la recalculer pour le répertoire de ce test
+    monkeypatch.setattr(generation_cache, "_cache_size", None)
+
+def test_key_depends_only_on_what_determines_the_generation():
+    key = generation_cache_key(_request())
+
+    reordered = dict(reversed(list(_request().items())))
+    assert generation_cache_key(reordered) == key
+    assert generation_cache_key(_request(stream=True, metadata={"user_id": "someone"})) == key
+    for change in ({"model": "other-model"}, {"temperature": 0.7}, {"max_tokens": 8000}, {"system": "Other"},
+                   {"messages": [{"role": "user", "content": "Logout story"}]}):
+        assert generation_cache_key(_request(**change)) != key
+
+def test_stored_generation_is_found_again():
+    assert get_cached_generation(_request()) is None
+
+    assert store_generation(_request(), '[{"summary": "Login"}]')
+
+    assert get_cached_generation(_request()) == '[{"summary": "Login"}]'
+    assert get_cached_generation(_request(temperature=0.7)) is None
+
+@pytest.mark.parametrize("stored_compressed", [True, False])
+def test_entries_are_found_whatever_the_compression_setting(monkeypatch, stored_compressed):
+    monkeypatch.setitem(settings.cache, "compress", stored_compressed)
+    store_generation(_request(), "generated text")
+    compressed_path, plain_path = generation_cache._cache_paths(generation_cache_key(_request()))
+    assert os.path.exists(compressed_path) == stored_compressed
+    assert os.path.exists(plain_path) != stored_compressed
+
+    monkeypatch.setitem(settings.cache, "compress", not stored_compressed)
+
+    assert get_cached_generation(_request()) == "generated text"
+
+def test_unreadable_entry_is_a_miss():
+    store_generation(_request(), "generated text")
+    _, plain_path = generation_cache._cache_paths(generation_cache_key(_request()))
+    with open(plain_path, 'w', encoding='utf-8') as f:
+        f.write('{"text": "gener')
+
+    assert get_cached_generation(_request()) is None
+
+def test_disabled_cache_neither_stores_nor_reads(monkeypatch):
+    store_generation(_request(), "generated text")
+    monkeypatch.setitem(settings.cache, "enabled", False)
+
+    assert get_cached_generation(_request()) is None
+    assert not store_generation(_request(temperature=0.7), "other text")
+
+def _age_entries(requests):
+    # Dates d'accès croissantes dans l'ordre des requêtes
+    for age, request in enumerate(reversed(requests), start=1):
+        _, plain_path = generation_cache._cache_paths(generation_cache_key(request))
+        os.utime(plain_path, (0, 1000000000 - age * 60))
+
+def test_least_recently_used_entries_are_evicted_down_to_the_low_water_mark(monkeypatch):
+    monkeypatch.setitem(settings.cache, "maxSizeMB", 10 * 1024 / (1024 * 1024))
+    requests = [_request(messages=[{"role": "user", "content": f"Story {number}"}]) for number in range(9)]
+    for request in requests:
+        store_generation(request, "x" * 1000)
+    _age_entries(requests)
+    # Lue récemment, la plus ancienne entrée devient la plus récente
+    assert get_cached_generation(requests[0]) == "x" * 1000
+
+    # 10 entrées d'environ 1 Ko dépassent la limite de 10 Ko
+    store_generation(_request(), "x" * 1000)
+
+    # Pas seulement la plus ancienne: assez d'entrées pour redescendre sous 90 % de la limite
+    kept = [number for number, request in enumerate(requests) if get_cached_generation(request) is not None]
+    assert kept == [0, 3, 4, 5, 6, 7, 8]
+    assert get_cached_generation(_request()) is not None
+    assert generation_cache._cache_size <= 0.9 * 10 * 1024
+
+def test_cache_under_its_limit_is_not_evicted(monkeypatch):
+    monkeypatch.setitem(settings.cache, "maxSizeMB", 1)
+    requests = [_request(messages=[{"role": "user", "content": f"Story {number}"}]) for number in range(5)]
+    for request in requests:
+        store_generation(request, "x" * 1000)
+
+    assert generation_cache.evict_generation_cache() == 0
+    assert all(get_cached_generation(request) is not None for request in requests)
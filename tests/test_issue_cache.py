@@ -0,0 +1,68 @@
+# Tests du cache local des issues Jira
+from collections import OrderedDict
+
+import pytest
+
+from config import settings
+import issue_cache
+from issue_cache import (confirm_issue_unchanged, get_cached_issue, is_issue_fresh, is_issue_processed,
+                         mark_issue_processed, store_issue)
+
+@pytest.fixture(autouse=True)
+def empty_memory(monkeypatch):
+    monkeypatch.setattr(issue_cache, "_memory", OrderedDict())
+    monkeypatch.setitem(settings.issue_cache, "freshSeconds", 60)
+
+def _issue(key, updated, **fields):
+    return {"key": key, "fields": dict({"summary": f"Story {key}", "updated": updated}, **fields)}
+
+def test_stored_issue_is_fresh_until_freshseconds(monkeypatch):
+    store_issue(_issue("PROJ-1", "2024-05-01T10:00:00.000+0000"))
+
+    assert is_issue_fresh("PROJ-1")
+    assert not is_issue_fresh("PROJ-2")
+    monkeypatch.setitem(settings.issue_cache, "freshSeconds", 0)
+    assert not is_issue_fresh("PROJ-1")
+
+def test_unchanged_issue_is_confirmed_and_fresh_again(monkeypatch):
+    issue = _issue("PROJ-1", "2024-05-01T10:00:00.000+0000")
+    store_issue(issue)
+    monkeypatch.setitem(settings.issue_cache, "freshSeconds", 0)
+
+    assert confirm_issue_unchanged("PROJ-1", "2024-05-02T10:00:00.000+0000") is None
+    assert confirm_issue_unchanged("PROJ-1", None) is None
+    assert confirm_issue_unchanged("PROJ-1", "2024-05-01T10:00:00.000+0000") == issue
+    monkeypatch.setitem(settings.issue_cache, "freshSeconds", 60)
+    assert is_issue_fresh("PROJ-1")
+
+def test_least_recently_used_issue_is_evicted_from_memory(monkeypatch):
+    monkeypatch.setitem(settings.issue_cache, "maxMemoryEntries", 2)
+    for number in (1, 2):
+        store_issue(_issue(f"PROJ-{number}", "2024-05-01T10:00:00.000+0000"))
+    assert get_cached_issue("PROJ-1")
+
+    store_issue(_issue("PROJ-3", "2024-05-01T10:00:00.000+0000"))
+
+    # PROJ-2 est relu sur disque: il doit être revérifié auprès de Jira
+    assert is_issue_fresh("PROJ-1") and is_issue_fresh("PROJ-3")
+    assert not is_issue_fresh("PROJ-2")
+    assert get_cached_issue("PROJ-2") == _issue("PROJ-2", "2024-05-01T10:00:00.000+0000")
+
+def test_projected_issue_marked_processed_is_not_returned_as_a_full_payload():
+    mark_issue_processed({"key": "PROJ-1", "fields": {"summary": "Story", "description": "", "updated": "v1"}})
+
+    assert is_issue_processed("PROJ-1", "v1")
+    assert get_cached_issue("PROJ-1") is None
+    assert confirm_issue_unchanged("PROJ-1", "v1") is None
+
+def test_full_payload_of_the_processed_version_is_kept():
+    full = _issue("PROJ-1", "v1", description="Text", labels=["login"])
+    store_issue(full)
+
+    mark_issue_processed({"key": "PROJ-1", "fields": {"summary": "Story PROJ-1", "description": "Text", "updated": "v1"}})
+    assert get_cached_issue("PROJ-1") == full
+    assert is_issue_processed("PROJ-1", "v1")
+
+    mark_issue_processed({"key": "PROJ-1", "fields": {"summary": "Story PROJ-1", "description": "New", "updated": "v2"}})
+    assert get_cached_issue("PROJ-1") is None
+    assert is_issue_processed("PROJ-1", "v2") and not is_issue_processed("PROJ-1", "v1")
@@ -0,0 +1,92 @@
+# Tests de la recherche et de la récupération groupée des issues Jira
+import re
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import jira_client
+from jira_client import MAX_KEYS_PER_QUERY, get_jira_issues, search_jira_issue_keys, search_jira_issues
+
+class FakeJiraSearch:
+    """Stand-in for the Jira search endpoint over a fixed set of issues"""
+
+    def __init__(self, keys, page_cap=100):
+        self.keys = keys
+        self.page_cap = page_cap
+        self.queries = []
+
+    def make_request(self, url, method='GET', headers=None, json_data=None):
+        params = {name: values[0] for name, values in parse_qs(urlparse(url).query).items()}
+        self.queries.append(params)
+        jql = params["jql"]
+        match = re.fullmatch(r"key in \((.*)\)", jql)
+        matching = [key for key in self.keys if key in match.group(1).split(", ")] if match else self.keys
+        start = int(params["startAt"])
+        # Jira plafonne la taille des pages quelle que soit la demande
+        page = matching[start:start + min(int(params["maxResults"]), self.page_cap)]
+        return {"startAt": start, "total": len(matching), "warningMessages": [],
+                "issues": [{"key": key, "fields": {"summary": f"Story {key}"}} for key in page]}
+
+@pytest.fixture
+def jira(monkeypatch):
+    def install(keys, page_cap=100):
+        fake = FakeJiraSearch(keys, page_cap)
+        monkeypatch.setattr(jira_client, "make_request", fake.make_request)
+        return fake
+    return install
+
+def test_search_reads_every_page(jira):
+    keys = [f"PROJ-{number}" for number in range(1, 251)]
+    fake = jira(keys)
+
+    assert [issue["key"] for issue in search_jira_issues("project = PROJ")] == keys
+    assert [query["startAt"] for query in fake.queries] == ["0", "100", "200"]
+    assert fake.queries[0]["fields"] == "summary,description,updated"
+
+def test_search_follows_the_page_size_returned_by_jira(jira):
+    keys = [f"PROJ-{number}" for number in range(1, 121)]
+    fake = jira(keys, page_cap=50)
+
+    assert [issue["key"] for issue in search_jira_issues("project = PROJ", fields=["key"], page_size=100)] == keys
+    assert [query["startAt"] for query in fake.queries] == ["0", "50", "100"]
+    assert search_jira_issue_keys("project = PROJ") == keys
+
+def test_search_stops_on_an_empty_result(jira):
+    fake = jira([])
+
+    assert list(search_jira_issues("project = NONE")) == []
+    assert len(fake.queries) == 1
+
+def test_search_pages_are_requested_lazily(jira):
+    fake = jira([f"PROJ-{number}" for number in range(1, 251)])
+
+    issues = search_jira_issues("project = PROJ")
+    first = [next(issues) for _ in range(100)]
+
+    assert first[-1]["key"] == "PROJ-100"
+    assert len(fake.queries) == 1
+
+def test_keys_are_fetched_in_groups_of_one_hundred(jira):
+    keys = [f"PROJ-{number}" for number in range(1, 231)]
+    fake = jira(keys)
+
+    assert [issue["key"] for issue in get_jira_issues(keys, fields=["updated"])] == keys
+
+    groups = [query["jql"][len("key in ("):-1].split(", ") for query in fake.queries]
+    assert [len(group) for group in groups] == [MAX_KEYS_PER_QUERY, MAX_KEYS_PER_QUERY, 30]
+    assert sum(groups, []) == keys
+    assert all(query["fields"] == "updated" for query in fake.queries)
+
+def test_missing_keys_are_reported(jira, caplog):
+    jira(["PROJ-1", "PROJ-3"])
+
+    issues = list(get_jira_issues(["PROJ-1", "PROJ-2", "PROJ-3", "PROJ-4"]))
+
+    assert [issue["key"] for issue in issues] == ["PROJ-1", "PROJ-3"]
+    assert "Jira issues not found: PROJ-2, PROJ-4" in caplog.text
+
+def test_no_request_without_keys(jira):
+    fake = jira(["PROJ-1"])
+
+    assert list(get_jira_issues([])) == []
+    assert fake.queries == []
@@ -0,0 +1,90 @@
+# Tests du parseur incrémental des réponses de Claude
+import json
+
+import json_parser
+from json_parser import parse_test_cases, parse_lenient
+
+TEST_CASES = [
+    {"summary": "Login succeeds", "description": "Valid \"admin\" user\nwith a password",
+     "steps": [{"action": "Open the login page", "data": "", "result": "The form is shown"}]},
+    {"summary": "Login fails", "description": "Wrong password",
+     "steps": [{"action": "Submit a wrong password", "data": "user\\name", "result": "An error is shown"}]}
+]
+
+def _feed_by_chunks(text, size):
+    parser = json_parser.TestCaseStreamParser()
+    completed = []
+    for i in range(0, len(text), size):
+        completed += parser.feed(text[i:i + size])
+    return completed + parser.close(), parser
+
+def test_fragments_split_inside_tokens_give_the_same_test_cases():
+    text = "Here are the test cases:\n```json\n" + json.dumps(TEST_CASES, indent=2) + "\n```"
+
+    # Un caractère à la fois coupe chaque chaîne, échappement et mot-clé
+    for size in (1, 2, 3, 7, len(text)):
+        completed, parser = _feed_by_chunks(text, size)
+        assert completed == TEST_CASES
+        assert parser.finished
+
+def test_each_test_case_is_returned_as_soon_as_its_brace_is_received():
+    text = json.dumps(TEST_CASES)
+    first_end = text.index('}]}') + 3
+    parser = json_parser.TestCaseStreamParser()
+
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [TEST_CASES[0]]
+
+def test_truncated_final_test_case_is_recovered_on_close():
+    text = json.dumps(TEST_CASES)
+    cut = text.index('An error') + 5
+
+    completed, parser = _feed_by_chunks(text[:cut], 4)
+
+    assert completed[0] == TEST_CASES[0]
+    assert completed[1]["summary"] == "Login fails"
+    assert completed[1]["steps"][0]["result"] == "An er"
+    assert not parser.finished
+
+def test_truncated_test_case_without_summary_is_dropped():
+    assert parse_test_cases('[{"summary": "Kept"}, {"descr') == [{"summary": "Kept"}]
+
+def test_chunk_cut_mid_escape_does_not_leak_into_the_next_element():
+    parser = json_parser.TestCaseStreamParser()
+
+    assert parser.feed('[{"summary": "Say \\') == []
+    # Le guillemet échappé ne ferme pas la chaîne, le backslash final du chemin n'échappe pas le guillemet fermant
+    completed = parser.feed('"hi\\"", "path": "C:\\\\"}, {"summary": "Second"}]')
+
+    assert completed == [{"summary": 'Say "hi"', "path": "C:\\"}, {"summary": "Second"}]
+    assert parser.finished
+
+def test_line_comments_are_ignored_in_every_position():
+    text = """[
+      // First test case
+      {"summary": "E" // comment after a string
+      , "priority": 2 // comment after a number
+      , "steps": [] // comment after a container
+      },
+      // Between two test cases
+      {"summary": "F", "url": "http://example.com/a // b"}
+    ]"""
+
+    assert parse_test_cases(text) == [
+        {"summary": "E", "priority": 2, "steps": []},
+        {"summary": "F", "url": "http://example.com/a // b"}
+    ]
+    assert parse_test_cases('{"summary":"E" // c\n}') == [{"summary": "E"}]
+
+def test_slash_after_a_quote_inside_a_string_is_kept():
+    assert parse_test_cases('[{"summary": "Choose "A" / "B" option"}]') == [{"summary": 'Choose "A" / "B" option'}]
+
+def test_trailing_commas_are_ignored():
+    text = '[{"summary": "A", "steps": [{"action": "Do",},],}, {"summary": "B",},]'
+
+    assert parse_test_cases(text) == [{"summary": "A", "steps": [{"action": "Do"}]}, {"summary": "B"}]
+
+def test_lenient_reader_repairs_quotes_and_unclosed_containers():
+    assert parse_lenient("{'summary': 'Single', \"steps\": [{\"action\": \"Raw\nbreak") == {
+        "summary": "Single", "steps": [{"action": "Raw\nbreak"}]
+    }
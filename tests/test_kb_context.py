@@ -0,0 +1,81 @@
+# Tests du contexte de base de connaissances ajouté au prompt
+import json
+
+import pytest
+
+from config import settings
+from knowledge_base.kb_store import KnowledgeBaseStore
+from knowledge_base.prompt_enhancer import (build_knowledge_base_context, build_ranking_model, estimate_tokens,
+                                            format_knowledge_base_context, rank_sample_tests)
+
+FILES = {
+    "login.json": {"domain": "Login", "keywords": ["login"], "guidelines": "Check the lockout after three failures.",
+                   "sample_tests": [{"summary": "Login with a valid password", "steps": [{"action": "Type the password"}]},
+                                    {"summary": "Open the help page", "steps": [{"action": "Click help"}]}]},
+    "reset.json": {"domain": "Password reset", "keywords": ["reset"], "guidelines": "Check the reset link expiry.",
+                   "sample_tests": [{"summary": "Reset a forgotten password", "steps": [{"action": "Ask a password reset"}]},
+                                    {"summary": "Change the language", "steps": [{"action": "Pick French"}]}]},
+    "export.json": {"domain": "Reports", "keywords": ["export"], "guidelines": "Check the file format.",
+                    "sample_tests": [{"summary": "Export the monthly report", "steps": [{"action": "Export as CSV"}]}]}
+}
+
+@pytest.fixture
+def knowledge_base_dir(tmp_path, monkeypatch):
+    for name, content in FILES.items():
+        (tmp_path / name).write_text(json.dumps(content), encoding='utf-8')
+    monkeypatch.setitem(settings.generator, "knowledgeBaseDir", str(tmp_path))
+    monkeypatch.setitem(settings.knowledge_base, "use_knowledge_base", True)
+    monkeypatch.setitem(settings.knowledge_base, "usePack", False)
+    return str(tmp_path)
+
+def _domain(name, guidelines="Check the lockout after three failures."):
+    return {"name": name, "domain": name.split('.')[0].title(), "guidelines": guidelines}
+
+def test_best_sample_tests_are_picked_across_files(knowledge_base_dir):
+    model = build_ranking_model(KnowledgeBaseStore(knowledge_base_dir).get_index())
+
+    ranked = rank_sample_tests(model, ["password", "reset", "login"], limit=2)
+
+    assert sorted(test for test, _ in ranked) == [("login.json", 0), ("reset.json", 0)]
+    assert ranked[0][1] >= ranked[1][1]
+    assert len(rank_sample_tests(model, ["password", "reset", "login"])) == 2
+    assert rank_sample_tests(model, ["password"], limit=1)[0][0] in (("login.json", 0), ("reset.json", 0))
+
+def test_sample_tests_are_grouped_under_their_domain():
+    tests = [(_domain("login.json"), "- Login with a valid password\n"),
+             (_domain("reset.json"), "- Reset a forgotten password\n"),
+             (_domain("login.json"), "- Login with an expired password\n")]
+
+    context = format_knowledge_base_context([_domain("login.json")], tests, token_budget=1000)
+
+    assert context.index("## Domain: Login") < context.index("- Login with a valid password") \
+        < context.index("- Login with an expired password") < context.index("## Domain: Reset")
+    assert context.count("Sample test cases:") == 2
+    assert context.count("Guidelines:") == 1
+
+def test_sample_tests_stop_at_the_token_budget():
+    tests = [(_domain("login.json"), f"- Sample test {number}: " + "step " * 30 + "\n") for number in range(10)]
+
+    context = format_knowledge_base_context([], tests, token_budget=150)
+
+    assert estimate_tokens(context) <= 150
+    assert "- Sample test 0:" in context and "- Sample test 1:" in context
+    assert "- Sample test 2:" not in context and "- Sample test 9:" not in context
+
+def test_a_smaller_sample_test_still_fits_after_a_larger_one_was_left_out():
+    tests = [(_domain("login.json"), "- Long test: " + "step " * 200 + "\n"), (_domain("login.json"), "- Short test\n")]
+
+    context = format_knowledge_base_context([], tests, token_budget=100)
+
+    assert "- Long test" not in context and "- Short test" in context
+
+def test_no_context_when_nothing_fits_in_the_budget():
+    tests = [(_domain("login.json"), "- Login with a valid password: " + "step " * 30 + "\n")]
+
+    assert format_knowledge_base_context([_domain("login.json", "Check " * 40)], tests, token_budget=50) == ""
+
+def test_small_budget_adds_no_context_to_the_prompt(knowledge_base_dir):
+    story = {"fields": {"summary": "Reset a forgotten password", "description": "The login page links to a password reset"}}
+
+    assert "## Domain: Password reset" in build_knowledge_base_context(story, token_budget=500)
+    assert build_knowledge_base_context(story, token_budget=40) == ""
@@ -0,0 +1,104 @@
+# Tests de l'index persistant de la base de connaissances
+import json
+import os
+
+import pytest
+
+from knowledge_base import kb_index
+from knowledge_base.kb_index import INDEX_VERSION, load_kb_index, refresh_kb_index, save_kb_index
+
+@pytest.fixture
+def knowledge_base_dir(tmp_path):
+    directory = tmp_path / "kb"
+    directory.mkdir()
+    _write(str(directory), "login.json", {"domain": "Login", "keywords": ["login"], "guidelines": "Check the lockout.",
+                                          "sample_tests": [{"summary": "Login with a valid password", "steps": []}]})
+    _write(str(directory), "export.json", {"domain": "Reports", "keywords": ["export"], "guidelines": ""})
+    return str(directory)
+
+def _write(directory, name, content):
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+        json.dump(content, f)
+
+def _touch(path, seconds=5):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+def _built_index(knowledge_base_dir):
+    index, changed = refresh_kb_index(knowledge_base_dir, load_kb_index(knowledge_base_dir))
+    assert changed
+    return index
+
+def test_unchanged_files_return_the_same_index(knowledge_base_dir):
+    index = _built_index(knowledge_base_dir)
+
+    assert refresh_kb_index(knowledge_base_dir, index) == (index, False)
+
+def test_touched_file_is_read_again_but_not_reindexed(knowledge_base_dir, monkeypatch):
+    index = _built_index(knowledge_base_dir)
+    path = os.path.join(knowledge_base_dir, "login.json")
+    _touch(path)
+    read = []
+    build_file_entry = kb_index.build_file_entry
+
+    def reading_build_file_entry(file_path, *args):
+        read.append(file_path)
+        return build_file_entry(file_path, *args)
+
+    monkeypatch.setattr(kb_index, "build_file_entry", reading_build_file_entry)
+    monkeypatch.setattr(kb_index, "count_terms", lambda text: pytest.fail("an unchanged file was tokenized again"))
+
+    new_index, changed = refresh_kb_index(knowledge_base_dir, index)
+
+    assert read == [path]
+    assert not changed and new_index is not index
+    assert new_index["revision"] == index["revision"]
+    assert new_index["files"]["login.json"]["mtime"] == os.stat(path).st_mtime_ns
+    assert new_index["files"]["login.json"]["terms"] is index["files"]["login.json"]["terms"]
+    assert new_index["files"]["export.json"] is index["files"]["export.json"]
+
+def test_edited_file_is_reindexed(knowledge_base_dir):
+    index = _built_index(knowledge_base_dir)
+    _write(knowledge_base_dir, "login.json", {"domain": "Authentication", "keywords": ["login"]})
+
+    new_index, changed = refresh_kb_index(knowledge_base_dir, index)
+
+    assert changed
+    assert new_index["revision"] == index["revision"] + 1
+    assert new_index["files"]["login.json"]["domain"] == "Authentication"
+    assert new_index["files"]["login.json"]["tests"] == []
+    # L'index courant n'est pas modifié pour ses lecteurs
+    assert index["files"]["login.json"]["domain"] == "Login"
+
+def test_removed_file_leaves_the_index(knowledge_base_dir):
+    index = _built_index(knowledge_base_dir)
+    os.remove(os.path.join(knowledge_base_dir, "export.json"))
+
+    new_index, changed = refresh_kb_index(knowledge_base_dir, index)
+
+    assert changed and sorted(new_index["files"]) == ["login.json"]
+
+def test_saved_index_is_reused(knowledge_base_dir):
+    index = _built_index(knowledge_base_dir)
+    save_kb_index(knowledge_base_dir, index)
+
+    loaded = load_kb_index(knowledge_base_dir)
+
+    assert loaded == json.loads(json.dumps(index))
+    assert refresh_kb_index(knowledge_base_dir, loaded) == (loaded, False)
+
+def test_index_of_another_version_is_rebuilt(knowledge_base_dir):
+    index = _built_index(knowledge_base_dir)
+    save_kb_index(knowledge_base_dir, dict(index, version=INDEX_VERSION + 1))
+
+    loaded = load_kb_index(knowledge_base_dir)
+
+    assert loaded == {"version": INDEX_VERSION, "revision": 0, "files": {}}
+    rebuilt, changed = refresh_kb_index(knowledge_base_dir, loaded)
+    assert changed and sorted(rebuilt["files"]) == ["export.json", "login.json"]
+
+def test_unreadable_index_is_rebuilt(knowledge_base_dir):
+    with open(kb_index.get_index_path(knowledge_base_dir), 'w', encoding='utf-8') as f:
+        f.write('{"version": 1, "files"')
+
+    assert load_kb_index(knowledge_base_dir)["files"] == {}
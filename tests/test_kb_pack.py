@@ -0,0 +1,107 @@
+# Tests du pack compilé de la base de connaissances
+import json
+import os
+
+import pytest
+
+from config import settings
+from knowledge_base import kb_pack
+from knowledge_base.kb_store import KnowledgeBaseStore
+from knowledge_base.prompt_enhancer import build_ranking_model, compile_knowledge_base_pack, _score_documents
+
+FILES = {
+    "login.json": {"domain": "Login", "keywords": ["login", "password"], "guidelines": "Check the lockout.",
+                   "sample_tests": [{"summary": "Login with a valid password",
+                                     "steps": [{"action": "Enter the password", "result": "The dashboard opens"}]},
+                                    {"summary": "Login with an expired password",
+                                     "steps": [{"action": "Enter an expired password", "result": "A reset is asked"}]}]},
+    "export.json": {"domain": "Reports", "keywords": ["export", "report"], "guidelines": "Check the file format.",
+                    "sample_tests": [{"summary": "Export the monthly report",
+                                      "steps": [{"action": "Export the report as CSV", "result": "A CSV file is downloaded"}]}]},
+    "api.json": {"domain": "API", "keywords": ["api", "endpoint"], "guidelines": "Check the status codes.",
+                 "sample_tests": [{"summary": "Call the login endpoint",
+                                   "steps": [{"action": "Send the password to the endpoint", "result": "A token is returned"}]}]}
+}
+KEYWORDS = ["login", "password", "report", "endpoint", "unknown"]
+
+@pytest.fixture
+def knowledge_base_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings.knowledge_base, "indexRefreshInterval", 0)
+    directory = tmp_path / "kb"
+    directory.mkdir()
+    for name, content in FILES.items():
+        (directory / name).write_text(json.dumps(content), encoding='utf-8')
+    yield str(directory)
+    kb_pack.close_knowledge_base_packs(kb_pack.get_pack_path(str(directory)))
+
+def _in_memory_model(knowledge_base_dir):
+    return build_ranking_model(KnowledgeBaseStore(knowledge_base_dir).get_index())
+
+def test_pack_ranks_like_the_in_memory_model(knowledge_base_dir):
+    model = _in_memory_model(knowledge_base_dir)
+    pack = kb_pack.KnowledgeBasePack(compile_knowledge_base_pack(knowledge_base_dir))
+
+    try:
+        for keywords in (KEYWORDS, ["password"], ["export", "csv"]):
+            expected = _score_documents(model["fileModel"], keywords)
+            ranked = _score_documents(pack.model("file"), keywords)
+            assert [pack.domain(number)["name"] for number, _ in ranked] == [model["files"][number] for number, _ in expected]
+            assert [score for _, score in ranked] == pytest.approx([score for _, score in expected])
+
+            expected_tests = _score_documents(model["testModel"], keywords)
+            ranked_tests = _score_documents(pack.model("test"), keywords)
+            assert [number for number, _ in ranked_tests] == [number for number, _ in expected_tests]
+            assert [score for _, score in ranked_tests] == pytest.approx([score for _, score in expected_tests])
+        assert pack.domain(pack.test_file(0))["name"] == model["tests"][0][0]
+    finally:
+        pack.close()
+
+def test_up_to_date_pack_is_used(knowledge_base_dir):
+    compile_knowledge_base_pack(knowledge_base_dir)
+
+    pack = kb_pack.get_knowledge_base_pack(knowledge_base_dir)
+
+    assert pack is not None
+    assert (pack.header["counts"]["files"], pack.header["counts"]["tests"]) == (3, 4)
+
+def test_editing_a_source_file_makes_the_pack_stale(knowledge_base_dir):
+    compile_knowledge_base_pack(knowledge_base_dir)
+    path = os.path.join(knowledge_base_dir, "export.json")
+    stat = os.stat(path)
+
+    # Même taille, date antérieure restaurée: seul l'en-tête du pack permet de le voir
+    with open(path, 'r+', encoding='utf-8') as f:
+        content = f.read()
+        f.seek(0)
+        f.write(content.replace("monthly", "yearly!"))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+
+    assert kb_pack.get_knowledge_base_pack(knowledge_base_dir) is None
+
+def test_adding_a_source_file_makes_the_pack_stale(knowledge_base_dir):
+    compile_knowledge_base_pack(knowledge_base_dir)
+
+    with open(os.path.join(knowledge_base_dir, "billing.json"), 'w', encoding='utf-8') as f:
+        json.dump({"domain": "Billing"}, f)
+
+    assert kb_pack.get_knowledge_base_pack(knowledge_base_dir) is None
+
+def test_changing_a_bm25_parameter_makes_the_pack_stale(knowledge_base_dir, monkeypatch):
+    compile_knowledge_base_pack(knowledge_base_dir)
+    assert kb_pack.get_knowledge_base_pack(knowledge_base_dir) is not None
+
+    monkeypatch.setitem(settings.knowledge_base, "bm25K1", 1.5)
+
+    assert kb_pack.get_knowledge_base_pack(knowledge_base_dir) is None
+
+def test_truncated_pack_is_ignored(knowledge_base_dir):
+    path = compile_knowledge_base_pack(knowledge_base_dir)
+    size = os.path.getsize(path)
+
+    for length in (size - 8, 200, 4, 0):
+        kb_pack.close_knowledge_base_packs(path)
+        with open(path, 'r+b') as f:
+            f.truncate(length)
+        with pytest.raises(Exception):
+            kb_pack.KnowledgeBasePack(path)
+        assert kb_pack.get_knowledge_base_pack(knowledge_base_dir) is None
@@ -0,0 +1,74 @@
+# Tests du classement BM25 de la base de connaissances
+import os
+import shutil
+
+import pytest
+
+from config import settings
+from knowledge_base.kb_store import KnowledgeBaseStore
+from knowledge_base.prompt_enhancer import (_build_bm25, _score_documents, build_ranking_model, extract_keywords,
+                                            rank_knowledge_base_files)
+
+KNOWLEDGE_BASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base")
+
+# Trois domaines qui parlent tous de "user", un seul de "invoice"
+DOCUMENTS = [({"user": 2, "login": 3, "password": 2}, {}),
+             ({"user": 2, "invoice": 2, "export": 3}, {}),
+             ({"user": 1, "profile": 2, "avatar": 2}, {})]
+
+def _weight(bm25, term, document):
+    start, end = bm25["slices"][term]
+    numbers = bm25["documentNumbers"][start:end].tolist()
+    return bm25["weights"][start + numbers.index(document)]
+
+def test_a_term_of_every_domain_weighs_less_than_a_rare_one():
+    bm25 = _build_bm25(DOCUMENTS, boost=0.0)
+
+    assert bm25["idf"]["user"] < bm25["idf"]["invoice"]
+    # Même nombre d'occurrences dans le même domaine
+    assert _weight(bm25, "user", 1) < _weight(bm25, "invoice", 1)
+    # Une story qui parle de "user" et de "login" va d'abord au domaine du login, pas à ceux qui citent "user"
+    ranked = _score_documents(bm25, ["user", "login"])
+    assert ranked[0][0] == 0
+    assert ranked[1][1] < ranked[0][1] / 2
+
+def test_keywords_field_terms_count_keyword_boost_more_times():
+    documents = [({"report": 1, "csv": 1}, {"report": 1}), ({"report": 1, "pdf": 1}, {}), ({"login": 1}, {})]
+
+    plain = dict(_score_documents(_build_bm25(documents, boost=0.0), ["report"]))
+    boosted = dict(_score_documents(_build_bm25(documents, boost=2.0), ["report"]))
+
+    assert plain[0] == pytest.approx(plain[1])
+    assert boosted[0] > plain[0]
+    assert boosted[1] == pytest.approx(plain[1])
+
+def test_scores_are_normalized_between_zero_and_one():
+    bm25 = _build_bm25(DOCUMENTS, boost=5.0)
+
+    for keywords in (["user"], ["login", "password"], ["user", "invoice", "export", "avatar"], ["user", "unknown"]):
+        scores = [score for _, score in _score_documents(bm25, keywords)]
+        assert scores and all(0.0 < score <= 1.0 for score in scores)
+        assert scores == sorted(scores, reverse=True)
+    assert _score_documents(bm25, ["unknown"]) == []
+
+def test_limit_and_minimum_score_filter_the_documents():
+    bm25 = _build_bm25(DOCUMENTS, boost=0.0)
+    ranked = _score_documents(bm25, ["user", "login"])
+
+    assert _score_documents(bm25, ["user", "login"], limit=1) == ranked[:1]
+    assert _score_documents(bm25, ["user", "login"], min_score=ranked[1][1]) == ranked[:1]
+
+@pytest.mark.parametrize("story, relevant, other", [
+    ("Add a REST endpoint returning the user profile as JSON. The API must reject requests without an authentication token.",
+     "api_domain_tests.json", "ui_domain_tests.json"),
+    ("Display a validation error on the signup form when the email field is empty",
+     "ui_domain_tests.json", "api_domain_tests.json")
+])
+def test_similarity_threshold_separates_the_relevant_domain(tmp_path, story, relevant, other):
+    for name in (relevant, other):
+        shutil.copy(os.path.join(KNOWLEDGE_BASE, name), tmp_path)
+    model = build_ranking_model(KnowledgeBaseStore(str(tmp_path)).get_index())
+
+    scores = dict(rank_knowledge_base_files(model, extract_keywords(story)))
+
+    assert scores[relevant] >= settings.knowledge_base["similarity_threshold"] > scores[other]
@@ -0,0 +1,147 @@
+# Tests du store de la base de connaissances partagé entre threads
+import json
+import os
+import threading
+
+import pytest
+
+from config import settings
+from knowledge_base.kb_store import KnowledgeBaseStore
+
+@pytest.fixture
+def knowledge_base_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(settings.knowledge_base, "indexRefreshInterval", 0)
+    _write(str(tmp_path), "login.json", "Login", 0)
+    _write(str(tmp_path), "export.json", "Reports", 0)
+    return str(tmp_path)
+
+def _write(directory, name, domain, version):
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"domain": domain, "guidelines": f"Version {version}", "keywords": [domain.lower()]}, f)
+    # Date distincte à chaque écriture, même si le système de fichiers est peu précis
+    os.utime(path, ns=(0, (version + 1) * 10**9))
+
+def test_edited_file_is_picked_up_without_restart(knowledge_base_dir):
+    store = KnowledgeBaseStore(knowledge_base_dir)
+    first = store.get_index()
+
+    _write(knowledge_base_dir, "login.json", "Authentication", 1)
+    second = store.get_index()
+
+    assert second is not first
+    assert second["files"]["login.json"]["domain"] == "Authentication"
+    assert second["revision"] == first["revision"] + 1
+    # L'index publié avant reste intact pour ceux qui le lisent encore
+    assert first["files"]["login.json"]["domain"] == "Login"
+    assert second["files"]["export.json"] is first["files"]["export.json"]
+    assert store.get_index() is second
+
+def test_a_file_being_written_keeps_its_previous_entry(knowledge_base_dir):
+    store = KnowledgeBaseStore(knowledge_base_dir)
+    first = store.get_index()
+    path = os.path.join(knowledge_base_dir, "login.json")
+
+    # Rafraîchissement pendant que l'éditeur réécrit le fichier
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"domain": "Authen')
+    os.utime(path, ns=(0, 2 * 10**9))
+    assert store.get_index() is first
+
+    _write(knowledge_base_dir, "login.json", "Authentication", 2)
+    assert store.get_index()["files"]["login.json"]["domain"] == "Authentication"
+
+def test_files_are_not_checked_again_within_the_refresh_interval(knowledge_base_dir, monkeypatch):
+    monkeypatch.setitem(settings.knowledge_base, "indexRefreshInterval", 3600)
+    store = KnowledgeBaseStore(knowledge_base_dir)
+    first = store.get_index()
+
+    _write(knowledge_base_dir, "login.json", "Authentication", 1)
+
+    assert store.get_index() is first
+
+def test_a_new_store_reuses_the_saved_index(knowledge_base_dir):
+    first = KnowledgeBaseStore(knowledge_base_dir).get_index()
+
+    second = KnowledgeBaseStore(knowledge_base_dir).get_index()
+
+    assert second["revision"] == first["revision"]
+    assert second["files"] == first["files"]
+
+def test_derived_data_is_built_once_per_revision(knowledge_base_dir):
+    store = KnowledgeBaseStore(knowledge_base_dir)
+    built = []
+
+    def build(index):
+        built.append(index["revision"])
+        return sorted(entry["domain"] for entry in index["files"].values())
+
+    index = store.get_index()
+    assert store.get_derived(index, "domains", build) == ["Login", "Reports"]
+    assert store.get_derived(store.get_index(), "domains", build) == ["Login", "Reports"]
+
+    # Fichier touché sans changement de contenu: même révision, rien à reconstruire
+    os.utime(os.path.join(knowledge_base_dir, "export.json"), ns=(0, 5 * 10**9))
+    assert store.get_derived(store.get_index(), "domains", build) == ["Login", "Reports"]
+
+    _write(knowledge_base_dir, "login.json", "Authentication", 1)
+    new_index = store.get_index()
+    assert store.get_derived(new_index, "domains", build) == ["Authentication", "Reports"]
+    assert built == [index["revision"], new_index["revision"]]
+
+    # Un lecteur encore sur l'ancien index obtient ses données, sans remplacer celles du nouvel index
+    assert store.get_derived(index, "domains", build) == ["Login", "Reports"]
+    assert store.get_derived(new_index, "domains", build) == ["Authentication", "Reports"]
+    assert built == [index["revision"], new_index["revision"], index["revision"]]
+
+def test_readers_do_not_wait_for_a_refresh(knowledge_base_dir, monkeypatch):
+    store = KnowledgeBaseStore(knowledge_base_dir)
+    index = store.get_index()
+    store.get_derived(index, "domains", lambda index: len(index["files"]))
+    monkeypatch.setitem(settings.knowledge_base, "indexRefreshInterval", 3600)
+    results = []
+
+    def read():
+        current = store.get_index()
+        results.append((current, store.get_derived(current, "domains", lambda index: pytest.fail("rebuilt"))))
+
+    # Un rafraîchissement en cours tient le verrou
+    with store._lock:
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+
+    assert results == [(index, 2)]
+
+def test_concurrent_reads_during_refreshes_see_complete_indexes(knowledge_base_dir):
+    store = KnowledgeBaseStore(knowledge_base_dir)
+    store.get_index()
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not stop.is_set():
+                index = store.get_index()
+                model = store.get_derived(index, "guidelines", lambda index: {name: entry["guidelines"]
+                                                                             for name, entry in index["files"].items()})
+                # Les données dérivées correspondent toujours à l'index lu, jamais à un index à moitié publié
+                assert sorted(index["files"]) == ["export.json", "login.json"]
+                assert model == {name: entry["guidelines"] for name, entry in index["files"].items()}
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for version in range(1, 30):
+        _write(knowledge_base_dir, "login.json", "Login", version)
+        store.get_index()
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert store.get_index()["files"]["login.json"]["guidelines"] == "Version 29"
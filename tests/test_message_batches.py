@@ -0,0 +1,159 @@
+# Tests du mode backlog (Message Batches API) contre un serveur HTTP local
+import json
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from config import settings
+import message_batches
+from generation_cache import get_cache_dir, store_generation
+
+def _test_cases_text(summary):
+    return json.dumps([{"summary": summary, "description": "", "steps": [
+        {"action": "Open the page", "data": "", "result": "The page is displayed"}
+    ]}])
+
+class MessageBatchesStub:
+    """Local stand-in for the Message Batches endpoints of the Anthropic API"""
+
+    def __init__(self):
+        self.submitted = []
+        self.texts = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, content_type='application/json'):
+                payload = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                batch_id = f"msgbatch_{len(stub.submitted) + 1}"
+                stub.submitted.append((batch_id, [request["custom_id"] for request in body["requests"]]))
+                self._send(json.dumps({"id": batch_id, "processing_status": "in_progress"}))
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if parts[-1] == 'results':
+                    custom_ids = dict(stub.submitted)[parts[-2]]
+                    self._send('\n'.join(json.dumps(stub.result(custom_id)) for custom_id in custom_ids),
+                               'application/x-jsonl')
+                else:
+                    self._send(json.dumps({"id": parts[-1], "processing_status": "ended",
+                                           "request_counts": {"succeeded": 1},
+                                           "results_url": f"{stub.url}/v1/messages/batches/{parts[-1]}/results"}))
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def result(self, custom_id):
+        return {"custom_id": custom_id, "result": {"type": "succeeded", "message": {
+            "content": [{"type": "text", "text": self.texts[custom_id]}],
+            "stop_reason": "end_turn", "usage": {"input_tokens": 10, "output_tokens": 20}
+        }}}
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = MessageBatchesStub()
+    server.thread.start()
+    monkeypatch.setitem(settings.claude, "apiBaseUrl", server.url)
+    monkeypatch.setitem(settings.claude, "batchPollInterval", 0)
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+@pytest.fixture
+def imported(monkeypatch):
+    """Replace the save and import stages, recording the test cases each story received"""
+    calls = {}
+
+    def process_generated_test_cases(user_story_key, user_story, test_cases):
+        calls[user_story_key] = [test_case["summary"] for test_case in test_cases]
+        return {"title": user_story["fields"]["summary"],
+                "testCases": [{"summary": test_case["summary"], "success": True} for test_case in test_cases]}
+
+    monkeypatch.setattr(message_batches, "process_generated_test_cases", process_generated_test_cases)
+    monkeypatch.setattr(message_batches, "record_story_processed", lambda user_story, story_result: None)
+    monkeypatch.setattr(message_batches, "build_claude_request", lambda issue: (
+        None, None, {"model": "test-model", "messages": [{"role": "user", "content": issue["key"]}],
+                     "max_tokens": 1000, "temperature": 0.2}))
+    return calls
+
+def _issue(key):
+    return {"key": key, "fields": {"summary": f"Story {key}"}}
+
+def test_backlog_imports_the_results_of_its_batch(stub, imported):
+    stub.texts = {"PROJ-1": _test_cases_text("First"), "PROJ-2": _test_cases_text("Second")}
+
+    state = message_batches.prepare_backlog([_issue("PROJ-1"), _issue("PROJ-2")])
+    message_batches.submit_backlog(state)
+    summary = message_batches.process_backlog_results(state, max_workers=2)
+
+    assert stub.submitted == [("msgbatch_1", ["PROJ-1", "PROJ-2"])]
+    assert imported == {"PROJ-1": ["First"], "PROJ-2": ["Second"]}
+    assert [story["userStory"] for story in summary["stories"]] == ["PROJ-1", "PROJ-2"]
+    assert summary["imported"] == 2
+    assert message_batches.load_backlog_state() is None
+
+def test_resumed_backlog_skips_the_stories_already_imported(stub, imported):
+    stub.texts = {"PROJ-1": _test_cases_text("First"), "PROJ-2": _test_cases_text("Second")}
+    state = message_batches.prepare_backlog([_issue("PROJ-1"), _issue("PROJ-2")])
+    message_batches.submit_backlog(state)
+
+    # Run interrompu après l'import de PROJ-1
+    message_batches._import_story(state, "PROJ-1", [{"summary": "First", "steps": []}])
+    imported.clear()
+    resumed = message_batches.load_backlog_state()
+    assert resumed["stories"]["PROJ-1"]["imported"]
+
+    summary = message_batches.process_backlog_results(resumed)
+
+    assert imported == {"PROJ-2": ["Second"]}
+    assert [story["userStory"] for story in summary["stories"]] == ["PROJ-1", "PROJ-2"]
+    assert summary["succeeded"] == 2
+
+def test_imported_story_is_appended_without_rewriting_the_submitted_requests(stub, imported):
+    stub.texts = {"PROJ-1": _test_cases_text("First"), "PROJ-2": _test_cases_text("Second")}
+    state = message_batches.prepare_backlog([_issue("PROJ-1"), _issue("PROJ-2")])
+    message_batches.submit_backlog(state)
+    stories_path = message_batches.get_backlog_state_path("_stories")
+    with open(stories_path, 'rb') as f:
+        submitted = f.read()
+    os.utime(stories_path, ns=(0, 0))
+
+    message_batches._import_story(state, "PROJ-1", [{"summary": "First", "steps": []}])
+    message_batches._import_story(state, "PROJ-2", [{"summary": "Second", "steps": []}])
+
+    assert os.stat(stories_path).st_mtime_ns == 0
+    with open(stories_path, 'rb') as f:
+        assert f.read() == submitted
+    with open(message_batches.get_backlog_state_path("_imported"), 'r', encoding='utf-8') as f:
+        assert [json.loads(line)["userStory"] for line in f] == ["PROJ-1", "PROJ-2"]
+
+def test_evicted_cached_story_is_submitted_again(stub, imported):
+    stub.texts = {"PROJ-1": _test_cases_text("Regenerated")}
+    _, _, request = message_batches.build_claude_request(_issue("PROJ-1"))
+    store_generation(request, _test_cases_text("Cached"))
+
+    state = message_batches.prepare_backlog([_issue("PROJ-1")])
+    message_batches.submit_backlog(state)
+    assert state["stories"]["PROJ-1"]["cached"] and stub.submitted == []
+
+    # L'entrée du cache est évincée avant le traitement des résultats
+    shutil.rmtree(get_cache_dir())
+    summary = message_batches.process_backlog_results(state)
+
+    assert stub.submitted == [("msgbatch_1", ["PROJ-1"])]
+    assert imported == {"PROJ-1": ["Regenerated"]}
+    assert summary["failed"] == 0
@@ -0,0 +1,101 @@
+# Tests du manifeste de régénération incrémentale
+from regeneration import MANIFEST_VERSION, build_manifest, find_stale_tests, load_manifest, plan_regeneration, save_manifest
+from scenarios import split_story_blocks
+
+DESCRIPTION = """As a user I want to log in.
+
+*Scenario 1*
+Given a valid password, the dashboard is displayed.
+
+*Scenario 2*
+Given a wrong password, an error is displayed.
+
+*Scenario 3*
+Given a locked account, the support link is displayed.
+"""
+
+def _manifest(description, context_hash="ctx"):
+    _, blocks = split_story_blocks(description)
+    return build_manifest(context_hash, [
+        (block, [{"testCase": f"Test {block['label']}", "key": f"TEST-{number}"}])
+        for number, block in enumerate(blocks, start=1)
+    ])
+
+def test_manifest_records_the_test_cases_of_each_block():
+    _, blocks = split_story_blocks(DESCRIPTION)
+
+    manifest = _manifest(DESCRIPTION)
+
+    assert manifest["version"] == MANIFEST_VERSION and manifest["contextHash"] == "ctx"
+    assert list(manifest["blocks"]) == [block["key"] for block in blocks]
+    assert manifest["blocks"][blocks[1]["key"]] == {"label": "Scenario 2",
+                                                    "testCases": [{"summary": "Test Scenario 2", "key": "TEST-2"}]}
+
+def test_manifest_is_saved_and_loaded(output_dir):
+    manifest = _manifest(DESCRIPTION)
+
+    assert load_manifest("PROJ-1") is None
+    save_manifest("PROJ-1", manifest)
+
+    assert load_manifest("PROJ-1") == manifest
+
+def test_manifest_of_another_version_is_ignored(output_dir):
+    manifest = _manifest(DESCRIPTION)
+    assert MANIFEST_VERSION == 1
+    save_manifest("PROJ-1", dict(manifest, version=MANIFEST_VERSION + 1))
+
+    assert load_manifest("PROJ-1") is None
+
+def test_only_added_and_modified_scenarios_are_generated():
+    manifest = _manifest(DESCRIPTION)
+    edited = DESCRIPTION.replace("an error is displayed", "an error message is displayed") \
+        .replace("*Scenario 3*", "*Scenario 4*\nGiven an expired password, a reset is requested.\n\n*Scenario 3*")
+    _, blocks = split_story_blocks(edited)
+
+    unchanged, to_generate, removed = plan_regeneration(manifest, "ctx", blocks)
+
+    assert [block["label"] for block in unchanged] == ["Scenario 1", "Scenario 3"]
+    assert [block["label"] for block in to_generate] == ["Scenario 2", "Scenario 4"]
+    assert removed == ["Scenario 2"]
+
+def test_renumbered_scenario_is_unchanged_and_removed_scenario_is_reported():
+    manifest = _manifest(DESCRIPTION)
+    edited = DESCRIPTION.replace("*Scenario 1*\nGiven a valid password, the dashboard is displayed.\n\n", "") \
+        .replace("*Scenario 2*", "*Scenario 1*").replace("*Scenario 3*", "*Scenario 2*")
+    _, blocks = split_story_blocks(edited)
+
+    unchanged, to_generate, removed = plan_regeneration(manifest, "ctx", blocks)
+
+    assert len(unchanged) == 2 and to_generate == []
+    assert removed == ["Scenario 1"]
+
+def test_duplicate_scenarios_are_tracked_separately():
+    description = "*Scenario 1*\nGiven a valid password, the dashboard is displayed.\n"
+    manifest = _manifest(description)
+    _, blocks = split_story_blocks(description + "\n*Scenario 2*\nGiven a valid password, the dashboard is displayed.\n")
+
+    unchanged, to_generate, removed = plan_regeneration(manifest, "ctx", blocks)
+
+    assert blocks[0]["hash"] == blocks[1]["hash"] and blocks[0]["key"] != blocks[1]["key"]
+    assert [block["label"] for block in unchanged] == ["Scenario 1"]
+    assert [block["label"] for block in to_generate] == ["Scenario 2"]
+    assert removed == []
+
+def test_changed_context_or_missing_manifest_regenerates_every_scenario():
+    manifest = _manifest(DESCRIPTION)
+    _, blocks = split_story_blocks(DESCRIPTION)
+
+    assert plan_regeneration(manifest, "other", blocks) == ([], blocks, [])
+    assert plan_regeneration(None, "ctx", blocks) == ([], blocks, [])
+
+def test_tests_no_longer_tracked_are_reported_as_stale():
+    manifest = _manifest(DESCRIPTION)
+    edited = DESCRIPTION.replace("an error is displayed", "an error message is displayed")
+    _, blocks = split_story_blocks(edited)
+    # Scénario 2 modifié: son nouveau test remplace TEST-2, le scénario 3 garde TEST-3
+    new_manifest = build_manifest("ctx", [(blocks[0], [{"testCase": "Test Scenario 1", "key": "TEST-1"}]),
+                                          (blocks[1], [{"testCase": "Test Scenario 2", "key": "TEST-9"}]),
+                                          (blocks[2], [{"testCase": "Test Scenario 3", "key": "TEST-3"}])])
+
+    assert find_stale_tests(manifest, new_manifest) == ["TEST-2"]
+    assert find_stale_tests(None, new_manifest) == []
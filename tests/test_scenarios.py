@@ -0,0 +1,44 @@
+# Tests de la fusion des test cases générés scénario par scénario
+import dedup
+from scenarios import merge_scenario_test_cases
+
+def _test_case(summary, *steps):
+    return {"summary": summary, "steps": [{"action": action, "result": "Done"} for action in steps]}
+
+def _block(number):
+    return {"label": f"Scenario {number}"}
+
+def test_duplicate_titles_and_steps_are_merged_across_scenarios():
+    merged = merge_scenario_test_cases([
+        (_block(1), [_test_case("Login: TC-01: Valid password", "Type the password"),
+                     _test_case("Login: TC-02: Wrong password", "Type a wrong password")]),
+        (_block(2), [_test_case("Login: TC-01: Valid password", "Type it again"),
+                     _test_case("Login: TC-02: Locked account", "Type a wrong password"),
+                     _test_case("Login: TC-03: Expired password", "Type an expired password")]),
+    ], "Login")
+
+    assert [test_case["summary"] for test_case in merged] == [
+        "Login: TC-01: Valid password", "Login: TC-02: Wrong password", "Login: TC-03: Expired password"
+    ]
+
+def test_shard_numbering_is_replaced_by_a_numbering_over_the_merged_list():
+    merged = merge_scenario_test_cases([
+        (_block(1), [_test_case("Login - Test 1 - Valid password", "Open"), _test_case("Login - 2. Wrong password", "Fail")]),
+        (_block(2), [_test_case("Login - Test 1 - Locked account", "Lock")]),
+    ], "Login")
+
+    assert [test_case["summary"] for test_case in merged] == [
+        "Login - Test 1 - Valid password", "Login - 2. Wrong password", "Login - Test 3 - Locked account"
+    ]
+
+def test_status_codes_are_not_taken_for_numbering():
+    merged = merge_scenario_test_cases([
+        (_block(1), [_test_case("Login: 500 - server error page is shown", "Break the server")]),
+        (_block(2), [_test_case("Login: 404 - not found page is shown", "Open a missing page")]),
+    ], "Login")
+
+    assert [test_case["summary"] for test_case in merged] == [
+        "Login: 500 - server error page is shown", "Login: 404 - not found page is shown"
+    ]
+    assert dedup.test_case_text(_test_case("500 - server error page is shown")).startswith("500 - server error")
+    assert dedup.test_case_text(_test_case("TC 7: server error page is shown")).startswith("server error")
@@ -0,0 +1,122 @@
+# Tests du script de validation et de compilation de la base de connaissances
+import json
+import os
+import sys
+
+import pytest
+
+from config import settings
+from knowledge_base import kb_pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import sync_knowledge_base
+
+def _content(domain):
+    return {"domain": domain, "description": f"{domain} tests", "keywords": [domain.lower()],
+            "sample_tests": [{"summary": f"Check {domain}", "description": "",
+                              "steps": [{"action": "Open", "data": "", "result": "Shown"}]}]}
+
+@pytest.fixture
+def knowledge_base_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "kb"
+    directory.mkdir()
+    for domain in ("Login", "Reports", "Billing"):
+        _write(str(directory), f"{domain.lower()}.json", _content(domain))
+    monkeypatch.setitem(settings.generator, "knowledgeBaseDir", str(directory))
+    monkeypatch.setitem(settings.knowledge_base, "indexRefreshInterval", 0)
+    yield str(directory)
+    kb_pack.close_knowledge_base_packs(kb_pack.get_pack_path(str(directory)))
+
+def _write(directory, name, content):
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+        json.dump(content, f)
+
+@pytest.fixture
+def validated(monkeypatch):
+    """Names of the files validated in this process"""
+    names = []
+    validate_file = sync_knowledge_base._validate_file
+
+    def _validate_file(file_path):
+        names.append(os.path.basename(file_path))
+        return validate_file(file_path)
+
+    monkeypatch.setattr(sync_knowledge_base, "_validate_file", _validate_file)
+    return names
+
+def test_unchanged_files_are_not_validated_again(knowledge_base_dir, validated):
+    first = sync_knowledge_base.validate_knowledge_base(knowledge_base_dir, max_workers=1)
+    assert sorted(validated) == ["billing.json", "login.json", "reports.json"]
+    assert all(result["valid"] and not result["cached"] for result in first.values())
+
+    # Date changée sans changement de contenu: le hash évite la validation
+    path = os.path.join(knowledge_base_dir, "login.json")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    content = _content("Reports")
+    content["keywords"] = []
+    _write(knowledge_base_dir, "reports.json", content)
+    validated.clear()
+
+    second = sync_knowledge_base.validate_knowledge_base(knowledge_base_dir, max_workers=1)
+
+    assert validated == ["reports.json"]
+    assert second["login.json"]["cached"] and second["billing.json"]["cached"]
+    assert second["reports.json"] == dict(second["reports.json"], valid=False, cached=False,
+                                          warnings=["keywords must be a non-empty array"])
+    # Un fichier invalide inchangé garde son résultat
+    assert not sync_knowledge_base.validate_knowledge_base(knowledge_base_dir, max_workers=1)["reports.json"]["valid"]
+
+def test_force_validates_every_file_again(knowledge_base_dir, validated):
+    sync_knowledge_base.validate_knowledge_base(knowledge_base_dir, max_workers=1)
+    validated.clear()
+
+    results = sync_knowledge_base.validate_knowledge_base(knowledge_base_dir, force=True, max_workers=1)
+
+    assert sorted(validated) == ["billing.json", "login.json", "reports.json"]
+    assert not any(result["cached"] for result in results.values())
+
+def test_changed_files_are_validated_in_a_process_pool(knowledge_base_dir):
+    _write(knowledge_base_dir, "broken.json", {"domain": "Broken"})
+    with open(os.path.join(knowledge_base_dir, "truncated.json"), 'w', encoding='utf-8') as f:
+        f.write('{"domain": ')
+
+    results = sync_knowledge_base.validate_knowledge_base(knowledge_base_dir, max_workers=2)
+
+    assert sorted(name for name, result in results.items() if result["valid"]) == ["billing.json", "login.json", "reports.json"]
+    assert "Missing required field: description" in results["broken.json"]["warnings"]
+    assert results["truncated.json"]["warnings"][0].startswith("Invalid JSON format")
+    assert sync_knowledge_base.load_validation_state(knowledge_base_dir)["broken.json"]["valid"] is False
+
+def _run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["sync_knowledge_base.py", "--workers", "1", *args])
+    return sync_knowledge_base.main()
+
+def test_valid_knowledge_base_exits_with_zero(knowledge_base_dir, monkeypatch, capsys):
+    assert _run(monkeypatch) == 0
+    assert "Compiled knowledge base pack" in capsys.readouterr().out
+
+    assert _run(monkeypatch, "--json") == 0
+    output = json.loads(capsys.readouterr().out)
+    assert (output["valid"], output["invalid"], output["pack"]["compiled"]) == (3, 0, False)
+
+def test_invalid_files_fail_the_run_and_stay_out_of_the_pack(knowledge_base_dir, monkeypatch, capsys):
+    _write(knowledge_base_dir, "broken.json", {"domain": "Broken", "keywords": ["broken"]})
+
+    assert _run(monkeypatch) == 1
+    assert "Left out of the pack until fixed: broken.json" in capsys.readouterr().out
+    pack = kb_pack.get_knowledge_base_pack(knowledge_base_dir)
+    assert pack is not None
+    assert sorted(pack.domain(number)["name"] for number in range(pack.header["counts"]["files"])) == \
+        ["billing.json", "login.json", "reports.json"]
+
+    assert _run(monkeypatch, "--json") == 1
+    output = json.loads(capsys.readouterr().out)
+    assert (output["invalid"], output["pack"]["excluded"], output["pack"]["compiled"]) == (1, ["broken.json"], False)
+
+    # Corrigé: le fichier entre dans le pack et le script réussit
+    _write(knowledge_base_dir, "broken.json", _content("Broken"))
+    assert _run(monkeypatch, "--json") == 0
+    output = json.loads(capsys.readouterr().out)
+    assert (output["invalid"], output["pack"]["excluded"], output["pack"]["compiled"]) == (0, [], True)
+    assert kb_pack.get_knowledge_base_pack(knowledge_base_dir).header["counts"]["files"] == 4
@@ -0,0 +1,72 @@
+# Tests du budget de tokens des prompts
+import pytest
+
+from config import settings
+from knowledge_base.prompt_enhancer import estimate_tokens
+from token_budget import TRUNCATION_MARKER, allocate_prompt_budget, output_token_budget, trim_text_to_tokens
+
+# 101 tokens estimés chacun
+INSTRUCTIONS = "i" * 400
+DESCRIPTION = "d" * 400
+
+@pytest.fixture(autouse=True)
+def budget_settings(monkeypatch):
+    monkeypatch.setitem(settings.knowledge_base, "contextTokenBudget", 1500)
+    monkeypatch.setitem(settings.knowledge_base, "use_knowledge_base", True)
+    monkeypatch.setitem(settings.claude, "minKnowledgeBaseTokens", 200)
+    monkeypatch.setitem(settings.claude, "truncateStory", True)
+
+def test_short_text_is_not_trimmed():
+    assert trim_text_to_tokens("A short description", 100) == "A short description"
+
+def test_long_text_is_cut_at_a_line_break():
+    trimmed = trim_text_to_tokens("line one\n" * 50, 20)
+
+    assert trimmed == "line one\nline one" + TRUNCATION_MARKER
+    assert estimate_tokens(trimmed) <= 20
+
+def test_text_without_line_break_is_cut_at_the_budget():
+    assert trim_text_to_tokens("x" * 200, 20) == "x" * 20 + TRUNCATION_MARKER
+
+def test_knowledge_base_gets_its_full_budget_when_the_prompt_fits(monkeypatch):
+    monkeypatch.setitem(settings.claude, "inputTokenBudget", 30000)
+
+    budget = allocate_prompt_budget(INSTRUCTIONS, "S", DESCRIPTION)
+
+    assert (budget["instructions"], budget["story"], budget["knowledgeBase"]) == (101, 102, 1500)
+    assert budget["description"] == DESCRIPTION
+    assert budget["actions"] == []
+
+def test_knowledge_base_gets_what_remains_of_the_input_budget(monkeypatch):
+    monkeypatch.setitem(settings.claude, "inputTokenBudget", 703)
+
+    budget = allocate_prompt_budget(INSTRUCTIONS, "S", DESCRIPTION)
+
+    assert budget["knowledgeBase"] == 500
+    assert budget["actions"] == ["knowledge base budget reduced to ~500 tokens"]
+
+def test_knowledge_base_is_dropped_below_its_minimum(monkeypatch):
+    monkeypatch.setitem(settings.claude, "inputTokenBudget", 303)
+
+    budget = allocate_prompt_budget(INSTRUCTIONS, "S", DESCRIPTION)
+
+    assert budget["knowledgeBase"] == 0
+    assert budget["actions"] == ["knowledge base context dropped"]
+
+def test_story_too_large_for_the_budget_has_its_description_shortened(monkeypatch):
+    monkeypatch.setitem(settings.claude, "inputTokenBudget", 150)
+
+    budget = allocate_prompt_budget(INSTRUCTIONS, "S", DESCRIPTION)
+
+    assert budget["description"].endswith(TRUNCATION_MARKER)
+    assert estimate_tokens(budget["description"]) <= 48
+    assert budget["instructions"] + budget["story"] <= 150
+    assert budget["actions"] == ["description truncated to ~48 tokens", "knowledge base context dropped"]
+
+def test_output_budget_is_reduced_to_the_room_left_in_the_context_window(monkeypatch):
+    monkeypatch.setitem(settings.claude, "maxTokens", 8000)
+    monkeypatch.setitem(settings.claude, "contextWindow", 200000)
+
+    assert output_token_budget(1000) == 8000
+    assert output_token_budget(195000) == 5000
+    assert output_token_budget(250000) == 1
@@ -0,0 +1,180 @@
+# Tests de la mise à jour des tests Xray existants d'une story
+import pytest
+
+from config import settings
+import generator
+import upsert
+import xray_mirror
+from regeneration import build_manifest, load_manifest, save_manifest
+from scenarios import split_story_blocks, story_context_hash
+from upsert import StoryTestUpserter, diff_test_case, has_changes
+
+def _step(action, result, step_id=None):
+    step = {"action": action, "data": "", "result": result}
+    if step_id is not None:
+        step["id"] = step_id
+    return step
+
+LOGIN_STEPS = [("Open the login page", "The login form is displayed"),
+               ("Enter a valid password", "The password is masked"),
+               ("Submit the form", "The dashboard is displayed")]
+EXPORT_STEPS = [("Open the report list", "Every report is listed"),
+                ("Select the monthly report", "The report preview opens"),
+                ("Export it as CSV", "A CSV file is downloaded")]
+
+def _existing(key, summary, steps, issue_id="10001"):
+    return {"key": key, "issueId": issue_id, "summary": summary, "description": "",
+            "steps": [_step(action, result, f"{key}-s{i}") for i, (action, result) in enumerate(steps)]}
+
+def _test_case(summary, steps):
+    return {"summary": summary, "description": "", "steps": [_step(action, result) for action, result in steps]}
+
+class FakeXray:
+    """Stand-in for the Jira and Xray calls of the upserter"""
+
+    def __init__(self):
+        self.field_updates = []
+        self.step_updates = []
+        self.refreshed = {}
+
+    def update_fields(self, key, fields):
+        self.field_updates.append((key, fields))
+
+    def update_steps(self, issue_id, updated_steps, added_steps, removed_step_ids):
+        self.step_updates.append((issue_id, updated_steps, added_steps, removed_step_ids))
+        return {f"add{i}": {"id": f"new{i}"} for i in range(len(added_steps))}
+
+    def refresh(self, test_keys):
+        xray_mirror.store_mirror_tests([self.refreshed[key] for key in test_keys if key in self.refreshed])
+        return {key: self.refreshed[key] for key in test_keys if key in self.refreshed}
+
+@pytest.fixture
+def xray(monkeypatch):
+    fake = FakeXray()
+    monkeypatch.setattr(upsert, "ensure_mirror_fresh", lambda: True)
+    monkeypatch.setattr(upsert, "update_jira_issue_fields", fake.update_fields)
+    monkeypatch.setattr(upsert, "update_test_steps", fake.update_steps)
+    monkeypatch.setattr(upsert, "refresh_mirrored_tests", fake.refresh)
+    return fake
+
+def test_diff_reports_changed_fields_and_updated_added_and_removed_steps():
+    existing = {"summary": "Login", "description": "Same", "steps": [
+        _step("Open", "Shown", "s1"), _step("Type", "Typed", "s2"), _step("Leave", "Gone", "s3")]}
+
+    changes = diff_test_case({"summary": "Login again", "description": "Same",
+                              "steps": [_step("Open", "Shown"), _step("Type the password", "Typed")]}, existing)
+
+    assert changes["fields"] == {"summary": "Login again"}
+    assert changes["updatedSteps"] == [("s2", {"action": "Type the password", "data": "", "result": "Typed"})]
+    assert changes["addedSteps"] == []
+    assert changes["removedStepIds"] == ["s3"]
+
+    longer = diff_test_case({"summary": "Login", "description": "Same", "steps": [
+        _step("Open", "Shown"), _step("Type", "Typed"), _step("Leave", "Gone"), _step("Return", "Back")]}, existing)
+    assert longer["addedSteps"] == [{"action": "Return", "data": "", "result": "Back"}]
+    assert not longer["fields"] and not longer["updatedSteps"] and not longer["removedStepIds"]
+
+def test_identical_test_case_has_no_changes():
+    existing = _existing("TEST-1", "Login", LOGIN_STEPS)
+
+    assert not has_changes(diff_test_case(_test_case("Login", LOGIN_STEPS), existing))
+
+def test_an_existing_test_is_matched_only_once(xray):
+    xray_mirror.record_story_tests([_existing("TEST-1", "Login with a valid password", LOGIN_STEPS)], "PROJ-1")
+    upserter = StoryTestUpserter("PROJ-1")
+
+    first = upserter.match(_test_case("Login with a valid password", LOGIN_STEPS))
+
+    assert first is not None and first[0]["key"] == "TEST-1" and first[1] == pytest.approx(1.0)
+    assert upserter.match(_test_case("Login with a valid password", LOGIN_STEPS)) is None
+    assert upserter.unmatched_tests() == []
+
+def test_match_respects_the_similarity_threshold(xray, monkeypatch):
+    xray_mirror.record_story_tests([_existing("TEST-1", "Login with a valid password", LOGIN_STEPS),
+                                    _existing("TEST-2", "Export the monthly report", EXPORT_STEPS)], "PROJ-1")
+    upserter = StoryTestUpserter("PROJ-1")
+
+    assert upserter.match(_test_case("Delete an archived invoice", [("Open the archive", "Invoices listed")])) is None
+    matched = upserter.match(_test_case("Export the monthly report as CSV", EXPORT_STEPS))
+    assert matched[0]["key"] == "TEST-2"
+
+    monkeypatch.setitem(settings.xray, "upsertThreshold", 1.01)
+    strict = StoryTestUpserter("PROJ-1")
+    assert strict.match(_test_case("Login with a valid password", LOGIN_STEPS)) is None
+    assert strict.unmatched_tests() == ["TEST-1", "TEST-2"]
+
+def test_apply_reads_the_step_ids_again_when_the_mirror_has_none(xray):
+    created = _test_case("Login with a valid password", LOGIN_STEPS)
+    # Test créé par ce run: le miroir ne connaît ni son issueId ni ses identifiants d'étapes
+    xray_mirror.record_story_tests([dict(created, key="TEST-1")], "PROJ-1")
+    xray.refreshed["TEST-1"] = _existing("TEST-1", "Login with a valid password", LOGIN_STEPS, issue_id="20001")
+    upserter = StoryTestUpserter("PROJ-1")
+
+    result = {}
+    changed = LOGIN_STEPS[:2] + [("Submit the form", "The home page is displayed")]
+    assert upserter.apply(_test_case("Login with a valid password", changed), result)
+
+    assert result == {"key": "TEST-1", "success": True, "updated": True}
+    assert xray.step_updates == [("20001", [("TEST-1-s2", {"action": "Submit the form", "data": "",
+                                                           "result": "The home page is displayed"})], [], [])]
+
+def test_apply_keeps_the_mirror_up_to_date(xray):
+    xray_mirror.record_story_tests([_existing("TEST-1", "Login with a valid password", LOGIN_STEPS)], "PROJ-1")
+    upserter = StoryTestUpserter("PROJ-1")
+
+    result = {}
+    steps = [LOGIN_STEPS[0], ("Enter a valid password", "The password is hidden"), LOGIN_STEPS[2],
+             ("Log out", "The login page is displayed")]
+    assert upserter.apply(_test_case("Login with a valid password and log out", steps), result)
+
+    assert xray.field_updates == [("TEST-1", {"summary": "Login with a valid password and log out"})]
+    mirrored = xray_mirror.get_mirrored_test("TEST-1")
+    assert mirrored["summary"] == "Login with a valid password and log out"
+    assert mirrored["steps"] == [_step("Open the login page", "The login form is displayed", "TEST-1-s0"),
+                                 _step("Enter a valid password", "The password is hidden", "TEST-1-s1"),
+                                 _step("Submit the form", "The dashboard is displayed", "TEST-1-s2"),
+                                 _step("Log out", "The login page is displayed", "new0")]
+    assert [test["key"] for test in xray_mirror.get_story_tests("PROJ-1")] == ["TEST-1"]
+    assert upserter.report[0]["changes"] == ["summary", "steps (1 modified, 1 added, 0 removed)"]
+
+def test_incremental_upsert_never_updates_the_tests_of_unchanged_scenarios(xray, monkeypatch):
+    description = ("As a user I want to log in.\n\n*Scenario 1*\nGiven a valid password, the dashboard is shown.\n\n"
+                   "*Scenario 2*\nGiven an export request, a CSV file is downloaded.\n")
+    story = {"key": "PROJ-1", "fields": {"summary": "Login", "description": description}}
+    context, blocks = split_story_blocks(description)
+    save_manifest("PROJ-1", build_manifest(story_context_hash(story, context), [
+        (blocks[0], [{"testCase": "Login with a valid password", "key": "TEST-1"}]),
+        (blocks[1], [{"testCase": "Export the monthly report", "key": "TEST-2"}])]))
+    xray_mirror.record_story_tests([_existing("TEST-1", "Login with a valid password", LOGIN_STEPS),
+                                    _existing("TEST-2", "Export the monthly report", EXPORT_STEPS, "10002")], "PROJ-1")
+
+    # Scénario 2 modifié et scénario 3 ajouté, dont le test ressemble à celui du scénario 1 inchangé
+    story["fields"]["description"] = description.replace("a CSV file", "a CSV or PDF file") + \
+        "\n*Scenario 3*\nGiven a valid password and a remembered device, the dashboard is shown.\n"
+
+    def analyze_with_claude(scenario_story, allow_fallback=True):
+        text = scenario_story["fields"]["description"]
+        if "remembered device" in text:
+            return [_test_case("Login with a valid password on a remembered device", LOGIN_STEPS)]
+        return [_test_case("Export the monthly report as PDF", EXPORT_STEPS)]
+
+    created = []
+
+    def bulk_import_test_cases(test_cases, user_story_key):
+        created.extend(test_case["summary"] for test_case in test_cases)
+        return {"testKeys": ["TEST-3"], "importedTests": ["TEST-3"], "errors": [], "success": True}
+
+    monkeypatch.setitem(settings.xray, "upsert", True)
+    monkeypatch.setitem(settings.xray, "use_bulk_import", True)
+    monkeypatch.setitem(settings.dedup, "enabled", True)
+    monkeypatch.setattr(generator, "analyze_with_claude", analyze_with_claude)
+    monkeypatch.setattr(generator, "bulk_import_test_cases", bulk_import_test_cases)
+
+    result = generator.generate_test_cases_incremental("PROJ-1", story)
+
+    assert created == ["Login with a valid password on a remembered device"]
+    assert [update[0] for update in xray.field_updates] == ["TEST-2"]
+    assert all(step_update[0] == "10002" for step_update in xray.step_updates)
+    assert result["unchangedScenarios"] == 1
+    manifest_keys = [tc["key"] for entry in load_manifest("PROJ-1")["blocks"].values() for tc in entry["testCases"]]
+    assert sorted(manifest_keys) == ["TEST-1", "TEST-2", "TEST-3"]
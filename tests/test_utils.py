@@ -0,0 +1,54 @@
+# Tests des reprises du client HTTP partagé
+import socket
+import threading
+
+import pytest
+import requests
+
+from config import settings
+import utils
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setitem(settings.http, "maxRetries", 2)
+    monkeypatch.setitem(settings.http, "backoffFactor", 0.001)
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def test_post_is_retried_when_the_connection_is_refused():
+    host = f"127.0.0.1:{_closed_port()}"
+
+    with pytest.raises(requests.ConnectionError) as error:
+        utils.send_request('POST', f"http://{host}/import", json={})
+
+    assert utils.is_connection_not_established(error.value)
+    assert utils.get_pool_stats()[host]["retries"] == 2
+
+def test_post_is_not_retried_once_the_server_received_it():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    received = []
+
+    def accept():
+        # Lire la requête puis fermer la connexion sans répondre
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            received.append(connection.recv(65536))
+            connection.close()
+
+    threading.Thread(target=accept, daemon=True).start()
+    try:
+        with pytest.raises(requests.ConnectionError) as error:
+            utils.send_request('POST', f"http://127.0.0.1:{server.getsockname()[1]}/import", json={})
+    finally:
+        server.close()
+
+    assert not utils.is_connection_not_established(error.value)
+    assert len(received) == 1
@@ -0,0 +1,133 @@
+# Tests du token d'authentification Xray partagé entre threads
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+from config import settings
+import xray_client
+from xray_client import get_cached_xray_auth_token, get_xray_auth_token, invalidate_xray_auth_token, xray_request
+
+AUTH_URL = "https://xray.cloud.getxray.app/api/v2/authenticate"
+
+def _jwt(expires_in, subject="client"):
+    def encode(value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii').rstrip('=')
+    return f"{encode({'alg': 'HS256'})}.{encode({'sub': subject, 'exp': int(time.time()) + expires_in})}.signature"
+
+class FakeResponse:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+class FakeXray:
+    """Stand-in for the Xray authentication endpoint and API"""
+
+    def __init__(self, tokens, rejected=()):
+        self.tokens = list(tokens)
+        self.rejected = set(rejected)
+        self.authentications = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def send_request(self, method, url, headers=None, **kwargs):
+        if url == AUTH_URL:
+            # Authentification lente: les autres threads ont le temps d'arriver
+            time.sleep(0.05)
+            with self.lock:
+                self.authentications += 1
+                return FakeResponse(200, f'"{self.tokens.pop(0)}"')
+        token = headers["Authorization"][len("Bearer "):]
+        self.requests.append(token)
+        return FakeResponse(401 if token in self.rejected else 200, "{}")
+
+@pytest.fixture
+def xray(monkeypatch):
+    monkeypatch.setitem(xray_client._token_cache, "token", None)
+    monkeypatch.setitem(xray_client._token_cache, "expiresAt", 0.0)
+    monkeypatch.setitem(settings.xray, "tokenRefreshMargin", 300)
+
+    def install(tokens, rejected=()):
+        fake = FakeXray(tokens, rejected)
+        monkeypatch.setattr(xray_client, "send_request", fake.send_request)
+        return fake
+    return install
+
+def test_token_is_cached_until_its_jwt_expiry_minus_the_margin(xray):
+    token = _jwt(3600)
+    fake = xray([token, _jwt(3600, "second")])
+
+    assert get_xray_auth_token() == token
+    assert get_xray_auth_token() == token
+    assert fake.authentications == 1
+    assert xray_client._token_cache["expiresAt"] == pytest.approx(time.time() + 3600, abs=2)
+
+def test_token_expiring_within_the_margin_is_renewed(xray):
+    expiring = _jwt(200)
+    renewed = _jwt(3600, "second")
+    fake = xray([expiring, renewed])
+
+    assert get_xray_auth_token() == expiring
+    assert get_cached_xray_auth_token() is None
+    assert get_xray_auth_token() == renewed
+    assert fake.authentications == 2
+
+def test_opaque_token_uses_the_configured_lifetime(xray, monkeypatch):
+    monkeypatch.setitem(settings.xray, "tokenLifetime", 1800)
+    xray(["opaque-token"])
+
+    assert get_xray_auth_token() == "opaque-token"
+    assert xray_client._token_cache["expiresAt"] == pytest.approx(time.time() + 1800, abs=2)
+
+def test_concurrent_threads_authenticate_once(xray):
+    token = _jwt(3600)
+    fake = xray([token])
+    tokens = []
+
+    threads = [threading.Thread(target=lambda: tokens.append(get_xray_auth_token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == [token] * 8
+    assert fake.authentications == 1
+
+def test_rejected_token_is_renewed_and_the_request_sent_again_once(xray):
+    rejected = _jwt(3600, "revoked")
+    renewed = _jwt(3600, "second")
+    fake = xray([rejected, renewed], rejected={rejected})
+
+    response = xray_request('GET', "https://xray.cloud.getxray.app/api/v2/tests")
+
+    assert response.status_code == 200
+    assert fake.requests == [rejected, renewed]
+    assert fake.authentications == 2
+    assert get_cached_xray_auth_token() == renewed
+
+def test_a_second_rejection_is_returned_without_retrying_again(xray):
+    first, second = _jwt(3600, "first"), _jwt(3600, "second")
+    fake = xray([first, second, _jwt(3600, "third")], rejected={first, second})
+
+    response = xray_request('GET', "https://xray.cloud.getxray.app/api/v2/tests")
+
+    assert response.status_code == 401
+    assert fake.requests == [first, second]
+
+def test_invalidating_a_stale_token_keeps_the_renewed_one(xray):
+    stale, renewed = _jwt(3600, "stale"), _jwt(3600, "renewed")
+    xray([stale, renewed])
+    get_xray_auth_token()
+    # Un autre thread a déjà renouvelé le token refusé
+    invalidate_xray_auth_token(stale)
+    get_xray_auth_token()
+
+    invalidate_xray_auth_token(stale)
+
+    assert get_cached_xray_auth_token() == renewed
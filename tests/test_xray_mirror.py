@@ -0,0 +1,69 @@
+# Tests du miroir SQLite des tests Xray
+from datetime import datetime, timedelta
+
+from config import settings
+import xray_mirror
+
+def _result(key, updated, story_key="PROJ-1"):
+    return {"issueId": key.split('-')[1], "steps": [{"id": f"s{key}", "action": "Open", "data": "", "result": "Shown"}],
+            "jira": {"key": key, "summary": f"Test {key}", "description": "", "updated": updated,
+                     "issuelinks": [{"type": {"name": "Test"}, "outwardIssue": {"key": story_key}}]}}
+
+def test_incremental_query_uses_a_relative_date():
+    since = (datetime.now() - timedelta(minutes=30, seconds=10)).isoformat()
+
+    jql = xray_mirror.build_mirror_jql("TEST", since)
+
+    # 30 minutes écoulées, arrondies au-dessus, plus le recouvrement de 60 minutes
+    assert jql == 'project = "TEST" AND updated >= -91m ORDER BY updated ASC'
+    assert xray_mirror.build_mirror_jql("TEST") == 'project = "TEST" ORDER BY updated ASC'
+
+def test_sync_fetches_only_the_tests_updated_since_the_last_synchronization(monkeypatch):
+    queries = []
+    pages = [[_result("TEST-1", "2024-05-01T10:00:00.000+0200"), _result("TEST-2", "2024-05-01T11:00:00.000+0200")],
+             [_result("TEST-2", "2024-05-02T09:00:00.000-0500")]]
+
+    def fetch_tests_page(jql, start, limit):
+        queries.append(jql)
+        results = pages[len(queries) - 1]
+        return {"total": len(results), "start": start, "results": results}
+
+    monkeypatch.setattr(xray_mirror, "fetch_tests_page", fetch_tests_page)
+
+    assert xray_mirror.sync_xray_mirror(project_key="TEST")["total"] == 2
+    assert xray_mirror.sync_xray_mirror(project_key="TEST")["lastUpdated"] == "2024-05-02T09:00:00.000-0500"
+
+    assert queries[0] == 'project = "TEST" ORDER BY updated ASC'
+    assert queries[1].startswith('project = "TEST" AND updated >= -61m')
+    assert [test["key"] for test in xray_mirror.get_story_tests("PROJ-1")] == ["TEST-1", "TEST-2"]
+    assert xray_mirror.get_mirrored_test("TEST-2")["updated"] == "2024-05-02T09:00:00.000-0500"
+
+def _test(key, summary, links):
+    return {"key": key, "issueId": key.split('-')[1], "summary": summary, "description": "", "updated": None,
+            "steps": [], "links": links}
+
+def test_tests_are_found_by_summary_ignoring_case_and_punctuation():
+    xray_mirror.store_mirror_tests([_test("TEST-1", "Login: valid password!", []),
+                                    _test("TEST-2", "login   valid-password", []),
+                                    _test("TEST-3", "Login with an invalid password", [])])
+
+    assert [test["key"] for test in xray_mirror.find_tests_by_summary("LOGIN - Valid password")] == ["TEST-1", "TEST-2"]
+    assert xray_mirror.find_tests_by_summary("Logout") == []
+
+def test_stories_with_tests_count_only_the_story_links(monkeypatch):
+    monkeypatch.setitem(settings.xray_mirror, "storyLinkType", "Test")
+    xray_mirror.store_mirror_tests([_test("TEST-1", "A", [("PROJ-1", "Test")]),
+                                    _test("TEST-2", "B", [("PROJ-1", "Test"), ("PROJ-2", "Test")]),
+                                    _test("TEST-3", "C", [("PROJ-3", "Relates")])])
+
+    assert xray_mirror.get_stories_with_tests() == {"PROJ-1": 2, "PROJ-2": 1}
+    assert xray_mirror.get_stories_with_tests(["PROJ-2", "PROJ-3", "PROJ-4"]) == {"PROJ-2": 1}
+    assert xray_mirror.get_stories_with_tests([]) == {}
+
+def test_stories_with_tests_handles_more_keys_than_one_query_allows():
+    xray_mirror.store_mirror_tests([_test(f"TEST-{number}", f"Test {number}", [(f"PROJ-{number}", "Test")])
+                                    for number in range(1, 1201, 100)])
+
+    counts = xray_mirror.get_stories_with_tests([f"PROJ-{number}" for number in range(1, 1201)])
+
+    assert counts == {f"PROJ-{number}": 1 for number in range(1, 1201, 100)}